@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     #
     'rest_framework',
     'django_filters',
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.profiling.RequestProfilingMiddleware',  # Only active with REQUEST_PROFILING
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,6 +92,26 @@ DATABASES = {
     }
 }
 
+# Caches, local to the host: no external service needed.
+# template_fragments holds rendered item cards (inventory.services.fragments);
+# set FRAGMENT_CACHE_DIR to share it between worker processes through files.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+if os.environ.get('FRAGMENT_CACHE_DIR'):
+    CACHES['template_fragments'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['FRAGMENT_CACHE_DIR'],
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -140,13 +162,18 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'inventory.renderers.ORJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',  # This gives you the nice API interface
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'inventory.renderers.ORJSONParser',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'inventory.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
+# API_PROFILE=production serves JSON only, without the browsable API
+if os.environ.get('API_PROFILE') == 'production':
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = ['inventory.renderers.ORJSONRenderer']
 
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = '/static/'
@@ -154,4 +181,30 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 # Media files configuration
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Media is sent by Django (django), or after Django checked access by the
+# front web server: x-accel-redirect for nginx, serving MEDIA_ACCEL_PREFIX as
+# an internal location aliased to MEDIA_ROOT, x-sendfile for Apache/lighttpd
+MEDIA_SERVING = os.environ.get('MEDIA_SERVING', 'django')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Only logged in users may download media files
+MEDIA_LOGIN_REQUIRED = os.environ.get('MEDIA_LOGIN_REQUIRED') == 'true'
+# Chunked attachment uploads (/api/uploads/, inventory.services.uploads):
+# largest file and chunk accepted, and whether uploaded images are described
+# by the vision model once thumbnailed
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 1024 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+UPLOAD_ANALYZE_IMAGES = os.environ.get('UPLOAD_ANALYZE_IMAGES', 'true') == 'true'
+# Per-request SQL, template and AI call timings (inventory.profiling): Server-Timing
+# headers, a JSON log line per request (WARNING from REQUEST_PROFILING_SLOW_MS on)
+# and the slowest endpoints at /profiling/ for staff
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING') == 'true'
+REQUEST_PROFILING_SLOW_MS = int(os.environ.get('REQUEST_PROFILING_SLOW_MS', 500))
+# Prometheus metrics (inventory.metrics): /metrics needs this bearer token if set;
+# management commands write <METRICS_TEXTFILE_DIR>/<command>.prom for the
+# node_exporter textfile collector and/or push to a Pushgateway on exit.
+# Under a multi-worker server, set PROMETHEUS_MULTIPROC_DIR in its environment
+# (read by prometheus_client) so /metrics sums the metrics of every worker
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_TEXTFILE_DIR = os.environ.get('METRICS_TEXTFILE_DIR', '')
+METRICS_PUSHGATEWAY_URL = os.environ.get('METRICS_PUSHGATEWAY_URL', '')
\ No newline at end of file
@@ -17,8 +17,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from inventory.views import metrics_endpoint, serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,4 +26,8 @@ urlpatterns = [
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('', include(('inventory.frontend_urls', 'inventory'), namespace='inventory')),  
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Attachments and thumbnails, access checked by Django, see inventory.services.media
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", serve_media, name='media'),
+    # Prometheus scrape target, see inventory.metrics
+    path('metrics', metrics_endpoint, name='metrics'),
+]
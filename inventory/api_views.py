@@ -4,29 +4,118 @@ API viewsets for the inventory application.
 Provides REST endpoints for all models.
 """
 
+import re
+
+from inventory.services import labels as label_service, uploads
+from inventory.services.export import EXPORT_FORMATS, export_chunks
+from inventory.services.search import search
 from inventory.services.text import TextService
-from rest_framework import viewsets, status
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.shortcuts import render
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.db import transaction
-from django.db.models import Count
+from django.db.models import Count, Prefetch
 
-from .models import Item, QRCode, Label, Email, Attachment, ListingLBC
+from .conditional import email_validators, item_validators, not_modified, set_validators
+from .filters import SearchVectorFilter
+from .models import Item, QRCode, Label, Email, Attachment, ListingLBC, Upload, related_count
 from .serializers import (
     ItemSerializer, QRCodeSerializer, LabelSerializer,
-    EmailSerializer, AttachmentSerializer, ListingLBCSerializer
+    EmailSerializer, AttachmentSerializer, ListingLBCSerializer, ListingBatchSerializer,
+    ItemListSerializer, EmailListSerializer, AttachmentListSerializer,
+    UploadSerializer, query_param_list
 )
 
-class ItemViewSet(viewsets.ModelViewSet):
+# Content-Range of an upload chunk: bytes <first>-<last>/<total>
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+def emails_with_attachment_count():
+    return Email.objects.annotate(attachment_count=related_count(Attachment, 'email'))
+
+class CompactListMixin:
+    """
+    Compact serializer for list responses, the full one for everything else.
+
+    Lists only prefetch what `?expand=` asks for, in a fixed number of
+    queries per page whatever its size.
+    """
+    list_serializer_class = None
+    # ?expand= name -> prefetch_related lookups
+    expand_prefetches = {}
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self.list_serializer_class is not None:
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+    def get_list_queryset(self, queryset):
+        return queryset
+
+    def get_detail_queryset(self, queryset):
+        return queryset
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return self.get_detail_queryset(queryset)
+        queryset = self.get_list_queryset(queryset)
+        for name in query_param_list(self.request, 'expand'):
+            queryset = queryset.prefetch_related(*self.expand_prefetches.get(name, ()))
+        return queryset
+
+class ConditionalRetrieveMixin:
+    """
+    Detail responses with ETag and Last-Modified, answered with 304 before
+    serializing while the object is unchanged, see inventory.conditional.
+    """
+    # Function of (pk, *variant) returning the validators of an object
+    conditional_validators = None
+
+    def retrieve(self, request, *args, **kwargs):
+        # Representations differ by renderer and by ?fields= / ?expand=
+        variant = (request.accepted_renderer.format, request.query_params.urlencode())
+        validators = self.conditional_validators(self.kwargs[self.lookup_field], *variant)
+        response = not_modified(request, validators) or super().retrieve(request, *args, **kwargs)
+        return set_validators(response, validators, vary=('Accept',))
+
+class ItemViewSet(ConditionalRetrieveMixin, CompactListMixin, viewsets.ModelViewSet):
     """API endpoint for Item operations."""
-    queryset = Item.objects.prefetch_related('qr_codes', 'labels', 'emails', 'attachments')
+    queryset = Item.objects.all()
     serializer_class = ItemSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    search_fields = ['description', 'labels__name']
+    list_serializer_class = ItemListSerializer
+    conditional_validators = staticmethod(item_validators)
+    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchVectorFilter]
+    search_fields = ['description', 'qr_codes__code', 'labels__name', 'ai_aggregated_description',
+                     'emails__subject', 'emails__sender']
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
+    expand_prefetches = {
+        'emails': [Prefetch('emails', queryset=emails_with_attachment_count())],
+        'attachments': ['attachments'],
+    }
+
+    def get_list_queryset(self, queryset):
+        return queryset.annotate(
+            attachment_count=related_count(Attachment),
+            email_count=related_count(Email),
+        ).prefetch_related('qr_codes', 'labels')
+
+    def get_detail_queryset(self, queryset):
+        return queryset.prefetch_related('qr_codes', 'labels', 'emails__attachments', 'attachments')
+
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<export_format>ndjson|csv)', url_name='export')
+    def export(self, request, export_format=None):
+        """Stream the filtered catalogue as NDJSON or CSV, without pagination."""
+        items = self.filter_queryset(Item.objects.all())
+        content_type, _ = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(export_chunks(export_format, items), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="items.{export_format}"'
+        return response
 
     @action(detail=True, methods=['post'])
     def generate_listing(self, request, pk=None):
@@ -111,7 +200,7 @@ class QRCodeViewSet(viewsets.ModelViewSet):
     queryset = QRCode.objects.all()
     serializer_class = QRCodeSerializer
     filter_backends = [SearchFilter]
-    search_fields = ['code']
+    search_fields = ['code']  # icontains, served by the qrcode_code_trgm index
 
 class LabelViewSet(viewsets.ModelViewSet):
     """API endpoint for Label operations."""
@@ -126,18 +215,28 @@ class LabelViewSet(viewsets.ModelViewSet):
             item_count=Count('items')
         ).order_by('name')
 
+    def get_target_items(self):
+        """
+        Items a bulk action applies to: `item_ids`, or `filter` criteria
+        (`search`, `labels`) selecting them in the database.
+        """
+        criteria = self.request.data.get('filter') or {}
+        return label_service.select_items(
+            item_ids=self.request.data.get('item_ids'),
+            search_text=criteria.get('search', ''),
+            label_ids=criteria.get('labels'),
+        )
+
     @action(detail=True, methods=['post'])
     def add_to_items(self, request, pk=None):
-        """Add this label to multiple items."""
+        """Add this label to the items given by id or filter, in one statement."""
         label = self.get_object()
-        item_ids = request.data.get('item_ids', [])
-        
         try:
-            items = Item.objects.filter(id__in=item_ids)
-            label.items.add(*items)
+            item_ids = label_service.add_label(label, self.get_target_items())
             return Response({
-                'message': f'Label added to {len(items)} items',
-                'affected_items': item_ids
+                'message': f'Label added to {len(item_ids)} items',
+                'affected_items': item_ids,
+                'affected_count': len(item_ids)
             })
         except Exception as e:
             return Response(
@@ -147,16 +246,14 @@ class LabelViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def remove_from_items(self, request, pk=None):
-        """Remove this label from multiple items."""
+        """Remove this label from the items given by id or filter, in one statement."""
         label = self.get_object()
-        item_ids = request.data.get('item_ids', [])
-        
         try:
-            items = Item.objects.filter(id__in=item_ids)
-            label.items.remove(*items)
+            item_ids = label_service.remove_label(label, self.get_target_items())
             return Response({
-                'message': f'Label removed from {len(items)} items',
-                'affected_items': item_ids
+                'message': f'Label removed from {len(item_ids)} items',
+                'affected_items': item_ids,
+                'affected_count': len(item_ids)
             })
         except Exception as e:
             return Response(
@@ -166,44 +263,42 @@ class LabelViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'])
     def bulk_create(self, request):
-        """Create multiple labels at once."""
-        names = request.data.get('names', [])
-        created_labels = []
-        errors = []
-        
-        for name in names:
-            try:
-                label, created = Label.objects.get_or_create(name=name)
-                if created:
-                    created_labels.append(label)
-            except Exception as e:
-                errors.append(f"Error creating label '{name}': {str(e)}")
-        
+        """Create multiple labels at once, names that exist already are left as they are."""
+        names, errors = label_service.clean_names(request.data.get('names', []))
+        created_labels, existing_labels = label_service.create_labels(names)
         return Response({
             'created': LabelSerializer(created_labels, many=True).data,
+            'existing': LabelSerializer(existing_labels, many=True).data,
             'errors': errors
         })
 
-class EmailViewSet(viewsets.ModelViewSet):
+class EmailViewSet(ConditionalRetrieveMixin, CompactListMixin, viewsets.ModelViewSet):
     """API endpoint for Email operations."""
-    queryset = Email.objects.prefetch_related('attachments').select_related('item')
+    queryset = Email.objects.all()
     serializer_class = EmailSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    search_fields = ['subject', 'sender', 'email_uid','body']
+    list_serializer_class = EmailListSerializer
+    conditional_validators = staticmethod(email_validators)
+    expand_prefetches = {'attachments': ['attachments']}
+    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchVectorFilter]
+    search_fields = ['subject', 'sender', 'body']
     ordering_fields = ['sent_at', 'created_at']
     ordering = ['-sent_at']
 
-    def get_queryset(self):
+    def get_list_queryset(self, queryset):
+        return queryset.annotate(attachment_count=related_count(Attachment, 'email'))
+
+    def get_detail_queryset(self, queryset):
         """Get emails with related data prefetched."""
-        return super().get_queryset().prefetch_related(
-            'attachments',
-            'item__labels',
-            'item__qr_codes'
-        )
+        return queryset.select_related('item').prefetch_related('attachments')
+
     @action(detail=False, methods=['get'], url_path='search-html', url_name='search-html')
     def search_html(self, request):
-        """Return search results as HTML for HTMX requests."""
-        queryset = self.filter_queryset(self.get_queryset())[:10]
+        """Return full-text search results as HTML for HTMX requests."""
+        queryset = self.get_queryset().order_by('-sent_at')
+        query = request.query_params.get('search', '').strip()
+        if query:
+            queryset = search(queryset, query)
+        queryset = queryset[:10]
         if request.headers.get('HX-Request'):
             return render(
                 request,
@@ -213,12 +308,13 @@ class EmailViewSet(viewsets.ModelViewSet):
         return Response(self.get_serializer(queryset, many=True).data)
 
 
-class AttachmentViewSet(viewsets.ModelViewSet):
+class AttachmentViewSet(CompactListMixin, viewsets.ModelViewSet):
     """API endpoint for Attachment operations."""
     queryset = Attachment.objects.all()
     serializer_class = AttachmentSerializer
+    list_serializer_class = AttachmentListSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter]
-    search_fields = ['filename']
+    search_fields = ['filename']  # icontains, served by the attachment_filename_trgm index
     filterset_fields = ['content_type']
 
 class ListingLBCViewSet(viewsets.ModelViewSet):
@@ -250,3 +346,102 @@ class ListingLBCViewSet(viewsets.ModelViewSet):
             {'error': 'Failed to generate listing'},
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @action(detail=False, methods=['post'])
+    def generate_batch(self, request):
+        """
+        Generate and store listings for items lacking an up to date one.
+        Accepts optional `item_ids`, `limit` and `force`, see ListingBatchSerializer.
+        The calls are made while the request waits, so only a few items are
+        handled per request; the generate_listings command handles the rest.
+        """
+        params = ListingBatchSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+
+        items = Item.objects.all()
+        item_ids = params.validated_data.get('item_ids')
+        if item_ids:
+            items = items.filter(id__in=item_ids)
+
+        from .services.listings import generate_listings
+        result = generate_listings(
+            items,
+            force=params.validated_data['force'],
+            limit=params.validated_data['limit']
+        )
+        return Response({
+            'created': ListingLBCSerializer(result['created'], many=True).data,
+            'failed': [
+                {'item_id': item_id, 'error': error}
+                for item_id, error in result['failed']
+            ]
+        })
+
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Chunked, resumable attachment uploads.
+
+    POST /api/uploads/ declares the file, PUT /api/uploads/{id}/chunk/ sends
+    raw bytes with a Content-Range header, GET /api/uploads/{id}/ tells where
+    to resume, POST /api/uploads/{id}/complete/ creates the attachment.
+    """
+    queryset = Upload.objects.all()
+    serializer_class = UploadSerializer
+
+    def perform_create(self, serializer):
+        filename = serializer.validated_data['filename']
+        serializer.save(content_type=serializer.validated_data.get('content_type')
+                        or uploads.guess_content_type(filename))
+
+    def perform_destroy(self, instance):
+        uploads.abort(instance)
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        """Append the request body at the offset given by Content-Range."""
+        upload = self.get_object()
+        match = CONTENT_RANGE.match(request.headers.get('Content-Range', ''))
+        if not match:
+            return Response(
+                {'error': 'Content-Range: bytes <first>-<last>/<total> is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        first, last = int(match.group(1)), int(match.group(2))
+        if match.group(3) != '*' and int(match.group(3)) != upload.size:
+            return Response(
+                {'error': f'Content-Range total must be the upload size, {upload.size} bytes'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        length = last - first + 1
+        if length > settings.UPLOAD_CHUNK_SIZE:
+            return Response(
+                {'error': f'Chunks are limited to {settings.UPLOAD_CHUNK_SIZE} bytes'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        if request.stream is None:
+            return Response({'error': 'Empty chunk'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            upload = uploads.append_chunk(upload.pk, first, request.stream, length)
+        except uploads.UploadConflict as e:
+            return Response(
+                {'error': str(e), 'received': e.received},
+                status=status.HTTP_409_CONFLICT
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(upload).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Create the attachment, or return the item's attachment with the same content."""
+        upload = self.get_object()
+        try:
+            attachment, created = uploads.complete(upload.pk)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            AttachmentSerializer(attachment, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
@@ -0,0 +1,81 @@
+"""
+Conditional GET for item and email details and attachment downloads.
+Validators are read from a single indexed row: an item's `cache_version`
+and `cache_updated_at`, both bumped by inventory.signals whenever something
+its pages show changes, an email's `updated_at`, touched when its attachments
+change, and an attachment's stored file. A request whose If-None-Match or
+If-Modified-Since matches is answered with 304 before anything is
+serialized or rendered.
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Iterable, NamedTuple, Optional
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from .models import Attachment, Email, Item
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: datetime
+
+def make_etag(*parts) -> str:
+    """Quoted strong ETag digesting `parts`."""
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+def item_validators(pk, *variant) -> Optional[Validators]:
+    """
+    Validators of an item's representations, None if it does not exist.
+
+    Args:
+        variant: What else the representation depends on (template, format...)
+    """
+    try:
+        row = Item.objects.filter(pk=pk).values_list('cache_version', 'cache_updated_at').first()
+    except (ValueError, TypeError):
+        # Not a valid id, left to the view's own 404
+        return None
+    if row is None:
+        return None
+    version, updated_at = row
+    return Validators(make_etag('item', pk, version, updated_at.timestamp(), *variant), updated_at)
+
+def email_validators(pk, *variant) -> Optional[Validators]:
+    """Validators of an email's representations, None if it does not exist."""
+    try:
+        updated_at = Email.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    except (ValueError, TypeError):
+        return None
+    if updated_at is None:
+        return None
+    return Validators(make_etag('email', pk, updated_at.timestamp(), *variant), updated_at)
+
+def attachment_validators(pk) -> Optional[Validators]:
+    """Validators of an attachment's file, a new upload being stored under a new name."""
+    row = Attachment.objects.filter(pk=pk).values_list('file', 'size', 'created_at').first()
+    if row is None:
+        return None
+    name, size, created_at = row
+    return Validators(make_etag('attachment', pk, name, size), created_at)
+
+def not_modified(request, validators: Optional[Validators]):
+    """304 response (412 for failed preconditions) if the client's copy is current, None otherwise."""
+    if validators is None:
+        return None
+    return get_conditional_response(
+        request,
+        etag=validators.etag,
+        last_modified=int(validators.last_modified.timestamp()),
+    )
+
+def set_validators(response, validators: Optional[Validators], vary: Iterable[str] = ()):
+    """Add ETag and Last-Modified to a successful or 304 response."""
+    if validators is not None and response.status_code in (200, 206, 304):
+        response['ETag'] = validators.etag
+        response['Last-Modified'] = http_date(validators.last_modified.timestamp())
+    if vary:
+        patch_vary_headers(response, vary)
+    return response
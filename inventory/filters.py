@@ -0,0 +1,23 @@
+"""
+Filter backends for the inventory API.
+"""
+
+from rest_framework.filters import SearchFilter
+
+from .services.search import search
+
+class SearchVectorFilter(SearchFilter):
+    """
+    `?search=` backed by services.search for models with a `search_vector`.
+
+    Place it after OrderingFilter: results are ordered by rank, then by the
+    requested ordering. The view's `search_fields` list what the search
+    vector is built from, for the browsable API search box and the schema;
+    they are not queried.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = ' '.join(self.get_search_terms(request))
+        if not text:
+            return queryset
+        return search(queryset, text)
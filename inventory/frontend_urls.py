@@ -11,6 +11,7 @@ urlpatterns = [
     path('items/', views.ItemListView.as_view(), name='item_list'),
     path('labels/', views.LabelListView.as_view(), name='label_list'),
     path('attachments/', views.AttachmentListView.as_view(), name='attachment_list'),
+    path('profiling/', views.profiling_summary, name='profiling_summary'),
     path('items/<int:item_id>/generate-listing/', views.generate_listing, name='generate_listing'),
 
     # Add this new route for email search
@@ -23,6 +24,8 @@ urlpatterns = [
     
     # HTMX handlers
     path('image-preview/<int:attachment_id>/', views.image_preview, name='image_preview'),
+    path('attachments/<int:attachment_id>/thumbnail/<slug:size>.<slug:fmt>', views.attachment_thumbnail, name='attachment_thumbnail'),
+    path('attachments/<int:attachment_id>/download/', views.attachment_download, name='attachment_download'),
     path('items/<int:item_id>/quick-create-label/', views.quick_create_label, name='quick_create_label'),
     path('labels/create/', views.create_label, name='create_label'),
     path('labels/<int:label_id>/delete/', views.delete_label, name='delete_label'),
@@ -1,6 +1,9 @@
 from django.core.management.base import BaseCommand
-from inventory.models import Item, AIImgdescription
-from django.db.models import F
+from inventory.models import Item
+from inventory.services.aggregation import bulk_aggregate, contributing_descriptions, stale_items
+
+# Fingerprint salt for plain concatenation, see services.aggregation
+AGGREGATION_SALT = 'concat'
 
 class Command(BaseCommand):
     help = 'Aggregate attachment AI descriptions into item text field'
@@ -15,7 +18,18 @@ class Command(BaseCommand):
         parser.add_argument(
             '--force',
             action='store_true',
-            help='Regenerate aggregated descriptions even if they exist'
+            help='Regenerate aggregated descriptions even if their sources are unchanged'
+        )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Aggregate in the database with set-based UPDATE statements'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Item id range updated per statement in --bulk mode (default: 10000)'
         )
 
     def handle(self, *args, **options):
@@ -29,17 +43,25 @@ class Command(BaseCommand):
             else:
                 items = Item.objects.all()
 
-            self.stdout.write(f"Processing {items.count()} items")
+            if options['bulk']:
+                updated = bulk_aggregate(
+                    items,
+                    salt=AGGREGATION_SALT,
+                    force=options['force'],
+                    batch_size=options['batch_size']
+                )
+                self.stdout.write(self.style.SUCCESS(f"Updated {updated} items"))
+                return
+
+            items = stale_items(items, salt=AGGREGATION_SALT, force=options['force'])
+            self.stdout.write(f"Processing {items.count()} items with changed descriptions")
 
             for item in items:
                 # Get all AI descriptions from item's attachments
-                ai_descriptions = AIImgdescription.objects.filter(
-                    attachment__item=item
-                ).values_list('response', flat=True)
-
-                if not ai_descriptions:
-                    self.stdout.write(f"No AI descriptions found for item {item.id}")
-                    continue
+                ai_descriptions = (contributing_descriptions()
+                                   .filter(attachment__item=item)
+                                   .order_by('id')
+                                   .values_list('response', flat=True))
 
                 # Aggregate descriptions into a single text
                 aggregated_text = "\n\n".join([
@@ -49,6 +71,7 @@ class Command(BaseCommand):
 
                 # Update item's text field
                 item.ai_aggregated_description = aggregated_text
+                item.ai_description_fingerprint = item.source_fingerprint
                 item.save()
 
                 self.stdout.write(self.style.SUCCESS(
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from inventory.models import Attachment, Item
+from inventory.services.latest_descriptions import update_latest_image_descriptions, update_latest_item_descriptions
+
+class Command(BaseCommand):
+    help = 'Set the latest AI description pointers of attachments and items'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Only set pointers that are empty'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Id range updated per statement (default: 10000)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            attachments, items = Attachment.objects.all(), Item.objects.all()
+            if options['missing']:
+                attachments = attachments.filter(latest_ai_description__isnull=True)
+                items = items.filter(latest_ai_description__isnull=True)
+
+            updated = update_latest_image_descriptions(attachments, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Updated {updated} attachments"))
+            updated = update_latest_item_descriptions(items, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Updated {updated} items"))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Command failed: {str(e)}"))
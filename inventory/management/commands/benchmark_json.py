@@ -0,0 +1,76 @@
+import math
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from inventory import renderers
+from inventory.models import Item
+from inventory.serializers import ItemSerializer
+
+class Command(BaseCommand):
+    help = 'Compare the stdlib and orjson API renderers and parsers on an ItemSerializer payload'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--items',
+            type=int,
+            default=1000,
+            help='Items in the payload, existing items are repeated if there are fewer (default: 1000)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Runs of each measurement, the fastest is reported (default: 5)'
+        )
+
+    def best_time(self, function, repeat):
+        """Fastest of `repeat` runs in milliseconds, and the last result."""
+        best = math.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000, result
+
+    def handle(self, *args, **options):
+        try:
+            count, repeat = options['items'], max(options['repeat'], 1)
+            items = list(Item.objects
+                         .prefetch_related('qr_codes', 'labels', 'emails__attachments', 'attachments')
+                         .order_by('-id')[:count])
+            if not items:
+                raise CommandError("No items to serialize")
+
+            elapsed, data = self.best_time(lambda: ItemSerializer(items, many=True).data, repeat)
+            self.stdout.write(f"ItemSerializer: {elapsed:.1f} ms for {len(items)} items")
+            data = (list(data) * math.ceil(count / len(items)))[:count]
+
+            if renderers.orjson is None:
+                self.stdout.write(self.style.WARNING("orjson is not installed, the orjson classes fall back to json"))
+
+            baseline = None
+            for name, renderer, parser in (
+                ('json', JSONRenderer(), JSONParser()),
+                ('orjson', renderers.ORJSONRenderer(), renderers.ORJSONParser()),
+            ):
+                render_ms, body = self.best_time(lambda: renderer.render(data), repeat)
+                parse_ms, _ = self.best_time(lambda: parser.parse(BytesIO(body)), repeat)
+                line = (f"{name}: render {render_ms:.1f} ms, parse {parse_ms:.1f} ms, "
+                        f"{len(body) / 1024:.0f} KiB for {len(data)} items")
+                if baseline is None:
+                    baseline = (render_ms, parse_ms)
+                    self.stdout.write(line)
+                else:
+                    speedup = (baseline[0] / max(render_ms, 1e-6), baseline[1] / max(parse_ms, 1e-6))
+                    self.stdout.write(self.style.SUCCESS(
+                        f"{line} (render x{speedup[0]:.1f}, parse x{speedup[1]:.1f})"
+                    ))
+
+        except CommandError:
+            raise
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Command failed: {str(e)}"))
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from inventory.services.uploads import purge_stale
+
+class Command(BaseCommand):
+    help = 'Abort chunked uploads left incomplete and delete their part files (run periodically, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Abort uploads untouched for this many hours (default: 24)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            count = purge_stale(timedelta(hours=options['hours']))
+            self.stdout.write(self.style.SUCCESS(f"{count} stale uploads aborted"))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Command failed: {str(e)}"))
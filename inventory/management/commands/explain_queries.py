@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from inventory.services.query_plans import LARGE_TABLE_ROWS, explain, query_catalogue, table_rows
+
+class Command(BaseCommand):
+    help = 'EXPLAIN ANALYZE the hot queries of the app and flag sequential scans of large tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help='Queries to explain (default: all, see --list)'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='List the catalogue of queries'
+        )
+        parser.add_argument(
+            '--min-rows',
+            type=int,
+            default=LARGE_TABLE_ROWS,
+            help=f'Tables this large must not be scanned sequentially (default: {LARGE_TABLE_ROWS})'
+        )
+        parser.add_argument(
+            '--plans',
+            action='store_true',
+            help='Print the full JSON plans'
+        )
+
+    def handle(self, *args, **options):
+        catalogue = query_catalogue()
+        if options['list']:
+            for name in catalogue:
+                self.stdout.write(name)
+            return
+
+        unknown = set(options['names']) - set(catalogue)
+        if unknown:
+            raise CommandError(f"Unknown queries: {', '.join(sorted(unknown))}")
+
+        rows = table_rows()
+        flagged = 0
+        for name in options['names'] or catalogue:
+            report = explain(name, catalogue[name](), rows, options['min_rows'])
+            line = f"{name}: {report.execution_time:.2f} ms, {report.plan_rows} rows estimated"
+            if report.seq_scans:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(
+                    f"{line}, sequential scan of {', '.join(sorted(set(report.seq_scans)))}"
+                ))
+            else:
+                self.stdout.write(line)
+            if options['plans']:
+                self.stdout.write(json.dumps(report.plan, indent=2))
+
+        if flagged:
+            self.stdout.write(self.style.WARNING(f"{flagged} queries scan large tables sequentially"))
+        else:
+            self.stdout.write(self.style.SUCCESS("No sequential scan of large tables"))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from inventory.services.export import CHUNK_SIZE, EXPORT_FORMATS, export_chunks
+
+class Command(BaseCommand):
+    help = 'Export items with their QR codes, labels and latest AI description as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=sorted(EXPORT_FORMATS),
+            default='ndjson',
+            help='Output format (default: ndjson)'
+        )
+        parser.add_argument(
+            '--output',
+            help='File to write, standard output if omitted'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Rows fetched per round trip of the database cursor (default: {CHUNK_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            chunks = export_chunks(options['format'], chunk_size=options['chunk_size'])
+            if not options['output']:
+                for chunk in chunks:
+                    self.stdout.write(chunk, ending='')
+                return
+
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+            self.stdout.write(self.style.SUCCESS(f"Items exported to {options['output']}"))
+
+        except Exception as e:
+            # stderr, standard output may be the export itself
+            self.stderr.write(self.style.ERROR(f"Command failed: {str(e)}"))
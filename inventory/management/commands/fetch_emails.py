@@ -14,6 +14,7 @@ from email.utils import parsedate_to_datetime
 import re
 import threading
 from dotenv import load_dotenv
+from inventory import metrics
 from inventory.models import Email, Attachment
 
 class Command(BaseCommand):
@@ -133,18 +134,26 @@ class Command(BaseCommand):
                         self.style.SUCCESS(f"Saved attachment: {unique_filename} to {attachment.file.path}")
                     )
                     self.attachment_count += 1
+                    metrics.ATTACHMENTS_SAVED.labels('EMAIL', 'saved').inc()
+                    metrics.BYTES_WRITTEN.labels('EMAIL').inc(content_size)
                 else:
+                    metrics.ATTACHMENTS_SAVED.labels('EMAIL', 'error').inc()
                     self.stdout.write(
                         self.style.ERROR(f"File not found after save: {attachment.file.path}")
                     )
 
             except Exception as e:
                 self.attachment_errors += 1
+                metrics.ATTACHMENTS_SAVED.labels('EMAIL', 'error').inc()
                 self.stdout.write(
                     self.style.ERROR(f"Failed to save attachment {filename}: {str(e)}")
                 )
 
     def process_email(self, email_id):
+        with metrics.EMAIL_FETCH_SECONDS.time():
+            return self.fetch_email(email_id)
+
+    def fetch_email(self, email_id):
         max_retries = 3
         retry_delay = 5  # seconds
         
@@ -259,6 +268,7 @@ class Command(BaseCommand):
                     for future in concurrent.futures.as_completed(futures):
                         try:
                             result = future.result()
+                            metrics.EMAILS_FETCHED.labels(result or "error").inc()
                             if result == "skipped":
                                 skipped_count += 1
                             elif result == "processed":
@@ -267,8 +277,11 @@ class Command(BaseCommand):
                                 error_count += 1
                         except Exception as e:
                             error_count += 1
+                            metrics.EMAILS_FETCHED.labels("error").inc()
                             self.stdout.write(self.style.ERROR(f'Future error: {str(e)}'))
 
+                    metrics.QUEUE_DEPTH.labels('fetch_emails').set(total_emails - i - len(batch))
+
                     batch_time = time.time() - batch_start_time
                     emails_per_second = len(batch) / batch_time if batch_time > 0 else 0
                     
@@ -304,6 +317,7 @@ class Command(BaseCommand):
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Unexpected error: {str(e)}'))
         finally:
+            metrics.export('fetch_emails')
             try:
                 if hasattr(self.thread_local, 'mail'):
                     self.thread_local.mail.close()
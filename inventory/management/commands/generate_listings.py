@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from inventory import metrics
+from inventory.models import Item
+from inventory.services.listings import generate_listings
+from inventory.services.scheduler import RateLimitedScheduler
+
+class Command(BaseCommand):
+    help = 'Generate LeBonCoin listings for items whose AI analysis changed since their last listing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'item_id',
+            nargs='?',
+            type=int,
+            help='Process specific item by ID'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate listings even if the item analysis is unchanged'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Maximum number of items to process'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of concurrent API calls (default: 4)'
+        )
+        parser.add_argument(
+            '--rps',
+            type=float,
+            default=1.0,
+            help='API requests per second quota (default: 1.0)'
+        )
+        parser.add_argument(
+            '--tpm',
+            type=int,
+            default=500000,
+            help='API tokens per minute quota, 0 to disable (default: 500000)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['item_id']:
+                items = Item.objects.filter(id=options['item_id'])
+                if not items.exists():
+                    self.stdout.write(self.style.ERROR(f"No item found with ID {options['item_id']}"))
+                    return
+            else:
+                items = Item.objects.all()
+
+            scheduler = RateLimitedScheduler(
+                requests_per_second=options['rps'],
+                tokens_per_minute=options['tpm'] or None,
+                max_workers=options['workers']
+            )
+            result = generate_listings(
+                items,
+                scheduler=scheduler,
+                force=options['force'],
+                limit=options['limit']
+            )
+
+            for item_id, error in result['failed']:
+                self.stdout.write(self.style.WARNING(f"Item {item_id}: {error}"))
+
+            stats = scheduler.throughput()
+            self.stdout.write(self.style.SUCCESS(
+                f"Created {len(result['created'])} listings, {len(result['failed'])} failed "
+                f"({stats['calls']} calls in {stats['elapsed']:.1f}s, "
+                f"{stats['requests_per_second']:.2f} req/s)"
+            ))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Command failed: {str(e)}"))
+        finally:
+            metrics.export('generate_listings')
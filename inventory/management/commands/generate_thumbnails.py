@@ -0,0 +1,97 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from inventory.models import Attachment, Item
+from inventory.services.thumbnails import generate_batch
+
+def init_worker():
+    # Forked workers inherit the parent's database sockets: drop them without
+    # closing, which would end the parent's session. Spawned workers need
+    # Django set up before touching storage.
+    for connection in connections.all():
+        connection.connection = None
+    django.setup()
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails of image attachments in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'attachment_id',
+            nargs='?',
+            type=int,
+            help='Process specific attachment by ID'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate thumbnails that already exist'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: number of CPUs)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Attachments per worker task (default: 50)'
+        )
+
+    def batches(self, attachments, batch_size):
+        batch = []
+        for job in attachments.values_list('id', 'file').iterator(chunk_size=2000):
+            batch.append(job)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def handle(self, *args, **options):
+        try:
+            attachments = (Attachment.objects
+                           .filter(content_type__startswith='image/')
+                           .exclude(file='')
+                           .exclude(file__isnull=True)
+                           .order_by('id'))
+            if options['attachment_id']:
+                attachments = attachments.filter(id=options['attachment_id'])
+            if not options['force']:
+                attachments = attachments.filter(has_thumbnails=False)
+
+            total = attachments.count()
+            self.stdout.write(f"Generating thumbnails for {total} attachments")
+            if not total:
+                return
+
+            # Materialize the job list before forking so workers never query the database
+            batches = list(self.batches(attachments, options['batch_size']))
+
+            started = time.monotonic()
+            done_count = failed_count = 0
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+                futures = [pool.submit(generate_batch, batch, options['force']) for batch in batches]
+                for future in as_completed(futures):
+                    done, failed = future.result()
+                    Attachment.objects.filter(id__in=done).update(has_thumbnails=True)
+                    Item.objects.filter(attachments__in=done).bump_cache_version()
+                    for attachment_id, error in failed:
+                        self.stdout.write(self.style.WARNING(f"Attachment {attachment_id}: {error}"))
+                    done_count += len(done)
+                    failed_count += len(failed)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(
+                f"Generated thumbnails for {done_count} attachments, {failed_count} failed "
+                f"in {elapsed:.1f}s ({done_count / elapsed if elapsed else 0:.1f} images/s)"
+            ))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Command failed: {str(e)}"))
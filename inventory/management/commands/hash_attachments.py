@@ -0,0 +1,40 @@
+import hashlib
+
+from django.core.management.base import BaseCommand
+from inventory.models import Attachment
+
+class Command(BaseCommand):
+    help = 'Compute the SHA-256 of attachments missing one, so uploads can be deduplicated against them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Hash at most this many attachments'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            attachments = Attachment.objects.filter(sha256='').exclude(file='').exclude(file__isnull=True).order_by('id')
+            if options['limit']:
+                attachments = attachments[:options['limit']]
+
+            hashed, missing = 0, 0
+            for attachment in attachments.only('id', 'file').iterator():
+                digest = hashlib.sha256()
+                try:
+                    with attachment.file.open('rb') as file:
+                        for block in file.chunks():
+                            digest.update(block)
+                except FileNotFoundError:
+                    missing += 1
+                    continue
+                Attachment.objects.filter(pk=attachment.pk).update(sha256=digest.hexdigest())
+                hashed += 1
+
+            if missing:
+                self.stdout.write(self.style.WARNING(f"{missing} files missing from storage"))
+            self.stdout.write(self.style.SUCCESS(f"{hashed} attachments hashed"))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Command failed: {str(e)}"))
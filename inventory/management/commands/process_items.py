@@ -15,6 +15,7 @@ import logging
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.db.models import QuerySet
+from inventory import metrics
 from inventory.models import Email, Item, QRCode, Attachment
 
 # Configure logging
@@ -66,6 +67,9 @@ class Command(BaseCommand):
             logger.error(f"Critical error in command execution: {str(e)}")
             self.stdout.write(self.style.ERROR(f"Command failed: {str(e)}"))
             raise
+        finally:
+            if not self.dry_run:
+                self.record_metrics()
 
     def clean_text(self, text: Optional[str]) -> str:
         """
@@ -288,6 +292,15 @@ class Command(BaseCommand):
         self.stdout.write(f"  Emails Skipped: {self.stats['emails_skipped']}")
         self.stdout.write(f"  Errors: {self.stats['errors']}")
 
+    def record_metrics(self) -> None:
+        """Export the run's statistics, see inventory.metrics."""
+        # Errors are also counted as skipped emails
+        metrics.EMAILS_LINKED.labels('processed').inc(self.stats['total_processed'])
+        metrics.EMAILS_LINKED.labels('skipped').inc(self.stats['emails_skipped'] - self.stats['errors'])
+        metrics.EMAILS_LINKED.labels('error').inc(self.stats['errors'])
+        metrics.ITEMS_CREATED.inc(self.stats['items_created'])
+        metrics.export('process_items')
+
     def debug_log(self, message: str) -> None:
         """Log debug message if verbose mode is enabled."""
         if self.verbose:
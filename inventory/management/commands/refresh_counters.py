@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.models import Counter
+from inventory.services.counters import COUNTERS, refresh_counters
+
+class Command(BaseCommand):
+    help = 'Recompute the email and attachment list counters (run periodically, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help=f"Counters to refresh among {', '.join(sorted(COUNTERS))} (default: all)"
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['names']) - set(COUNTERS)
+        if unknown:
+            raise CommandError(f"Unknown counters: {', '.join(sorted(unknown))}")
+
+        try:
+            previous = dict(Counter.objects.values_list('name', 'value'))
+            for name, value in refresh_counters(options['names'] or None).items():
+                drift = value - previous[name] if name in previous else 0
+                self.stdout.write(f"{name}: {value} (drift {drift:+d})")
+            self.stdout.write(self.style.SUCCESS("Counters refreshed"))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Command failed: {str(e)}"))
@@ -1,6 +1,10 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from inventory import metrics
 from inventory.models import Item
-from inventory.services.text import TextService
+from inventory.services.aggregation import contributing_descriptions, stale_items
+from inventory.services.scheduler import RateLimitedScheduler
+from inventory.services.summarizer import MapReduceSummarizer
+from inventory.services.text import TextService, estimate_tokens
 import time
 import logging
 
@@ -25,15 +29,53 @@ class Command(BaseCommand):
         parser.add_argument(
             '--force',
             action='store_true',
-            help='Update even if description exists'
+            help='Update even if source descriptions are unchanged'
         )
         parser.add_argument(
             '--prompt',
             type=str,
             help='Override default prompt'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of concurrent API calls (default: 4)'
+        )
+        parser.add_argument(
+            '--rps',
+            type=float,
+            default=1.0,
+            help='API requests per second quota (default: 1.0)'
+        )
+        parser.add_argument(
+            '--tpm',
+            type=int,
+            default=500000,
+            help='API tokens per minute quota, 0 to disable (default: 500000)'
+        )
+        parser.add_argument(
+            '--token-budget',
+            type=int,
+            default=8000,
+            help='Maximum estimated tokens per request; larger items are summarized in chunks (default: 8000)'
+        )
+        parser.add_argument(
+            '--estimate',
+            action='store_true',
+            help='Only print the estimated calls and tokens per item, without calling the API'
+        )
 
     def handle(self, *args, **options):
+        if not options['rps'] > 0:
+            raise CommandError("--rps must be greater than 0")
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        if options['tpm'] < 0:
+            raise CommandError("--tpm must be 0 or more")
+        if options['token_budget'] < 1:
+            raise CommandError("--token-budget must be at least 1")
+
         text_service = TextService()
 
         try:
@@ -46,44 +88,95 @@ class Command(BaseCommand):
             else:
                 items = Item.objects.all()
 
-            logger.info(f"Processing {items.count()} items")
+            # Only items whose image descriptions changed since their last summary
+            salt = f"summary:{options.get('prompt') or ''}"
+            items = stale_items(items, salt=salt, force=options['force'])
 
-            for item in items:
-                if not options['force'] and item.ai_aggregated_description:
-                    logger.info(f"Skipping item {item.id} - description exists")
-                    continue
+            logger.info(f"Processing {items.count()} items with changed descriptions")
 
-                # Get all AI descriptions from item's attachments
-                descriptions = []
-                for attachment in item.attachments.all():
-                    for ai_desc in attachment.attachment_ai_descriptions.all():
-                        if ai_desc.response:
-                            descriptions.append(ai_desc.response)
+            scheduler = RateLimitedScheduler(
+                requests_per_second=options['rps'],
+                tokens_per_minute=options['tpm'] or None,
+                max_workers=options['workers']
+            )
+            prompt = options.get('prompt')
 
-                if not descriptions:
-                    logger.warning(f"No AI descriptions found for item {item.id}")
-                    continue
+            def rate_limited_query(text, custom_prompt):
+                return scheduler.call(
+                    text_service.query_text, text,
+                    custom_prompt=custom_prompt,
+                    raise_on_rate_limit=True,
+                    tokens=estimate_tokens(text_service.build_prompt(text, custom_prompt))
+                )
+
+            summarizer = MapReduceSummarizer(
+                text_service,
+                call=rate_limited_query,
+                token_budget=options['token_budget']
+            )
+
+            def jobs():
+                # Runs in the main thread, so database reads stay out of the workers
+                for item in items:
+                    descriptions = list(
+                        contributing_descriptions()
+                        .filter(attachment__item=item)
+                        .order_by('attachment_id', 'id')
+                        .values_list('response', flat=True)
+                    )
+                    yield item, descriptions
 
-                # Time the API call
+            if options['estimate']:
+                self.print_estimates(summarizer, jobs(), prompt)
+                return
+
+            def summarize(job):
+                _, descriptions = job
                 start_time = time.time()
-                summary = text_service.query_text(
-                    "\n".join(descriptions),
-                    custom_prompt=options.get('prompt')
-                )
-                
+                summary = summarizer.summarize(descriptions, prompt)
+                return summary, time.time() - start_time
+
+            for (item, _), result, error in scheduler.map(summarize, jobs()):
+                if error:
+                    logger.error(f"Failed to generate summary for item {item.id}: {error}")
+                    continue
+
+                summary, elapsed_time = result
                 if summary:
                     item.ai_aggregated_description = summary
+                    item.ai_description_fingerprint = item.source_fingerprint
                     item.save()
-                    elapsed_time = time.time() - start_time
                     logger.info(
                         f"Updated item {item.id} with new summary (took {elapsed_time:.2f}s)"
                     )
-                    
-                    # Sleep with buffer if needed
-                    if elapsed_time < 1.1:
-                        time.sleep(1.1 - elapsed_time)
                 else:
                     logger.error(f"Failed to generate summary for item {item.id}")
 
+            stats = scheduler.throughput()
+            logger.info(
+                f"Throughput: {stats['calls']} calls in {stats['elapsed']:.1f}s "
+                f"({stats['requests_per_second']:.2f} req/s, {stats['tokens_per_minute']:.0f} tokens/min), "
+                f"{stats['throttled']} throttled, {stats['failed']} failed"
+            )
+
         except Exception as e:
             logger.error(f"Error: {str(e)}")
+        finally:
+            if not options['estimate']:
+                metrics.export('update_item_descriptions')
+
+    def print_estimates(self, summarizer, jobs, prompt):
+        """Print the per-item cost of a run without calling the API."""
+        total_calls = total_tokens = 0
+        for item, descriptions in jobs:
+            estimate = summarizer.estimate(descriptions, prompt)
+            total_calls += estimate['calls']
+            total_tokens += estimate['tokens']
+            self.stdout.write(
+                f"Item {item.id}: {estimate['descriptions']} descriptions "
+                f"({estimate['unique']} unique), {estimate['chunks']} chunks, "
+                f"{estimate['calls']} calls, ~{estimate['tokens']} input tokens"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: {total_calls} calls, ~{total_tokens} input tokens"
+        ))
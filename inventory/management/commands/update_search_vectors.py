@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from inventory.models import Email, Item
+from inventory.services.search import update_email_search_vectors, update_item_search_vectors
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search vectors of items and emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--items-only',
+            action='store_true',
+            help='Only rebuild item search vectors'
+        )
+        parser.add_argument(
+            '--emails-only',
+            action='store_true',
+            help='Only rebuild email search vectors'
+        )
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Only rebuild rows without a search vector'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Id range updated per statement (default: 10000)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            items, emails = Item.objects.all(), Email.objects.all()
+            if options['missing']:
+                items = items.filter(search_vector__isnull=True)
+                emails = emails.filter(search_vector__isnull=True)
+
+            if not options['emails_only']:
+                updated = update_item_search_vectors(items, batch_size=options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f"Updated {updated} items"))
+            if not options['items_only']:
+                updated = update_email_search_vectors(emails, batch_size=options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f"Updated {updated} emails"))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Command failed: {str(e)}"))
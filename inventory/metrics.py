@@ -0,0 +1,148 @@
+"""
+Prometheus metrics of the ingestion, linking and AI pipeline, on
+prometheus_client. The web process serves them at /metrics, see `scrape`:
+under a multi-worker server set PROMETHEUS_MULTIPROC_DIR so every worker
+records to that directory and a scrape sums them all. Management commands
+write them on exit to METRICS_TEXTFILE_DIR for the node_exporter textfile
+collector and/or push them to the Pushgateway at METRICS_PUSHGATEWAY_URL,
+see `export`.
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import List
+
+from django.conf import settings
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+    multiprocess, push_to_gateway, write_to_textfile,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from inventory import profiling
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Seconds, from a quick completion to a slow vision call
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Ingestion (fetch_emails)
+EMAILS_FETCHED = Counter(
+    'inventory_emails_fetched_total', 'Emails read from the IMAP server, by outcome', ['result'])
+EMAIL_FETCH_SECONDS = Histogram(
+    'inventory_email_fetch_seconds', 'Time to fetch and store one email with its attachments',
+    buckets=DEFAULT_BUCKETS)
+ATTACHMENTS_SAVED = Counter(
+    'inventory_attachments_saved_total', 'Attachment files stored, by source and outcome', ['source', 'result'])
+BYTES_WRITTEN = Counter(
+    'inventory_attachment_bytes_written_total', 'Bytes of attachment files stored, by source', ['source'])
+
+# Linking (process_items)
+EMAILS_LINKED = Counter(
+    'inventory_emails_linked_total', 'Emails handled by the item linking passes, by outcome', ['result'])
+ITEMS_CREATED = Counter(
+    'inventory_items_created_total', 'Items created from emails')
+
+# AI services
+AI_CALLS = Counter(
+    'inventory_ai_calls_total', 'AI API calls, by service (text, vision) and outcome', ['service', 'outcome'])
+AI_CALL_SECONDS = Histogram(
+    'inventory_ai_call_seconds', 'AI API call latency, by service', ['service'], buckets=DEFAULT_BUCKETS)
+AI_TOKENS = Counter(
+    'inventory_ai_tokens_total', 'Tokens reported by the AI API, by service and kind', ['service', 'kind'])
+
+# Caches and queues; queue depths are summed over the live processes
+CACHE_REQUESTS = Counter(
+    'inventory_cache_requests_total', 'Cache lookups, by cache and result (hit, miss)', ['cache', 'result'])
+QUEUE_DEPTH = Gauge(
+    'inventory_queue_depth', 'Jobs waiting in a work queue', ['queue'], multiprocess_mode='livesum')
+
+class RecordsCollector:
+    """Table sizes from inventory.services.counters, read at each scrape."""
+
+    def collect(self):
+        from inventory.services import counters
+
+        records = GaugeMetricFamily(
+            'inventory_records', 'Rows counted by the list statistics counters', labels=['counter'])
+        for name, value in counters.get_counters(*counters.COUNTERS).items():
+            records.add_metric([name], value)
+        yield records
+
+# Shared by all processes already, so served once next to the process metrics
+TABLES = CollectorRegistry(auto_describe=False)
+TABLES.register(RecordsCollector())
+
+@contextmanager
+def ai_call(service: str):
+    """
+    Count and time an AI API call, also against the current request when
+    profiled (see inventory.profiling).
+
+    Args:
+        service: 'text' or 'vision'
+    """
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        with profiling.ai_call():
+            yield
+    except Exception as e:
+        outcome = 'rate_limited' if getattr(e, 'status_code', None) == 429 else 'error'
+        raise
+    finally:
+        AI_CALLS.labels(service, outcome).inc()
+        AI_CALL_SECONDS.labels(service).observe(time.perf_counter() - started)
+
+def record_usage(service: str, response) -> None:
+    """Add the token usage reported in an AI API response."""
+    usage = getattr(response, 'usage', None)
+    for kind in ('prompt', 'completion'):
+        tokens = getattr(usage, f'{kind}_tokens', None)
+        if tokens:
+            AI_TOKENS.labels(service, kind).inc(tokens)
+
+def scrape() -> bytes:
+    """
+    The /metrics page: with PROMETHEUS_MULTIPROC_DIR set, the metrics of all
+    the processes recording there, otherwise those of this process, followed
+    by the table counters.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(TABLES)
+
+def export(job: str) -> List[str]:
+    """
+    Hand the metrics of a management command run to the configured outputs:
+    <METRICS_TEXTFILE_DIR>/<job>.prom and the METRICS_PUSHGATEWAY_URL job.
+    Failures are logged, metrics never fail a command.
+
+    Returns:
+        list: Where the metrics were written
+    """
+    written = []
+    directory = getattr(settings, 'METRICS_TEXTFILE_DIR', '')
+    if directory:
+        path = os.path.join(directory, f'{job}.prom')
+        try:
+            os.makedirs(directory, exist_ok=True)
+            write_to_textfile(path, REGISTRY)
+            written.append(path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {path}: {e}")
+    url = getattr(settings, 'METRICS_PUSHGATEWAY_URL', '')
+    if url:
+        try:
+            push_to_gateway(url, job=job, registry=REGISTRY, timeout=10)
+            written.append(url)
+        except OSError as e:
+            logger.warning(f"Could not push metrics to {url}: {e}")
+    return written
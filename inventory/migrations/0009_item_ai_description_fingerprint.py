@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_listingcategory_listinglbc'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='ai_description_fingerprint',
+            field=models.CharField(blank=True, default='', help_text='Fingerprint of the AI image descriptions the aggregated description was built from', max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_item_ai_description_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listinglbc',
+            name='source_fingerprint',
+            field=models.CharField(blank=True, default='', help_text='Fingerprint of the item AI analyses the listing was generated from', max_length=32),
+        ),
+    ]
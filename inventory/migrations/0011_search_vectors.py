@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:49
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_listinglbc_source_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Full-text search document, maintained by inventory.signals', null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Full-text search document, maintained by inventory.signals', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='inventory_e_search__482b2c_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='inventory_i_search__b8abde_gin'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='has_thumbnails',
+            field=models.BooleanField(default=False, help_text='Whether thumbnails were generated, see services.thumbnails'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_attachment_has_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='cache_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Bumped by inventory.signals when the item's card changes, keys its cached HTML"),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='latest_ai_description',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Latest AI description, maintained by inventory.signals', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventory.aiimgdescription'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='latest_ai_description',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Latest AI analysis, maintained by inventory.signals', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventory.aidescription'),
+        ),
+    ]
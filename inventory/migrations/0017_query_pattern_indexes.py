@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_latest_ai_description'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aidescription',
+            index=models.Index(fields=['item', 'created_at'], name='aidescription_item_created'),
+        ),
+        migrations.AddIndex(
+            model_name='aiimgdescription',
+            index=models.Index(fields=['attachment', 'created_at'], name='aiimgdesc_attachment_created'),
+        ),
+        migrations.AddIndex(
+            model_name='attachment',
+            index=models.Index(condition=models.Q(('content_type__startswith', 'image/')), fields=['item', 'id'], name='attachment_item_images'),
+        ),
+        migrations.AddIndex(
+            model_name='attachment',
+            index=models.Index(condition=models.Q(('content_type__startswith', 'image/')), fields=['email', 'id'], name='attachment_email_images'),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['sent_at', 'id'], name='email_sent_at_id'),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(condition=models.Q(('item__isnull', True)), fields=['sent_at'], name='email_unlinked_sent_at'),
+        ),
+        migrations.RemoveIndex(
+            model_name='email',
+            name='inventory_e_sent_at_a5fa03_idx',
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['created_at', 'id'], name='item_created_id'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Last change of the email or its attachments, see inventory.conditional'),
+        ),
+    ]
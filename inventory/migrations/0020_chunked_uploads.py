@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0019_attachment_file_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='SHA-256 of the file, uploads with the same content share it, see services.uploads', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('size', models.PositiveBigIntegerField(help_text='Declared file size in bytes')),
+                ('received', models.PositiveBigIntegerField(default=0, help_text='Bytes written so far, the offset of the next chunk')),
+                ('sha256', models.CharField(blank=True, default='', help_text='Expected SHA-256 of the file, checked on completion if given', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attachment', models.ForeignKey(blank=True, help_text='Attachment created on completion', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventory.attachment')),
+                ('item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='inventory.item')),
+            ],
+        ),
+    ]
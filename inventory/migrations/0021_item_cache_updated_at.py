@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0020_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='cache_updated_at',
+            field=models.DateTimeField(auto_now=True, help_text="Last save or cache_version bump, Last-Modified of the item's pages, see inventory.conditional"),
+        ),
+    ]
@@ -1,8 +1,68 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import Count, F, IntegerField, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce, Now, Upper
 from django.core.exceptions import ValidationError
+from django.urls import reverse
 from inventory.services.vision import handle_vision_query
+from inventory.services.thumbnails import DEFAULT_FORMAT, DEFAULT_SIZE, thumbnail_format, thumbnail_url
 import os
 import logging
+import uuid
+
+def related_count(model, field='item'):
+    """Correlated COUNT(*) of `model` rows pointing at the outer row, 0 if none."""
+    return Coalesce(
+        Subquery(
+            model.objects
+            .filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+def card_prefetches():
+    """Lookups prefetched for item cards: labels and image attachments."""
+    return (
+        'labels',
+        Prefetch(
+            'attachments',
+            queryset=Attachment.objects.filter(content_type__startswith='image/').order_by('id'),
+            to_attr='image_attachments'
+        ),
+    )
+
+class ItemQuerySet(models.QuerySet):
+    def with_card_data(self, prefetch=True):
+        """
+        Everything an item card renders, in a constant number of queries:
+        latest AI analysis and related counts as annotations, labels and
+        image attachments as prefetches.
+
+        Without `prefetch`, the prefetches are left to the caller, see
+        services.fragments.
+        """
+        queryset = self.annotate(
+            latest_ai_response=F('latest_ai_description__response'),
+            attachment_count=related_count(Attachment),
+            qr_code_count=related_count(QRCode),
+            email_count=related_count(Email),
+        )
+        if prefetch:
+            queryset = queryset.prefetch_related(*card_prefetches())
+        return queryset
+
+    def bump_cache_version(self):
+        """
+        Invalidate the cached cards and the HTTP validators of these items.
+        `updated_at` is left alone, it only follows edits of the item itself.
+        """
+        return self.update(cache_version=F('cache_version') + 1, cache_updated_at=Now())
 
 class Item(models.Model):
     """Core inventory item model."""
@@ -14,7 +74,46 @@ class Item(models.Model):
         null=True,
         blank=True,
         help_text="Aggregated AI descriptions from all attachments"
-    )    
+    )
+    ai_description_fingerprint = models.CharField(
+        max_length=32,
+        blank=True,
+        default='',
+        help_text="Fingerprint of the AI image descriptions the aggregated description was built from"
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        help_text="Full-text search document, maintained by inventory.signals"
+    )
+    cache_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Bumped by inventory.signals when the item's card changes, keys its cached HTML"
+    )
+    cache_updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text="Last save or cache_version bump, Last-Modified of the item's pages, see inventory.conditional"
+    )
+    latest_ai_description = models.ForeignKey(
+        'AIdescription',
+        related_name='+',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Latest AI analysis, maintained by inventory.signals"
+    )
+
+    objects = ItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pages of the item list and search, see inventory.pagination
+            models.Index(fields=['created_at', 'id'], name='item_created_id'),
+            GinIndex(fields=['search_vector']),
+        ]
+
     def clean(self):
         # Only run this validation if the item already exists (has an ID)
         if self.id and not self.qr_codes.exists():
@@ -42,6 +141,10 @@ class QRCode(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['code'], name='unique_qr_code')
         ]
+        indexes = [
+            # Matches icontains, which compares UPPER(column) with LIKE '%...%'
+            GinIndex(OpClass(Upper('code'), name='gin_trgm_ops'), name='qrcode_code_trgm'),
+        ]
 
     def __str__(self):
         return f"QR {self.code} for {self.item}"
@@ -63,6 +166,12 @@ class AIdescription(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Latest analysis of an item
+            models.Index(fields=['item', 'created_at'], name='aidescription_item_created'),
+        ]
+
     def __str__(self):
         return f"Response : {self.response} payload :{self.payload} for {self.item}"
     
@@ -98,14 +207,28 @@ class Email(models.Model):
     thread_id = models.CharField(max_length=100, null=True, blank=True)
     sent_at = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text="Last change of the email or its attachments, see inventory.conditional"
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        help_text="Full-text search document, maintained by inventory.signals"
+    )
 
     class Meta:
         ordering = ['-sent_at']
         indexes = [
             models.Index(fields=['sender']),
-            models.Index(fields=['sent_at']),
             models.Index(fields=['thread_id']),
             models.Index(fields=['email_uid']),
+            # Keyset pages of the email list, also serves sent_at alone
+            models.Index(fields=['sent_at', 'id'], name='email_sent_at_id'),
+            # Emails waiting to be linked to an item, oldest first (process_items)
+            models.Index(fields=['sent_at'], name='email_unlinked_sent_at', condition=Q(item__isnull=True)),
+            GinIndex(fields=['search_vector']),
+            GinIndex(OpClass(Upper('sender'), name='gin_trgm_ops'), name='email_sender_trgm'),
         ]
 
     def __str__(self):
@@ -138,7 +261,8 @@ class Attachment(models.Model):
     file = models.FileField(
         upload_to='attachments',
         null=True,  # Allow null files
-        blank=True  # Make field optional
+        blank=True,  # Make field optional
+        db_index=True  # Media requests look attachments up by file name
     )
     filename = models.CharField(max_length=255)
     content_type = models.CharField(max_length=100)
@@ -157,6 +281,26 @@ class Attachment(models.Model):
         default='UPLOAD',
         help_text="Source of the attachment"
     )
+    has_thumbnails = models.BooleanField(
+        default=False,
+        help_text="Whether thumbnails were generated, see services.thumbnails"
+    )
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        db_index=True,
+        help_text="SHA-256 of the file, uploads with the same content share it, see services.uploads"
+    )
+    latest_ai_description = models.ForeignKey(
+        'AIImgdescription',
+        related_name='+',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Latest AI description, maintained by inventory.signals"
+    )
 
     class Meta:
         ordering = ['-created_at']
@@ -164,10 +308,36 @@ class Attachment(models.Model):
             models.Index(fields=['content_type']),
             models.Index(fields=['created_at']),
             models.Index(fields=['source']),
+            # Images of an item or an email in id order (cards, image_preview)
+            models.Index(fields=['item', 'id'], name='attachment_item_images',
+                         condition=Q(content_type__startswith='image/')),
+            models.Index(fields=['email', 'id'], name='attachment_email_images',
+                         condition=Q(content_type__startswith='image/')),
+            GinIndex(OpClass(Upper('filename'), name='gin_trgm_ops'), name='attachment_filename_trgm'),
         ]
     @property
     def is_image(self):
         return self.content_type.startswith('image/') if self.content_type else False
+
+    @property
+    def is_pdf(self):
+        return self.content_type == 'application/pdf'
+
+    def get_thumbnail_url(self, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+        """
+        URL of a thumbnail of this image, None for other files.
+        Until generated, points to the view creating it on first request.
+        """
+        if not self.is_image or not self.has_valid_file:
+            return None
+        fmt = thumbnail_format(fmt)
+        if self.has_thumbnails:
+            return thumbnail_url(self.pk, size, fmt)
+        return reverse('inventory:attachment_thumbnail', args=[self.pk, size, fmt])
+
+    @property
+    def thumbnail_url(self):
+        return self.get_thumbnail_url()
     def __str__(self):
         return f"Response : {self.response} payload :{self.payload} "
     def query_vision_ai(self, model_name, prompt):
@@ -197,6 +367,12 @@ class AIImgdescription(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Latest description of an attachment
+            models.Index(fields=['attachment', 'created_at'], name='aiimgdesc_attachment_created'),
+        ]
+
     def __str__(self):
         #return f"{self.filename} ({self.get_source_display()})"
         return f"AI Description for {self.attachment.filename}"
@@ -248,4 +424,50 @@ class ListingLBC(models.Model):
         choices=CATEGORY_CHOICES,
         default='ordinateurs'
     )
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    source_fingerprint = models.CharField(
+        max_length=32,
+        blank=True,
+        default='',
+        help_text="Fingerprint of the item AI analyses the listing was generated from"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class Counter(models.Model):
+    """Statistic kept up to date instead of counted on each page, see services.counters."""
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+class Upload(models.Model):
+    """Chunked attachment upload in progress, see services.uploads."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField(help_text="Declared file size in bytes")
+    received = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Bytes written so far, the offset of the next chunk"
+    )
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="Expected SHA-256 of the file, checked on completion if given"
+    )
+    item = models.ForeignKey(Item, related_name='uploads', on_delete=models.CASCADE, null=True, blank=True)
+    attachment = models.ForeignKey(
+        Attachment,
+        related_name='+',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text="Attachment created on completion"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.filename} ({self.received}/{self.size})"
@@ -0,0 +1,215 @@
+"""
+Keyset pagination for the inventory views and API.
+Pages are selected with a WHERE clause on the ordering columns of the row at
+the page boundary instead of OFFSET, so deep pages cost the same as the first
+one.
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+# Result sets the planner expects to be larger than this are not counted exactly
+EXACT_COUNT_LIMIT = 1000
+
+class InvalidCursor(ValueError):
+    """Raised for cursors that were not produced by the paginator."""
+
+@dataclass
+class KeysetPage:
+    object_list: List
+    next_cursor: Optional[str]
+    previous_cursor: Optional[str] = None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by a unique ordering, e.g. ('-created_at', '-id').
+
+    The ordering must end with a unique column and its columns must not be
+    null. They may be annotations, as long as their values survive a JSON
+    round trip. Cursors point after (or, for previous pages, before) the row
+    they were made from.
+    """
+
+    def __init__(self, queryset: QuerySet, ordering: Sequence[str] = ('-created_at', '-id'),
+                 per_page: int = 25):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+        self.per_page = per_page
+
+    def encode_cursor(self, obj, reverse: bool = False) -> str:
+        values = [getattr(obj, name) for name, _ in self.fields]
+        payload = json.dumps({'v': values, 'r': reverse}, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor: str) -> Tuple[List, bool]:
+        """
+        Values are converted by the field, or annotation output field, of
+        their ordering column, so a tampered cursor cannot reach the query.
+
+        Returns:
+            tuple: (ordering values, whether the cursor points backwards)
+
+        Raises:
+            InvalidCursor: If the cursor was not made for this ordering
+        """
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values, reverse = payload['v'], bool(payload['r'])
+        except (ValueError, TypeError, KeyError):
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+
+        decoded = []
+        for (name, _), value in zip(self.fields, values):
+            field = self.ordering_field(name)
+            try:
+                value = field.to_python(value) if field is not None else value
+            except (ValidationError, TypeError, ValueError):
+                raise InvalidCursor(cursor)
+            # Ordering columns are not null, and JSON containers are no column values
+            if value is None or isinstance(value, (list, dict)):
+                raise InvalidCursor(cursor)
+            decoded.append(value)
+        return decoded, reverse
+
+    def ordering_field(self, name: str):
+        """Model field, or output field of the annotation, an ordering column is read from."""
+        try:
+            return self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            annotation = self.queryset.query.annotations.get(name)
+            return annotation.output_field if annotation is not None else None
+
+    def after(self, values: Sequence, reverse: bool = False) -> Q:
+        """Rows following `values` in the ordering, or preceding them if `reverse`."""
+        condition, equal = Q(), Q()
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def page(self, cursor: Optional[str] = None) -> KeysetPage:
+        """
+        Fetch the page designated by `cursor`, the first page if None.
+
+        Raises:
+            InvalidCursor: If the cursor cannot be decoded
+        """
+        if not cursor:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            object_list = rows[:self.per_page]
+            next_cursor = self.encode_cursor(object_list[-1]) if len(rows) > self.per_page else None
+            return KeysetPage(object_list, next_cursor)
+
+        values, reverse = self.decode_cursor(cursor)
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(name[1:] if name.startswith('-') else f"-{name}" for name in ordering)
+        rows = list(self.queryset
+                    .order_by(*ordering)
+                    .filter(self.after(values, reverse))[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        object_list = rows[:self.per_page]
+        if reverse:
+            object_list.reverse()
+        if not object_list:
+            return KeysetPage(object_list, None)
+
+        # Coming from a neighbouring page, the other direction always has rows
+        next_cursor = self.encode_cursor(object_list[-1]) if more or reverse else None
+        previous_cursor = self.encode_cursor(object_list[0], reverse=True) if more or not reverse else None
+        return KeysetPage(object_list, next_cursor, previous_cursor)
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination for the API on a composite (..., id) keyset.
+
+    The ordering is the one the filter backends left on the queryset, e.g.
+    `?ordering=` or search relevance, completed with the primary key so
+    cursors stay exact when the leading columns tie.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_keyset_ordering(self, queryset: QuerySet, view=None) -> Tuple[str, ...]:
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ['-pk']
+        if not all(isinstance(name, str) and '__' not in name for name in ordering):
+            ordering = getattr(view, 'ordering', None) or ['-pk']
+        ordering = tuple('-id' if name == '-pk' else 'id' if name == 'pk' else name for name in ordering)
+        if not {'id', '-id'} & set(ordering):
+            ordering += ('-id' if ordering[-1].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        paginator = KeysetPaginator(queryset, self.get_keyset_ordering(queryset, view), self.page_size)
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound(self.invalid_cursor_message)
+        self.base_url = request.build_absolute_uri()
+        self.has_next = self.page.has_next
+        self.has_previous = self.page.has_previous
+        return self.page.object_list
+
+    def _link(self, cursor: Optional[str]) -> Optional[str]:
+        if cursor is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor)
+
+    def get_html_context(self):
+        return {
+            'previous_url': self.get_previous_link(),
+            'next_url': self.get_next_link(),
+        }
+
+def estimated_count(queryset: QuerySet, exact_below: int = EXACT_COUNT_LIMIT) -> Tuple[int, bool]:
+    """
+    Count a result set, trusting the planner for large ones.
+
+    The query is EXPLAINed first; when the planner expects fewer than
+    `exact_below` rows they are counted, otherwise the estimate is returned.
+
+    Returns:
+        tuple: (count, whether the count is an estimate)
+    """
+    queryset = queryset.order_by()
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    if estimate < exact_below:
+        return queryset.count(), False
+    return estimate, True
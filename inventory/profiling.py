@@ -0,0 +1,219 @@
+"""
+Per-request profiling, enabled by REQUEST_PROFILING.
+RequestProfilingMiddleware records for each request its SQL queries (count,
+time, statements repeated with the same shape), template rendering time and
+time spent in AI API calls (see `ai_call`). They are sent back in a
+Server-Timing header, logged as one JSON line by the `inventory.profiling`
+logger, and added to a rolling in-process summary of the slowest endpoints,
+shown to staff at /profiling/.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import ExitStack, contextmanager
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+# Endpoints kept in the summary, the least recently requested are dropped
+MAX_ENDPOINTS = 200
+# Latest durations per endpoint the percentiles are computed on
+WINDOW = 100
+# Repeated query shapes listed per request
+MAX_DUPLICATES = 5
+
+_current = threading.local()
+
+class RequestProfile:
+    """What one request spent its time on, in milliseconds."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.fingerprints = Counter()
+        self.template_ms = 0.0
+        self.ai_ms = 0.0
+        self.ai_calls = 0
+        self.template_depth = 0
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def duplicates(self) -> Dict[str, int]:
+        """Query shapes run more than once, most repeated first."""
+        return {sql: count for sql, count in self.fingerprints.most_common(MAX_DUPLICATES) if count > 1}
+
+def current_profile() -> Optional[RequestProfile]:
+    """Profile of the request handled by this thread, None if not profiled."""
+    return getattr(_current, 'profile', None)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+
+def fingerprint(sql: str) -> str:
+    """Shape of a statement: literals and IN lists collapsed, so N+1 queries share one."""
+    return _IN_LISTS.sub('IN (...)', _LITERALS.sub('?', sql))
+
+def _record_query(execute, sql, params, many, context):
+    profile = current_profile()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.sql_ms += (time.perf_counter() - started) * 1000
+        profile.fingerprints[fingerprint(sql)] += 1
+
+@contextmanager
+def ai_call():
+    """Count the time of an external AI API call against the current request, if profiled."""
+    profile = current_profile()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.ai_ms += (time.perf_counter() - started) * 1000
+            profile.ai_calls += 1
+
+_template_render = Template.render
+
+def _timed_render(self, context=None, request=None):
+    profile = current_profile()
+    if profile is None:
+        return _template_render(self, context, request)
+    # Templates rendered while rendering another one are already counted
+    profile.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _template_render(self, context, request)
+    finally:
+        profile.template_depth -= 1
+        if not profile.template_depth:
+            profile.template_ms += (time.perf_counter() - started) * 1000
+
+class EndpointStats:
+    """Rolling statistics of one endpoint."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.durations = deque(maxlen=WINDOW)
+
+    def add(self, duration_ms: float, queries: int) -> None:
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.queries += queries
+        self.durations.append(duration_ms)
+
+    def percentile(self, fraction: float) -> float:
+        ordered = sorted(self.durations)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+_endpoints: 'OrderedDict[str, EndpointStats]' = OrderedDict()
+_endpoints_lock = threading.Lock()
+
+def record_endpoint(endpoint: str, duration_ms: float, queries: int) -> None:
+    with _endpoints_lock:
+        stats = _endpoints.pop(endpoint, None) or EndpointStats()
+        stats.add(duration_ms, queries)
+        _endpoints[endpoint] = stats
+        while len(_endpoints) > MAX_ENDPOINTS:
+            _endpoints.popitem(last=False)
+
+def slowest_endpoints(limit: int = 50) -> List[Dict]:
+    """Endpoints of this process by decreasing 95th percentile duration."""
+    with _endpoints_lock:
+        rows = [
+            {
+                'endpoint': endpoint,
+                'count': stats.count,
+                'avg_ms': round(stats.total_ms / stats.count, 1),
+                'p50_ms': round(stats.percentile(0.5), 1),
+                'p95_ms': round(stats.percentile(0.95), 1),
+                'max_ms': round(stats.max_ms, 1),
+                'avg_queries': round(stats.queries / stats.count, 1),
+            }
+            for endpoint, stats in _endpoints.items()
+        ]
+    return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)[:limit]
+
+def reset_endpoints() -> None:
+    with _endpoints_lock:
+        _endpoints.clear()
+
+def endpoint_name(request) -> str:
+    """Method and URL pattern of a request, the same for every object it is called on."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return f"{request.method} <unresolved>"
+    return f"{request.method} /{match.route}"
+
+def server_timing(profile: RequestProfile, total_ms: float) -> str:
+    duplicates = sum(count - 1 for count in profile.fingerprints.values() if count > 1)
+    metrics = [
+        f'db;dur={profile.sql_ms:.1f};desc="{profile.queries} queries, {duplicates} repeated"',
+        f'tpl;dur={profile.template_ms:.1f};desc="Templates"',
+        f'ai;dur={profile.ai_ms:.1f};desc="{profile.ai_calls} AI calls"',
+        f'total;dur={total_ms:.1f}',
+    ]
+    return ', '.join(metrics)
+
+class RequestProfilingMiddleware:
+    """
+    Profile every request, see the module docstring. Placed first in
+    MIDDLEWARE so the total covers the other middleware.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        Template.render = _timed_render
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        _current.profile = profile
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_record_query))
+                response = self.get_response(request)
+        finally:
+            _current.profile = None
+
+        total_ms = profile.total_ms
+        response['Server-Timing'] = server_timing(profile, total_ms)
+        endpoint = endpoint_name(request)
+        record_endpoint(endpoint, total_ms, profile.queries)
+
+        slow = total_ms >= getattr(settings, 'REQUEST_PROFILING_SLOW_MS', 500)
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps({
+            'endpoint': endpoint,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'queries': profile.queries,
+            'sql_ms': round(profile.sql_ms, 1),
+            'duplicate_queries': profile.duplicates(),
+            'template_ms': round(profile.template_ms, 1),
+            'ai_ms': round(profile.ai_ms, 1),
+            'ai_calls': profile.ai_calls,
+        }))
+        return response
@@ -0,0 +1,63 @@
+"""
+JSON renderer and parser for the inventory API backed by orjson.
+Both fall back to DRF's stdlib json implementation when orjson is not
+installed, or for requests it cannot handle the same way (indented output,
+non UTF-8 bodies), so responses stay byte-compatible with JSONRenderer.
+"""
+
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Characters DRF escapes so responses can be embedded in <script> tags
+_JS_ESCAPES = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer using orjson for compact output.
+
+    Datetimes, decimals, lazy strings and other non-JSON types are handed to
+    DRF's encoder, so they are formatted exactly as with JSONRenderer.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.encoder = self.encoder_class()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        for char, escape in _JS_ESCAPES:
+            if char in ret:
+                ret = ret.replace(char, escape)
+        return ret
+
+class ORJSONParser(JSONParser):
+    """JSONParser using orjson for UTF-8 request bodies."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
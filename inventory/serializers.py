@@ -1,22 +1,79 @@
+import re
+
+from django.conf import settings
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Item, ListingLBC, QRCode, Label, Email, Attachment
+from rest_framework.permissions import SAFE_METHODS
+from .models import Item, ListingLBC, QRCode, Label, Email, Attachment, Upload
+from .services.listings import API_BATCH_LIMIT
+
+def query_param_list(request, name):
+    """Names given to a comma separated query parameter, e.g. ?fields=id,description."""
+    value = request.query_params.get(name, '') if request else ''
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+class SparseFieldsMixin:
+    """
+    `?fields=` and `?expand=` for the top-level serializer of a response.
+
+    `fields` keeps only the listed fields on reads. `expand` replaces the
+    compact fields named in `expandable_fields` (ids or counts) by their
+    nested representation; the viewsets prefetch what is expanded.
+    """
+    # Field name -> (serializer class, keyword arguments)
+    expandable_fields = {}
+
+    def is_top_level(self):
+        parent = self.parent
+        return parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or not self.is_top_level():
+            return fields
+
+        for name in query_param_list(request, 'expand'):
+            if name in self.expandable_fields:
+                serializer_class, kwargs = self.expandable_fields[name]
+                fields[name] = serializer_class(read_only=True, **kwargs)
 
-class AttachmentSerializer(serializers.ModelSerializer):
+        only = query_param_list(request, 'fields')
+        if only and request.method in SAFE_METHODS:
+            fields = type(fields)((name, field) for name, field in fields.items() if name in only)
+        return fields
+
+class AttachmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     download_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Attachment
         fields = ['id', 'filename', 'content_type', 'size', 'created_at', 
-                 'is_image', 'is_pdf', 'download_url']
+                 'is_image', 'is_pdf', 'download_url', 'thumbnail_url']
         read_only_fields = ['size', 'content_type', 'is_image', 'is_pdf']
 
     def get_download_url(self, obj):
         request = self.context.get('request')
         if request and obj.file:
-            return request.build_absolute_uri(obj.file.url)
+            return request.build_absolute_uri(reverse('inventory:attachment_download', args=[obj.pk]))
         return None
 
-class EmailSerializer(serializers.ModelSerializer):
+    def get_thumbnail_url(self, obj):
+        request = self.context.get('request')
+        url = obj.thumbnail_url
+        if request and url:
+            return request.build_absolute_uri(url)
+        return url
+
+class AttachmentListSerializer(AttachmentSerializer):
+    """Attachments in lists: links to the item and email instead of flags."""
+
+    class Meta(AttachmentSerializer.Meta):
+        fields = ['id', 'filename', 'content_type', 'size', 'created_at',
+                  'item', 'email', 'download_url', 'thumbnail_url']
+
+class EmailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     attachments = AttachmentSerializer(many=True, read_only=True)
     
     class Meta:
@@ -24,6 +81,18 @@ class EmailSerializer(serializers.ModelSerializer):
         fields = ['id', 'subject', 'sender', 'recipients', 'body', 
                  'thread_id', 'sent_at', 'created_at', 'attachments']
 
+class EmailListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Emails in lists: no body, attachments counted unless expanded."""
+    attachment_count = serializers.IntegerField(read_only=True)
+    expandable_fields = {
+        'attachments': (AttachmentSerializer, {'many': True}),
+    }
+
+    class Meta:
+        model = Email
+        fields = ['id', 'subject', 'sender', 'thread_id', 'sent_at', 'created_at',
+                  'item', 'attachment_count']
+
 class QRCodeSerializer(serializers.ModelSerializer):
     class Meta:
         model = QRCode
@@ -34,7 +103,7 @@ class LabelSerializer(serializers.ModelSerializer):
         model = Label
         fields = ['id', 'name', 'created_at']
 
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     qr_codes = QRCodeSerializer(many=True, read_only=True)
     labels = LabelSerializer(many=True, read_only=True)
     emails = EmailSerializer(many=True, read_only=True)
@@ -108,7 +177,65 @@ class ItemSerializer(serializers.ModelSerializer):
         
         return instance
 
+class ItemListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Items in lists: label ids, QR codes and counts. Related objects are
+    nested with ?expand=emails,attachments,labels,qr_codes.
+    """
+    qr_codes = serializers.SlugRelatedField(many=True, read_only=True, slug_field='code')
+    labels = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    email_count = serializers.IntegerField(read_only=True)
+    attachment_count = serializers.IntegerField(read_only=True)
+    expandable_fields = {
+        'qr_codes': (QRCodeSerializer, {'many': True}),
+        'labels': (LabelSerializer, {'many': True}),
+        'emails': (EmailListSerializer, {'many': True}),
+        'attachments': (AttachmentSerializer, {'many': True}),
+    }
+
+    class Meta:
+        model = Item
+        fields = ['id', 'description', 'created_at', 'updated_at',
+                  'qr_codes', 'labels', 'email_count', 'attachment_count']
+
 class ListingLBCSerializer(serializers.ModelSerializer):
     class Meta:
         model = ListingLBC
         fields = ['id', 'item', 'title', 'price', 'description', 'category']
+
+class ListingBatchSerializer(serializers.Serializer):
+    """Input of POST /api/listings/generate_batch/."""
+    item_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=API_BATCH_LIMIT,
+        default=API_BATCH_LIMIT,
+        error_messages={'max_value': f"At most {API_BATCH_LIMIT} items per request, "
+                                     f"use the generate_listings command for more"}
+    )
+    force = serializers.BooleanField(default=False)
+
+class UploadSerializer(serializers.ModelSerializer):
+    """Chunked upload, see services.uploads."""
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Upload
+        fields = ['id', 'filename', 'content_type', 'size', 'sha256', 'item',
+                  'received', 'chunk_size', 'attachment', 'created_at']
+        read_only_fields = ['received', 'attachment', 'created_at']
+
+    def get_chunk_size(self, obj):
+        """Largest chunk accepted per request."""
+        return settings.UPLOAD_CHUNK_SIZE
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Size must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes")
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if value and not re.fullmatch(r'[0-9a-f]{64}', value):
+            raise serializers.ValidationError("Expected a hexadecimal SHA-256 digest")
+        return value
@@ -0,0 +1,140 @@
+"""
+Aggregation helpers for building item-level text from attachment AI descriptions.
+Provides fingerprints of the description set an item was summarized from, so
+aggregation commands only reprocess items whose inputs changed.
+"""
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import CharField, F, Max, Min, OuterRef, Q, QuerySet, Subquery, TextField, Value
+from django.db.models.functions import Cast, Coalesce, Concat, MD5, Now
+
+from inventory.models import AIImgdescription, Item
+from inventory.services.search import update_item_search_vectors
+
+def contributing_descriptions() -> QuerySet:
+    """AI image descriptions that feed an item's aggregated description."""
+    return (AIImgdescription.objects
+            .filter(attachment__item__isnull=False)
+            .exclude(Q(response__isnull=True) | Q(response='')))
+
+def source_fingerprint(salt: str = ''):
+    """
+    Aggregate expression hashing the ids and contents of a description group.
+
+    Args:
+        salt: Mixed into the hash so different aggregation modes (or prompts)
+              writing the same field do not share fingerprints
+
+    Returns:
+        Expression evaluating to a 32 character hex digest
+    """
+    return MD5(Concat(
+        Value(salt),
+        StringAgg(
+            Concat(
+                Cast('id', CharField()),
+                Value(':'),
+                MD5(Coalesce('response', Value(''), output_field=TextField())),
+                output_field=CharField()
+            ),
+            delimiter=',',
+            ordering=('id',)
+        ),
+        output_field=CharField()
+    ))
+
+def _per_item(expression, output_field) -> Subquery:
+    """Correlated subquery evaluating an aggregate over the outer item's descriptions."""
+    return Subquery(
+        contributing_descriptions()
+        .filter(attachment__item=OuterRef('pk'))
+        .order_by()
+        .values('attachment__item')
+        .annotate(value=expression)
+        .values('value'),
+        output_field=output_field
+    )
+
+def fingerprint_subquery(salt: str = '') -> Subquery:
+    """Per-item source fingerprint, for annotate() or update()."""
+    return _per_item(source_fingerprint(salt), CharField())
+
+def aggregated_text_subquery() -> Subquery:
+    """
+    Per-item concatenation of descriptions, same format as the
+    aggregate_item_descriptions per-item mode.
+    """
+    return _per_item(
+        StringAgg(
+            Concat(Value('Attachment description:\n', output_field=TextField()), 'response'),
+            delimiter='\n\n',
+            ordering=('id',),
+            output_field=TextField()
+        ),
+        TextField()
+    )
+
+def with_source_fingerprint(items: QuerySet, salt: str = '') -> QuerySet:
+    """
+    Annotate items with the fingerprint of their current AI descriptions.
+
+    Items without any description get a NULL `source_fingerprint`.
+    """
+    return items.annotate(source_fingerprint=fingerprint_subquery(salt))
+
+def stale_items(items: QuerySet, salt: str = '', force: bool = False) -> QuerySet:
+    """
+    Select items whose stored fingerprint no longer matches their sources.
+
+    Args:
+        items: Item queryset to check
+        salt: Aggregation mode identifier, see source_fingerprint
+        force: Keep every item that has descriptions, regardless of fingerprint
+
+    Returns:
+        QuerySet: items to reprocess, annotated with `source_fingerprint`
+    """
+    queryset = with_source_fingerprint(items, salt).filter(source_fingerprint__isnull=False)
+    if not force:
+        queryset = queryset.exclude(ai_description_fingerprint=F('source_fingerprint'))
+    return queryset
+
+def bulk_aggregate(items: QuerySet, salt: str = '', force: bool = False,
+                   batch_size: int = 10000) -> int:
+    """
+    Rebuild aggregated descriptions with set-based UPDATE statements.
+
+    Each batch selects the stale items of an id range, then rewrites them
+    with one `UPDATE ... SET ai_aggregated_description = (SELECT
+    string_agg(...))`. Bulk updates bypass signals, so the search vectors
+    and cached cards of the rewritten items are refreshed here.
+
+    Args:
+        items: Item queryset to process
+        salt: Aggregation mode identifier, see source_fingerprint
+        force: Rewrite items even if their fingerprint is unchanged
+        batch_size: Width of the item id range updated per statement
+
+    Returns:
+        int: Number of items updated
+    """
+    bounds = items.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return 0
+
+    stale = stale_items(items, salt=salt, force=force)
+    updated = 0
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        # Only the rows rewritten get new search vectors and cache versions
+        ids = list(stale.filter(id__gte=start, id__lt=start + batch_size).values_list('id', flat=True))
+        if not ids:
+            continue
+        changed = Item.objects.filter(id__in=ids)
+        updated += changed.update(
+            ai_aggregated_description=aggregated_text_subquery(),
+            ai_description_fingerprint=fingerprint_subquery(salt),
+            updated_at=Now()
+        )
+        update_item_search_vectors(changed, batch_size=batch_size)
+        changed.bump_cache_version()
+    return updated
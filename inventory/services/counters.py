@@ -0,0 +1,100 @@
+"""
+Statistics shown above the email and attachment lists.
+Counting them on every page load is linear in the table sizes, so they are
+kept in the Counter table instead: inventory.signals applies the change of
+each insert, update and delete once its transaction commits, and
+`refresh_counters` recomputes them from scratch (after migrating, then
+periodically through the refresh_counters command to correct drift from bulk
+operations that bypass signals).
+"""
+
+from typing import Callable, Dict, Iterable, Optional
+
+from django.db import transaction
+from django.db.models import F
+
+from inventory.models import Attachment, Counter, Email
+
+# Content types counted as documents in the attachment statistics
+DOCUMENT_CONTENT_TYPES = ['application/pdf', 'application/msword']
+
+EMAILS = 'emails'
+EMAILS_WITH_ATTACHMENTS = 'emails_with_attachments'
+EMAILS_WITH_ITEMS = 'emails_with_items'
+ATTACHMENTS = 'attachments'
+IMAGE_ATTACHMENTS = 'image_attachments'
+DOCUMENT_ATTACHMENTS = 'document_attachments'
+
+# Exact computation of each counter
+COUNTERS: Dict[str, Callable[[], int]] = {
+    EMAILS: lambda: Email.objects.count(),
+    EMAILS_WITH_ATTACHMENTS: lambda: Email.objects.filter(attachments__isnull=False).distinct().count(),
+    EMAILS_WITH_ITEMS: lambda: Email.objects.filter(item__isnull=False).count(),
+    ATTACHMENTS: lambda: Attachment.objects.count(),
+    IMAGE_ATTACHMENTS: lambda: Attachment.objects.filter(content_type__startswith='image/').count(),
+    DOCUMENT_ATTACHMENTS: lambda: Attachment.objects.filter(content_type__in=DOCUMENT_CONTENT_TYPES).count(),
+}
+
+def refresh_counters(names: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """
+    Recompute counters from the tables they count.
+
+    Args:
+        names: Counters to refresh, all of them if None
+
+    Returns:
+        dict: New value of each refreshed counter
+    """
+    values = {name: COUNTERS[name]() for name in (names or COUNTERS)}
+    for name, value in values.items():
+        Counter.objects.update_or_create(name=name, defaults={'value': value})
+    return values
+
+def get_counters(*names: str) -> Dict[str, int]:
+    """Read counters in one query, computing those never refreshed yet."""
+    values = dict(Counter.objects.filter(name__in=names).values_list('name', 'value'))
+    missing = [name for name in names if name not in values]
+    if missing:
+        values.update(refresh_counters(missing))
+    return values
+
+def increment(deltas: Dict[str, int]) -> None:
+    """
+    Apply non-zero deltas once the current transaction commits, so the hot
+    Counter rows are not locked for the rest of it and a rollback leaves
+    them alone. Counters that do not exist yet are computed.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if deltas:
+        transaction.on_commit(lambda: _apply(deltas))
+
+def _apply(deltas: Dict[str, int]) -> None:
+    # One short autocommit update per row, always in the same order
+    for name in sorted(deltas):
+        if not Counter.objects.filter(name=name).update(value=F('value') + deltas[name]):
+            # Counted after the change, which is already in the table
+            refresh_counters([name])
+
+def attachment_deltas(content_type: str, email_id: Optional[int], attachment_id: int, sign: int) -> Dict[str, int]:
+    """
+    Counter changes for an attachment being added (sign 1) or removed (sign -1).
+
+    The attachment's email gains or loses "with attachments" when it is its
+    only attachment, `attachment_id` itself being ignored in the check.
+    """
+    content_type = content_type or ''
+    deltas = {
+        ATTACHMENTS: sign,
+        IMAGE_ATTACHMENTS: sign if content_type.startswith('image/') else 0,
+        DOCUMENT_ATTACHMENTS: sign if content_type in DOCUMENT_CONTENT_TYPES else 0,
+    }
+    if email_id and not Attachment.objects.filter(email_id=email_id).exclude(pk=attachment_id).exists():
+        deltas[EMAILS_WITH_ATTACHMENTS] = sign
+    return deltas
+
+def merge_deltas(*changes: Dict[str, int]) -> Dict[str, int]:
+    merged: Dict[str, int] = {}
+    for change in changes:
+        for name, delta in change.items():
+            merged[name] = merged.get(name, 0) + delta
+    return merged
@@ -0,0 +1,113 @@
+"""
+Streaming export of the item catalogue as NDJSON or CSV.
+Items are read through a server-side cursor (`iterator(chunk_size=...)`),
+their QR codes and labels aggregated into arrays by the same query, so an
+export uses constant memory whatever the size of the catalogue. Used by the
+/api/items/export/<format>/ endpoint and the export_items command.
+"""
+
+import csv
+import json
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.db.models import CharField, F, OuterRef, QuerySet, Subquery
+
+from inventory.models import Item, Label, QRCode
+
+# Columns of an export, in order
+EXPORT_FIELDS = ['id', 'description', 'created_at', 'updated_at', 'qr_codes', 'labels', 'ai_description']
+
+# Rows fetched per round trip of the server-side cursor
+CHUNK_SIZE = 2000
+
+# Rows joined into each chunk written to the response or file
+BLOCK_SIZE = 500
+
+# Separator of list values inside a CSV cell
+CSV_LIST_SEPARATOR = '|'
+
+def _related_array(queryset: QuerySet, group_by: str, field: str):
+    """Correlated, sorted array of `field` over the related rows, NULL if none."""
+    return Subquery(
+        queryset
+        .order_by()
+        .values(group_by)
+        .annotate(values=ArrayAgg(field, ordering=field))
+        .values('values'),
+        output_field=ArrayField(CharField()),
+    )
+
+def export_rows(items: Optional[QuerySet] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Export rows of items, one query streamed through a server-side cursor.
+
+    Args:
+        items: Items to export, all of them by id if None
+        chunk_size: Rows fetched per round trip
+    """
+    if items is None:
+        items = Item.objects.order_by('id')
+    rows = items.annotate(
+        export_qr_codes=_related_array(QRCode.objects.filter(item=OuterRef('pk')), 'item', 'code'),
+        export_labels=_related_array(Label.objects.filter(items=OuterRef('pk')), 'items', 'name'),
+        ai_description=F('latest_ai_description__response'),
+    ).values('id', 'description', 'created_at', 'updated_at',
+             'export_qr_codes', 'export_labels', 'ai_description')
+
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield {
+            'id': row['id'],
+            'description': row['description'],
+            'created_at': row['created_at'].isoformat(),
+            'updated_at': row['updated_at'].isoformat(),
+            'qr_codes': row['export_qr_codes'] or [],
+            'labels': row['export_labels'] or [],
+            'ai_description': row['ai_description'],
+        }
+
+def _blocks(lines: Iterable[str], size: int = BLOCK_SIZE) -> Iterator[str]:
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= size:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+def ndjson_chunks(rows: Iterable[Dict]) -> Iterator[str]:
+    """One JSON object per line."""
+    return _blocks(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n' for row in rows)
+
+class _Line:
+    """File-like object handing back what csv.writer writes."""
+
+    def write(self, value: str) -> str:
+        return value
+
+def csv_chunks(rows: Iterable[Dict]) -> Iterator[str]:
+    """CSV with a header, list values joined by CSV_LIST_SEPARATOR."""
+    writer = csv.writer(_Line())
+
+    def lines():
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow([
+                CSV_LIST_SEPARATOR.join(value) if isinstance(value, list) else value
+                for value in (row[field] for field in EXPORT_FIELDS)
+            ])
+
+    return _blocks(lines())
+
+# Format name -> (content type, chunk generator)
+EXPORT_FORMATS: Dict[str, Tuple[str, Callable[[Iterable[Dict]], Iterator[str]]]] = {
+    'ndjson': ('application/x-ndjson', ndjson_chunks),
+    'csv': ('text/csv', csv_chunks),
+}
+
+def export_chunks(fmt: str, items: Optional[QuerySet] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Chunks of text of an export in `fmt`, one of EXPORT_FORMATS."""
+    _, chunks = EXPORT_FORMATS[fmt]
+    return chunks(export_rows(items, chunk_size))
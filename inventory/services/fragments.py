@@ -0,0 +1,66 @@
+"""
+Cached HTML of item cards.
+Each card is rendered once and cached under the item id, its `cache_version`
+(bumped by inventory.signals whenever something a card shows changes) and a
+digest of the labels offered in the card's dropdown. Outdated entries are
+never read again and expire on their own, so nothing needs deleting.
+"""
+
+import hashlib
+from typing import Iterable, List
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from inventory import metrics
+from inventory.models import Item, card_prefetches
+
+ITEM_CARD_TEMPLATE = 'inventory/partials/item_card.html'
+ITEM_PAGE_CARD_TEMPLATE = 'inventory/partials/item_page_card.html'
+
+# Seconds a card stays cached, outdated versions are simply left to expire
+CARD_TIMEOUT = 24 * 60 * 60
+
+def fragment_cache():
+    return caches['template_fragments' if 'template_fragments' in settings.CACHES else 'default']
+
+def labels_version(labels: Iterable) -> str:
+    """Digest of the labels list shared by every card."""
+    digest = hashlib.md5()
+    for label in labels:
+        digest.update(f"{label.pk}:{label.name}\n".encode())
+    return digest.hexdigest()
+
+def item_card_key(template_name: str, item: Item, labels_digest: str) -> str:
+    return f"card:{template_name}:{item.pk}:{item.cache_version}:{labels_digest}"
+
+def render_item_cards(items: List[Item], labels: Iterable, template_name: str = ITEM_CARD_TEMPLATE) -> None:
+    """
+    Set `card_html` on each item, from the cache when possible.
+
+    Items must come from `with_card_data(prefetch=False)`: labels and image
+    attachments are only prefetched for the cards that have to be rendered.
+    """
+    labels = list(labels)
+    digest = labels_version(labels)
+    keys = {item_card_key(template_name, item, digest): item for item in items}
+    cache = fragment_cache()
+    cached = cache.get_many(list(keys))
+
+    missing = {key: item for key, item in keys.items() if key not in cached}
+    metrics.CACHE_REQUESTS.labels('item_card', 'hit').inc(len(cached))
+    metrics.CACHE_REQUESTS.labels('item_card', 'miss').inc(len(missing))
+    if missing:
+        prefetch_related_objects(list(missing.values()), *card_prefetches())
+        rendered = {
+            key: render_to_string(template_name, {'item': item, 'all_labels': labels})
+            for key, item in missing.items()
+        }
+        cache.set_many(rendered, CARD_TIMEOUT)
+        cached.update(rendered)
+
+    for key, item in keys.items():
+        item.card_html = mark_safe(cached[key])
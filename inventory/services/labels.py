@@ -0,0 +1,170 @@
+"""
+Bulk label operations in a fixed number of statements.
+Labels are created with one INSERT ignoring existing names, and a label is
+added to or removed from any set of items, given by ids or by the criteria
+of the items list (a search, other labels), with one INSERT ... SELECT or
+DELETE on the through table, however many items match. The m2m_changed
+signal is then sent once with the affected ids, as Django does, so search
+vectors and cached cards follow. The labels page names a few items of each
+label, read with one windowed query rather than every item it carries.
+"""
+
+from typing import Iterable, List, Optional, Tuple
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed
+
+from inventory.models import Item, Label
+from inventory.services.search import search
+
+NAME_MAX_LENGTH = Label._meta.get_field('name').max_length
+
+# Items named under each label of the labels page
+PREVIEW_SIZE = 5
+
+def clean_names(names: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """
+    Stripped, distinct label names in order, and errors for the invalid ones.
+
+    Returns:
+        tuple: (names, errors)
+    """
+    cleaned, errors = [], []
+    for name in names:
+        name = name.strip() if isinstance(name, str) else ''
+        if not name:
+            errors.append("Label name is required")
+        elif len(name) > NAME_MAX_LENGTH:
+            errors.append(f"Label name '{name}' exceeds {NAME_MAX_LENGTH} characters")
+        elif name not in cleaned:
+            cleaned.append(name)
+    return cleaned, errors
+
+def create_labels(names: List[str]) -> Tuple[List[Label], List[Label]]:
+    """
+    Create the labels of `names` that do not exist yet.
+
+    Returns:
+        tuple: (created labels, labels that already existed), ordered by name
+    """
+    existing = set(Label.objects.filter(name__in=names).values_list('name', flat=True))
+    Label.objects.bulk_create([Label(name=name) for name in names if name not in existing], ignore_conflicts=True)
+    created, found = [], []
+    for label in Label.objects.filter(name__in=names).order_by('name'):
+        (found if label.name in existing else created).append(label)
+    return created, found
+
+def select_items(item_ids: Optional[Iterable] = None, search_text: str = '',
+                 label_ids: Optional[Iterable] = None) -> QuerySet:
+    """
+    Items matching every criterion given.
+
+    Args:
+        item_ids: Ids of the items
+        search_text: Full-text search, as `?search=` of the items list
+        label_ids: Labels the items carry, any of them
+
+    Raises:
+        ValueError: If no criterion is given, rather than selecting every item
+    """
+    if item_ids is None and not search_text and not label_ids:
+        raise ValueError("Give item_ids or filter criteria (search, labels)")
+    items = Item.objects.all()
+    if item_ids is not None:
+        items = items.filter(pk__in=list(item_ids))
+    if label_ids:
+        items = items.filter(pk__in=Item.labels.through.objects.filter(label__in=list(label_ids)).values('item'))
+    if search_text:
+        items = search(items, search_text)
+    return items
+
+def _through_sql():
+    through = Item.labels.through
+    quote = connection.ops.quote_name
+    return (quote(through._meta.db_table),
+            quote(through._meta.get_field('item').column),
+            quote(through._meta.get_field('label').column))
+
+def _item_ids_sql(items: QuerySet):
+    """SQL selecting the ids of `items`, None if they are known to be empty."""
+    try:
+        return items.order_by().values('pk').query.sql_with_params()
+    except EmptyResultSet:
+        return None
+
+def _changed(label: Label, action: str, item_ids: List[int]) -> None:
+    if item_ids:
+        m2m_changed.send(sender=Item.labels.through, instance=label, action=action, reverse=True,
+                         model=Item, pk_set=set(item_ids), using=connection.alias)
+
+def add_label(label: Label, items: QuerySet) -> List[int]:
+    """
+    Add `label` to `items` in one statement, skipping items that carry it.
+
+    Returns:
+        list: Ids of the items the label was added to
+    """
+    table, item_column, label_column = _through_sql()
+    selected = _item_ids_sql(items)
+    if selected is None:
+        return []
+    item_sql, params = selected
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({item_column}, {label_column}) "
+            f"SELECT selected.id, %s FROM ({item_sql}) AS selected "
+            f"ON CONFLICT DO NOTHING RETURNING {item_column}",
+            (label.pk, *params),
+        )
+        item_ids = sorted(row[0] for row in cursor.fetchall())
+        _changed(label, 'post_add', item_ids)
+    return item_ids
+
+def remove_label(label: Label, items: QuerySet) -> List[int]:
+    """
+    Remove `label` from `items` in one statement.
+
+    Returns:
+        list: Ids of the items the label was removed from
+    """
+    table, item_column, label_column = _through_sql()
+    selected = _item_ids_sql(items)
+    if selected is None:
+        return []
+    item_sql, params = selected
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {label_column} = %s AND {item_column} IN ({item_sql}) "
+            f"RETURNING {item_column}",
+            (label.pk, *params),
+        )
+        item_ids = sorted(row[0] for row in cursor.fetchall())
+        _changed(label, 'post_remove', item_ids)
+    return item_ids
+
+def attach_preview_items(labels: Iterable[Label], size: int = PREVIEW_SIZE) -> None:
+    """
+    Set `preview_items` on each label: its first `size` items by id, for all
+    labels in one query instead of prefetching every item they carry.
+    """
+    labels = list(labels)
+    by_id = {label.pk: label for label in labels}
+    for label in labels:
+        label.preview_items = []
+    if not by_id:
+        return
+    table, item_column, label_column = _through_sql()
+    item_table = connection.ops.quote_name(Item._meta.db_table)
+    items = Item.objects.raw(
+        f"SELECT item.id, item.description, ranked.label_id AS preview_label_id "
+        f"FROM (SELECT {item_column} AS item_id, {label_column} AS label_id, "
+        f"ROW_NUMBER() OVER (PARTITION BY {label_column} ORDER BY {item_column}) AS position "
+        f"FROM {table} WHERE {label_column} = ANY(%s)) AS ranked "
+        f"JOIN {item_table} AS item ON item.id = ranked.item_id "
+        f"WHERE ranked.position <= %s ORDER BY ranked.label_id, ranked.item_id",
+        [list(by_id), size],
+    )
+    for item in items:
+        by_id[item.preview_label_id].preview_items.append(item)
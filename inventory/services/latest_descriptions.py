@@ -0,0 +1,54 @@
+"""
+Pointers from attachments and items to their latest AI description.
+Attachment.latest_ai_description and Item.latest_ai_description are set by
+inventory.signals when a description is created and recomputed when one is
+deleted, so readers join a single row instead of sorting the description
+tables. `backfill_latest_descriptions` sets them for existing data.
+"""
+
+from django.db.models import Max, Min, OuterRef, QuerySet, Subquery
+
+from inventory.models import AIdescription, AIImgdescription
+
+def latest_image_description():
+    """Id of the outer attachment's latest AI description."""
+    return Subquery(AIImgdescription.objects
+                    .filter(attachment=OuterRef('pk'))
+                    .order_by('-created_at', '-id')
+                    .values('id')[:1])
+
+def latest_item_description():
+    """Id of the outer item's latest AI analysis."""
+    return Subquery(AIdescription.objects
+                    .filter(item=OuterRef('pk'))
+                    .order_by('-created_at', '-id')
+                    .values('id')[:1])
+
+def _update_in_batches(queryset: QuerySet, expression, batch_size: int) -> int:
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return 0
+    updated = 0
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        updated += (queryset
+                    .filter(id__gte=start, id__lt=start + batch_size)
+                    .update(latest_ai_description=expression))
+    return updated
+
+def update_latest_image_descriptions(attachments: QuerySet, batch_size: int = 10000) -> int:
+    """
+    Recompute the latest description pointer of attachments, one UPDATE per id range.
+
+    Returns:
+        int: Number of attachments updated
+    """
+    return _update_in_batches(attachments, latest_image_description(), batch_size)
+
+def update_latest_item_descriptions(items: QuerySet, batch_size: int = 10000) -> int:
+    """
+    Recompute the latest AI analysis pointer of items, one UPDATE per id range.
+
+    Returns:
+        int: Number of items updated
+    """
+    return _update_in_batches(items, latest_item_description(), batch_size)
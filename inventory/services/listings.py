@@ -0,0 +1,188 @@
+"""
+Batch generation of LeBonCoin listings.
+Selects items whose AI analysis changed since their last listing, generates
+listings concurrently through the rate-limited scheduler, validates the
+model's JSON and stores the results as ListingLBC rows.
+"""
+
+import json
+import logging
+import unicodedata
+from typing import Dict, Optional
+
+from django.db.models import CharField, F, OuterRef, Q, QuerySet, Subquery
+
+from inventory.models import AIdescription, ListingLBC
+from inventory.services.aggregation import source_fingerprint
+from inventory.services.scheduler import RateLimitedScheduler
+from inventory.services.text import TextService, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Fingerprint salt for listing generation, see services.aggregation
+LISTING_SALT = 'listing'
+
+# Approximate size of TextService.generate_listing's fixed prompt
+LISTING_PROMPT_TOKENS = 300
+
+# Items generated per API request, which waits for the rate-limited calls;
+# larger runs go through the generate_listings command
+API_BATCH_LIMIT = 5
+
+def listing_sources() -> QuerySet:
+    """Item AI analyses a listing is generated from."""
+    return AIdescription.objects.exclude(Q(response__isnull=True) | Q(response=''))
+
+def items_needing_listing(items: QuerySet, force: bool = False) -> QuerySet:
+    """
+    Select items with AI analyses that changed since their latest listing.
+
+    Items never listed are included. The result is annotated with
+    `source_fingerprint` for storing on the generated listing.
+    """
+    fingerprint = (listing_sources()
+                   .filter(item=OuterRef('pk'))
+                   .order_by()
+                   .values('item')
+                   .annotate(value=source_fingerprint(LISTING_SALT))
+                   .values('value'))
+    listed = (ListingLBC.objects
+              .filter(item=OuterRef('pk'))
+              .order_by('-created_at')
+              .values('source_fingerprint')[:1])
+    queryset = (items
+                .annotate(
+                    source_fingerprint=Subquery(fingerprint, output_field=CharField()),
+                    listed_fingerprint=Subquery(listed, output_field=CharField())
+                )
+                .filter(source_fingerprint__isnull=False))
+    if not force:
+        queryset = queryset.filter(
+            Q(listed_fingerprint__isnull=True) |
+            ~Q(listed_fingerprint=F('source_fingerprint'))
+        )
+    return queryset
+
+def _simplify(text: str) -> str:
+    """Lowercase ASCII form used to match category names."""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode()
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in text.lower()).split())
+
+def match_category(*candidates: Optional[str]) -> str:
+    """
+    Map free-text categories from the model onto ListingLBC.CATEGORY_CHOICES.
+
+    Keys and labels are compared accent and case insensitively, first exactly
+    then by containment; falls back to the model default when nothing matches.
+    """
+    choices = {}
+    for key, label in ListingLBC.CATEGORY_CHOICES:
+        choices[_simplify(key.replace('_', ' '))] = key
+        choices[_simplify(label)] = key
+    simplified = [_simplify(c) for c in candidates if c]
+    for candidate in simplified:
+        if candidate in choices:
+            return choices[candidate]
+    for candidate in simplified:
+        for name, key in choices.items():
+            if candidate and (name in candidate or candidate in name):
+                return key
+    return ListingLBC._meta.get_field('category').default
+
+def parse_listing(raw: str) -> Dict:
+    """
+    Parse and validate a generated listing.
+
+    Args:
+        raw: Model output, JSON possibly wrapped in markdown fences or prose
+
+    Returns:
+        dict: title, price, description and category for ListingLBC
+
+    Raises:
+        ValueError: If the output is not a usable listing
+    """
+    if not raw:
+        raise ValueError("Empty response")
+    start, end = raw.find('{'), raw.rfind('}')
+    if start == -1 or end < start:
+        raise ValueError("No JSON object in response")
+    try:
+        data = json.loads(raw[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+
+    title = str(data.get('subject') or data.get('title') or '').strip()
+    if not title:
+        raise ValueError("Missing title")
+    description = str(data.get('description') or '').strip()
+    if not description:
+        raise ValueError("Missing description")
+    try:
+        price = round(float(str(data.get('price')).replace('€', '').replace(',', '.').strip()))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid price: {data.get('price')!r}")
+    if price < 0:
+        raise ValueError(f"Invalid price: {price}")
+
+    return {
+        'title': title[:ListingLBC._meta.get_field('title').max_length],
+        'price': price,
+        'description': description,
+        'category': match_category(data.get('subcategory'), data.get('category')),
+    }
+
+def generate_listings(items: QuerySet, scheduler: Optional[RateLimitedScheduler] = None,
+                      text_service: Optional[TextService] = None, force: bool = False,
+                      limit: Optional[int] = None, batch_size: int = 100) -> Dict:
+    """
+    Generate and store listings for items lacking an up to date one.
+
+    Args:
+        items: Candidate items
+        scheduler: Scheduler limiting API throughput, defaults to 1 req/s
+        text_service: TextService instance
+        force: Regenerate even if the item's analyses are unchanged
+        limit: Maximum number of items to process
+        batch_size: Listings per bulk INSERT
+
+    Returns:
+        dict: `created` listings and `failed` (item id, error) pairs
+    """
+    scheduler = scheduler or RateLimitedScheduler()
+    text_service = text_service or TextService()
+    candidates = items_needing_listing(items, force=force).order_by('id')
+    if limit:
+        candidates = candidates[:limit]
+
+    def jobs():
+        # Runs in the calling thread, so database reads stay out of the workers
+        for item in candidates:
+            descriptions = "\n".join(
+                listing_sources().filter(item=item).order_by('id').values_list('response', flat=True)
+            )
+            yield item, descriptions
+
+    def generate(job):
+        _, descriptions = job
+        raw = scheduler.call(
+            text_service.generate_listing, descriptions,
+            raise_on_rate_limit=True,
+            tokens=estimate_tokens(descriptions) + LISTING_PROMPT_TOKENS
+        )
+        return parse_listing(raw)
+
+    created, failed, pending = [], [], []
+    for (item, _), listing, error in scheduler.map(generate, jobs()):
+        if error:
+            logger.warning(f"Listing generation failed for item {item.id}: {error}")
+            failed.append((item.id, str(error)))
+            continue
+        pending.append(ListingLBC(item=item, source_fingerprint=item.source_fingerprint, **listing))
+        if len(pending) >= batch_size:
+            created.extend(ListingLBC.objects.bulk_create(pending))
+            pending = []
+    if pending:
+        created.extend(ListingLBC.objects.bulk_create(pending))
+
+    return {'created': created, 'failed': failed}
@@ -0,0 +1,172 @@
+"""
+Media file responses with access checked by Django.
+Files are sent by Django itself (development, MEDIA_SERVING=django) or, in
+production, by the front web server through X-Accel-Redirect (nginx) or
+X-Sendfile (Apache, lighttpd) once the view has checked access, so Python
+workers never stream file contents. Django's own responses support single
+byte ranges; content-addressed files are cached for a year.
+"""
+
+import mimetypes
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+
+from inventory.conditional import Validators, make_etag
+from inventory.models import Attachment
+from inventory.services.thumbnails import THUMBNAIL_DIR
+
+DJANGO = 'django'
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+SERVING_MODES = (DJANGO, X_ACCEL_REDIRECT, X_SENDFILE)
+
+# Files whose name holds a SHA-256 digest of their content never change,
+# shared caches may only keep them when no login is required to download
+CONTENT_ADDRESSED = re.compile(r'(^|/)[^/]*[0-9a-f]{64}[^/]*$')
+IMMUTABLE_CACHE_CONTROL = 'max-age=31536000, immutable'
+# Other files may be replaced under the same name, clients revalidate them
+REVALIDATE_CACHE_CONTROL = 'private, no-cache'
+
+THUMBNAIL_PATH = re.compile(rf'^{THUMBNAIL_DIR}/(\d+)/[a-z]+\.[a-z]+$')
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Bytes read at a time when Django sends a range
+CHUNK_SIZE = 64 * 1024
+
+def serving_mode() -> str:
+    mode = getattr(settings, 'MEDIA_SERVING', DJANGO)
+    if mode not in SERVING_MODES:
+        raise ImproperlyConfigured(f"MEDIA_SERVING must be one of {', '.join(SERVING_MODES)}, not {mode!r}")
+    return mode
+
+def may_access(request) -> bool:
+    """Whether the user may download media, everyone unless MEDIA_LOGIN_REQUIRED."""
+    return request.user.is_authenticated or not getattr(settings, 'MEDIA_LOGIN_REQUIRED', False)
+
+def cache_control(name: str) -> str:
+    """Cache-Control of a media file, see CONTENT_ADDRESSED."""
+    if not CONTENT_ADDRESSED.search(name):
+        return REVALIDATE_CACHE_CONTROL
+    scope = 'private' if getattr(settings, 'MEDIA_LOGIN_REQUIRED', False) else 'public'
+    return f'{scope}, {IMMUTABLE_CACHE_CONTROL}'
+
+def is_known_file(name: str) -> bool:
+    """Whether `name` is the file of an attachment or one of its thumbnails."""
+    thumbnail = THUMBNAIL_PATH.match(name)
+    if thumbnail:
+        return Attachment.objects.filter(pk=thumbnail.group(1), has_thumbnails=True).exists()
+    return Attachment.objects.filter(file=name).exists()
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    First and last byte of a single-range Range header.
+
+    Returns:
+        tuple: None to send the whole file (no header, multiple or malformed ranges)
+
+    Raises:
+        ValueError: If the range starts past the end of the file
+    """
+    match = RANGE_HEADER.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError("Range starts past the end of the file")
+    if start > end:
+        return None
+    return start, end
+
+def _read(file, length: int):
+    try:
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+def _content_disposition(filename: str, as_attachment: bool) -> str:
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        filename.encode('ascii')
+        # Quoted-string escapes, as Django 4.2's content_disposition_header
+        escaped = filename.replace('\\', '\\\\').replace('"', r'\"')
+        return f'{disposition}; filename="{escaped}"'
+    except UnicodeEncodeError:
+        return f"{disposition}; filename*=utf-8''{quote(filename)}"
+
+def file_response(request, name: str, content_type: Optional[str] = None, filename: Optional[str] = None,
+                  as_attachment: bool = False, etag: Optional[str] = None):
+    """
+    Response sending a stored file, by Django or by the front web server.
+
+    Args:
+        name: Storage name of the file
+        filename: Download name, none if the file is shown inline under its URL name
+        etag: Validator the client must hold for a Range to apply (If-Range)
+
+    Raises:
+        FileNotFoundError: If the file is missing from storage
+    """
+    content_type = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    mode = serving_mode()
+    if mode == DJANGO:
+        response = _django_response(request, name, content_type, etag)
+    else:
+        if not default_storage.exists(name):
+            raise FileNotFoundError(name)
+        response = HttpResponse(content_type=content_type)
+        if mode == X_ACCEL_REDIRECT:
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(name)
+        else:
+            response['X-Sendfile'] = default_storage.path(name)
+
+    if filename or as_attachment:
+        response['Content-Disposition'] = _content_disposition(filename or os.path.basename(name), as_attachment)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = cache_control(name)
+    return response
+
+def _django_response(request, name: str, content_type: str, etag: Optional[str]):
+    size = default_storage.size(name)
+    if_range = request.headers.get('If-Range')
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size) if not if_range or if_range == etag else None
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = default_storage.open(name, 'rb')
+    if byte_range is None:
+        return FileResponse(file, content_type=content_type)
+
+    start, end = byte_range
+    file.seek(start)
+    response = StreamingHttpResponse(_read(file, end - start + 1), status=206, content_type=content_type)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
+
+def stat_validators(name: str) -> Validators:
+    """ETag and modification time of a stored file, like django.views.static."""
+    modified = default_storage.get_modified_time(name)
+    return Validators(make_etag('media', name, default_storage.size(name), http_date(modified.timestamp())), modified)
@@ -0,0 +1,103 @@
+"""
+Execution plans of the application's hot queries.
+`query_catalogue` lists the querysets the views and commands actually run,
+built with sample ids from the database; `explain` runs EXPLAIN ANALYZE on
+one and reports the sequential scans of large tables, the usual sign of a
+missing or unusable index.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List
+
+from django.db import connection, connections
+from django.db.models import QuerySet
+
+from inventory.models import AIdescription, AIImgdescription, Attachment, Email, Item, Label, QRCode
+from inventory.services.search import search
+
+# Tables with fewer estimated rows than this are fine to scan sequentially
+LARGE_TABLE_ROWS = 10000
+
+@dataclass
+class QueryReport:
+    name: str
+    execution_time: float
+    plan_rows: int
+    plan: Dict
+    seq_scans: List[str] = field(default_factory=list)
+
+def _sample_id(model) -> int:
+    return model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+def query_catalogue() -> Dict[str, Callable[[], QuerySet]]:
+    """Hot querysets of the app, by name, evaluated lazily."""
+    item_id, email_id = _sample_id(Item), _sample_id(Email)
+    attachment_id = _sample_id(Attachment)
+    return {
+        'item_list': lambda: Item.objects.with_card_data(prefetch=False).order_by('-created_at', '-id')[:25],
+        'item_card_images': lambda: (Attachment.objects
+                                     .filter(item_id__in=[item_id], content_type__startswith='image/')
+                                     .order_by('id')),
+        'item_search': lambda: search(Item.objects.all(), 'ordinateur')[:24],
+        'item_latest_description': lambda: AIdescription.objects.filter(item_id=item_id).order_by('-created_at')[:1],
+        'email_list': lambda: Email.objects.order_by('-sent_at', '-id')[:25],
+        'email_search': lambda: search(Email.objects.all(), 'commande')[:25],
+        'emails_unlinked': lambda: Email.objects.filter(item__isnull=True).order_by('sent_at')[:100],
+        'attachment_list': lambda: (Attachment.objects
+                                    .select_related('item', 'email', 'latest_ai_description')
+                                    .order_by('-created_at', '-id')[:24]),
+        'attachment_filename_search': lambda: Attachment.objects.filter(filename__icontains='facture')[:24],
+        'attachment_latest_description': lambda: (AIImgdescription.objects
+                                                  .filter(attachment_id=attachment_id)
+                                                  .order_by('-created_at')[:1]),
+        'image_preview_item': lambda: (Attachment.objects
+                                       .filter(item_id=item_id, content_type__startswith='image/')
+                                       .order_by('id')),
+        'image_preview_email': lambda: (Attachment.objects
+                                        .filter(email_id=email_id, content_type__startswith='image/')
+                                        .order_by('id')),
+        'qr_code_lookup': lambda: QRCode.objects.filter(code='QR-000000'),
+        'label_list': lambda: Label.objects.order_by('name')[:25],
+    }
+
+def table_rows() -> Dict[str, int]:
+    """Planner row estimates of the app's tables."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname, reltuples::bigint FROM pg_class "
+            "WHERE relkind = 'r' AND relname LIKE 'inventory\\_%%'"
+        )
+        return dict(cursor.fetchall())
+
+def _nodes(node: Dict) -> Iterator[Dict]:
+    yield node
+    for child in node.get('Plans', []):
+        yield from _nodes(child)
+
+def explain(name: str, queryset: QuerySet, rows: Dict[str, int], large_table_rows: int = LARGE_TABLE_ROWS) -> QueryReport:
+    """
+    EXPLAIN ANALYZE a queryset, which is executed.
+
+    Args:
+        rows: Estimated rows per table, see table_rows
+        large_table_rows: Sequential scans of tables at least this large are reported
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+        output = cursor.fetchone()[0]
+    if isinstance(output, str):
+        output = json.loads(output)
+    output = output[0]
+    report = QueryReport(
+        name=name,
+        execution_time=output.get('Execution Time', 0.0),
+        plan_rows=output['Plan'].get('Plan Rows', 0),
+        plan=output['Plan'],
+    )
+    for node in _nodes(output['Plan']):
+        table = node.get('Relation Name')
+        if node['Node Type'] == 'Seq Scan' and rows.get(table, 0) >= large_table_rows:
+            report.seq_scans.append(table)
+    return report
@@ -0,0 +1,185 @@
+"""
+Rate-limited scheduler for concurrent AI API calls.
+Runs jobs in a thread pool while a shared token bucket keeps the request and
+token throughput under the provider quota, backing off on HTTP 429.
+"""
+
+import threading
+import time
+import concurrent.futures
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from inventory import metrics
+from inventory.services.text import RateLimitExceeded
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting both requests/second and tokens/minute.
+
+    Each acquire() takes one request slot plus the estimated token cost of
+    the call, blocking until both buckets have enough capacity. `clock` and
+    `sleep` default to time.monotonic and time.sleep.
+
+    Raises:
+        ValueError: If requests_per_second is not positive or tokens_per_minute is negative
+    """
+
+    def __init__(self, requests_per_second: float, tokens_per_minute: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        if not requests_per_second > 0:
+            raise ValueError(f"requests_per_second must be positive, got {requests_per_second}")
+        if tokens_per_minute is not None and tokens_per_minute < 0:
+            raise ValueError(f"tokens_per_minute must not be negative, got {tokens_per_minute}")
+        self.clock = clock
+        self.sleep = sleep
+        self.requests_per_second = requests_per_second
+        self.tokens_per_second = tokens_per_minute / 60.0 if tokens_per_minute else None
+        # One second worth of burst for requests, one minute for tokens
+        self.request_capacity = max(1.0, requests_per_second)
+        self.token_capacity = float(tokens_per_minute) if tokens_per_minute else None
+        self.request_level = self.request_capacity
+        self.token_level = self.token_capacity
+        self.paused_until = 0.0
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        if elapsed <= 0:
+            # Still paused, nothing accrues until the pause ends
+            return
+        self.updated_at = now
+        self.request_level = min(self.request_capacity,
+                                 self.request_level + elapsed * self.requests_per_second)
+        if self.token_capacity is not None:
+            self.token_level = min(self.token_capacity,
+                                   self.token_level + elapsed * self.tokens_per_second)
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Block until one request and `tokens` tokens can be spent."""
+        if self.token_capacity is not None:
+            # A single oversized call must still be able to go through eventually
+            tokens = min(tokens, self.token_capacity)
+        while True:
+            with self.lock:
+                now = self.clock()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0:
+                    request_wait = (1 - self.request_level) / self.requests_per_second
+                    token_wait = 0.0
+                    if self.token_capacity is not None:
+                        token_wait = (tokens - self.token_level) / self.tokens_per_second
+                    wait = max(request_wait, token_wait)
+                    if wait <= 0:
+                        self.request_level -= 1
+                        if self.token_capacity is not None:
+                            self.token_level -= tokens
+                        return
+            self.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out capacity for `seconds`, e.g. after a 429."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+            # Start from empty buckets refilling only once the pause is over,
+            # so workers do not burst right after it
+            self.updated_at = self.paused_until
+            self.request_level = 0.0
+            if self.token_capacity is not None:
+                self.token_level = 0.0
+
+class RateLimitedScheduler:
+    """
+    Run API calls concurrently under a shared TokenBucket.
+
+    Jobs are executed in a thread pool; calls made through call() wait for the
+    bucket and are retried with the server provided Retry-After delay when the
+    API answers 429.
+    """
+
+    def __init__(self, requests_per_second: float = 1.0, tokens_per_minute: Optional[int] = None,
+                 max_workers: int = 4, max_retries: int = 5, default_backoff: float = 2.0):
+        self.bucket = TokenBucket(requests_per_second, tokens_per_minute)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.default_backoff = default_backoff
+        self.stats = {'calls': 0, 'tokens': 0, 'throttled': 0, 'failed': 0}
+        self.stats_lock = threading.Lock()
+        self.started_at = None
+
+    def _count(self, **increments) -> None:
+        with self.stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def call(self, fn: Callable, *args, tokens: int = 0, **kwargs):
+        """
+        Make one rate-limited call, retrying on RateLimitExceeded.
+
+        Args:
+            fn: Callable performing the API request
+            tokens: Estimated token cost charged against the tokens/minute budget
+        """
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire(tokens)
+            try:
+                result = fn(*args, **kwargs)
+                self._count(calls=1, tokens=tokens)
+                return result
+            except RateLimitExceeded as e:
+                self._count(throttled=1)
+                if attempt == self.max_retries:
+                    self._count(failed=1)
+                    raise
+                delay = e.retry_after or self.default_backoff * (2 ** attempt)
+                self.bucket.pause(delay)
+
+    def map(self, fn: Callable, jobs: Iterable) -> Iterator[Tuple[object, object, Optional[Exception]]]:
+        """
+        Run fn(job) for every job concurrently.
+
+        Jobs are pulled lazily from the iterable (in the calling thread) so only
+        a bounded window is held in memory; results are handled by the caller,
+        which keeps database writes out of the worker threads.
+
+        Yields:
+            (job, result, error) tuples in completion order
+        """
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        jobs = iter(jobs)
+        pending = {}
+        queue_depth = metrics.QUEUE_DEPTH.labels('ai_scheduler')
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            def submit_next() -> bool:
+                for job in jobs:
+                    pending[executor.submit(fn, job)] = job
+                    return True
+                return False
+
+            for _ in range(self.max_workers * 2):
+                if not submit_next():
+                    break
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                queue_depth.set(len(pending) - len(done))
+                for future in done:
+                    job = pending.pop(future)
+                    try:
+                        yield job, future.result(), None
+                    except Exception as e:
+                        yield job, None, e
+                    submit_next()
+
+    def throughput(self) -> dict:
+        """Achieved request and token rates since the first map() call."""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats['elapsed'] = elapsed
+        stats['requests_per_second'] = stats['calls'] / elapsed if elapsed else 0.0
+        stats['tokens_per_minute'] = stats['tokens'] * 60 / elapsed if elapsed else 0.0
+        return stats
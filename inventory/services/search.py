@@ -0,0 +1,180 @@
+"""
+Full-text search over items and emails.
+Items and emails carry a maintained `search_vector` column (GIN indexed) built
+from French and simple configurations, so queries hit the index instead of
+chaining icontains across joins. Partial QR codes and senders, which words
+cannot match, are found by substring through pg_trgm indexes.
+"""
+
+import re
+from typing import Optional
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import (Case, Exists, F, FloatField, IntegerField, Max, Min, OuterRef,
+                              QuerySet, Subquery, TextField, Value, When)
+from django.db.models.functions import Cast, Substr
+
+from inventory.models import AIImgdescription, Email, Item, QRCode
+
+# French for stemming the (mostly French) text, simple for codes, names and
+# words the French dictionary would mangle
+SEARCH_CONFIGS = ('french', 'simple')
+
+# Email bodies beyond this are not indexed, tsvectors are limited to 1MB
+EMAIL_BODY_INDEXED_LENGTH = 100000
+
+# Words of a query taken into account
+MAX_QUERY_TERMS = 8
+
+# Shortest input matched by substring, trigram indexes need 3 characters
+TRIGRAM_MIN_LENGTH = 3
+
+# Ranks are bucketed to integers so results can be keyset paginated
+RANK_SCALE = 1000
+
+def _vector(expression, weight: str, configs=SEARCH_CONFIGS):
+    """Concatenated tsvectors of `expression` for each configuration."""
+    vector = None
+    for config in configs:
+        part = SearchVector(expression, config=config, weight=weight)
+        vector = part if vector is None else vector + part
+    return vector
+
+def _joined(queryset: QuerySet, group: str, field: str):
+    """Correlated subquery joining `field` over rows whose `group` is the outer item."""
+    return Subquery(
+        queryset
+        .filter(**{group: OuterRef('pk')})
+        .order_by()
+        .values(group)
+        .annotate(text=StringAgg(field, delimiter=' ', output_field=TextField()))
+        .values('text'),
+        output_field=TextField()
+    )
+
+def latest_image_descriptions() -> QuerySet:
+    """Latest AI description of each attachment."""
+    newer = AIImgdescription.objects.filter(attachment=OuterRef('attachment'), id__gt=OuterRef('id'))
+    return AIImgdescription.objects.filter(~Exists(newer))
+
+def item_search_vector():
+    """
+    Expression building an item's search document.
+
+    Weights: A for description, QR codes and labels, B for AI texts,
+    C for email subjects.
+    """
+    return (_vector('description', 'A')
+            + _vector(_joined(QRCode.objects.all(), 'item', 'code'), 'A', configs=('simple',))
+            + _vector(_joined(Item.labels.through.objects.all(), 'item', 'label__name'), 'A')
+            + _vector('ai_aggregated_description', 'B')
+            + _vector(_joined(latest_image_descriptions(), 'attachment__item', 'response'), 'B')
+            + _vector(_joined(Email.objects.all(), 'item', 'subject'), 'C'))
+
+def email_search_vector():
+    """Expression building an email's search document."""
+    return (_vector('subject', 'A')
+            + _vector('sender', 'A', configs=('simple',))
+            + _vector(Substr('body', 1, EMAIL_BODY_INDEXED_LENGTH), 'C'))
+
+def _update_in_batches(queryset: QuerySet, vector, batch_size: int) -> int:
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return 0
+    updated = 0
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        updated += (queryset
+                    .filter(id__gte=start, id__lt=start + batch_size)
+                    .update(search_vector=vector))
+    return updated
+
+def update_item_search_vectors(items: QuerySet, batch_size: int = 10000) -> int:
+    """
+    Rebuild item search vectors with one UPDATE per id range.
+
+    Returns:
+        int: Number of items updated
+    """
+    return _update_in_batches(items, item_search_vector(), batch_size)
+
+def update_email_search_vectors(emails: QuerySet, batch_size: int = 10000) -> int:
+    """
+    Rebuild email search vectors with one UPDATE per id range.
+
+    Returns:
+        int: Number of emails updated
+    """
+    return _update_in_batches(emails, email_search_vector(), batch_size)
+
+def build_query(text: str) -> Optional[SearchQuery]:
+    """
+    Turn user input into a prefix-matching tsquery.
+
+    Every word must match, the last ones typed being possibly incomplete
+    (search runs on each keystroke), so each word is a prefix. Returns None
+    when the input holds no searchable word.
+    """
+    terms = re.findall(r'\w+', text or '')[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    raw = ' & '.join(f"{term}:*" for term in terms)
+    query = None
+    for config in SEARCH_CONFIGS:
+        part = SearchQuery(raw, config=config, search_type='raw')
+        query = part if query is None else query | part
+    return query
+
+def substring_matches(model, text: str) -> Optional[QuerySet]:
+    """
+    Ids of the rows matching `text` by substring, served by the trigram indexes.
+
+    Items match on their QR codes and email senders, emails on their sender.
+    Returns None for other models and inputs too short for the indexes.
+    """
+    text = (text or '').strip()
+    if len(text) < TRIGRAM_MIN_LENGTH:
+        return None
+    if model is Item:
+        return (QRCode.objects.filter(code__icontains=text).order_by().values('item')
+                .union(Email.objects.filter(sender__icontains=text).order_by().values('item')))
+    if model is Email:
+        return Email.objects.filter(sender__icontains=text).order_by().values('pk')
+    return None
+
+def search(queryset: QuerySet, text: str) -> QuerySet:
+    """
+    Filter a queryset of a model with a `search_vector` column, best matches first.
+
+    Results are annotated with `rank` and its integer bucket `relevance`;
+    substring matches on codes and senders rank above word matches, equal
+    relevance keeps the queryset's own ordering. An input without searchable
+    words matches nothing.
+
+    Matches are selected with a UNION of one select per index (search
+    vector, codes, senders) rather than ORing the conditions, which would
+    have PostgreSQL scan the whole table.
+    """
+    query = build_query(text)
+    substring = substring_matches(queryset.model, text)
+    if query is None and substring is None:
+        # Annotated all the same, callers may order by relevance
+        return (queryset
+                .annotate(rank=Value(0.0, output_field=FloatField()),
+                          relevance=Value(0, output_field=IntegerField()))
+                .none())
+
+    matches, rank = None, Value(0.0)
+    if query is not None:
+        matches = queryset.model.objects.filter(search_vector=query).order_by().values('pk')
+        rank = SearchRank(F('search_vector'), query)
+    if substring is not None:
+        matches = substring if matches is None else matches.union(substring)
+        rank = rank + Case(When(pk__in=substring, then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    return (queryset
+            .filter(pk__in=matches)
+            .annotate(rank=rank)
+            .annotate(relevance=Cast(F('rank') * RANK_SCALE, IntegerField()))
+            .order_by('-relevance', *ordering))
@@ -0,0 +1,162 @@
+"""
+Map-reduce summarization of attachment AI descriptions.
+Keeps every request under a token budget for items with many photos:
+descriptions are deduplicated, packed into chunks, summarized one after the
+other (items run concurrently in the scheduler, whose token bucket paces every
+call), then the partial summaries are merged.
+"""
+
+import re
+import math
+from difflib import SequenceMatcher
+from typing import Callable, List, Optional
+
+from inventory.services.text import TextService, estimate_tokens
+
+REDUCE_INSTRUCTIONS = """Les descriptions ci-dessous sont des synthèses partielles du même objet,
+chacune couvrant une partie des photos. Fusionnez-les en une seule analyse,
+sans répétition, en conservant tous les textes et codes mentionnés."""
+
+class MapReduceSummarizer:
+    """
+    Summarize a list of descriptions with a bounded prompt size.
+
+    Args:
+        text_service: TextService used to build prompts
+        call: Function (text, prompt) -> summary performing the API request,
+              defaults to text_service.query_text
+        token_budget: Maximum estimated tokens per request, prompt included
+        similarity: Ratio above which two descriptions count as duplicates
+        summary_tokens: Expected size of a partial summary, used for estimates
+    """
+
+    def __init__(self, text_service: TextService, call: Optional[Callable] = None,
+                 token_budget: int = 8000, similarity: float = 0.9,
+                 summary_tokens: int = 600):
+        self.text_service = text_service
+        self.call = call or (lambda text, prompt: text_service.query_text(text, custom_prompt=prompt))
+        self.token_budget = token_budget
+        self.similarity = similarity
+        self.summary_tokens = summary_tokens
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercase and strip punctuation/whitespace differences."""
+        return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+    def deduplicate(self, descriptions: List[str]) -> List[str]:
+        """
+        Drop empty, identical and near-identical descriptions, keeping order.
+
+        Near duplicates are detected with difflib on normalized text; the cheap
+        upper bounds (real_quick_ratio, quick_ratio) skip most full comparisons.
+        A description mentioning codes or numbers the other lacks is never
+        dropped, since those are what the summary must preserve.
+        """
+        kept, kept_normalized, seen = [], [], set()
+        for description in descriptions:
+            normalized = self.normalize(description or '')
+            if not normalized or normalized in seen:
+                continue
+            seen.add(normalized)
+            codes = set(re.findall(r'\w*\d\w*', normalized))
+            duplicate = False
+            for other, other_codes in kept_normalized:
+                if not codes <= other_codes:
+                    continue
+                matcher = SequenceMatcher(None, normalized, other, autojunk=False)
+                if (matcher.real_quick_ratio() >= self.similarity
+                        and matcher.quick_ratio() >= self.similarity
+                        and matcher.ratio() >= self.similarity):
+                    duplicate = True
+                    break
+            if not duplicate:
+                kept.append(description)
+                kept_normalized.append((normalized, codes))
+        return kept
+
+    def chunk(self, descriptions: List[str], prompt: Optional[str] = None) -> List[List[str]]:
+        """
+        Pack descriptions into groups whose prompt fits the token budget.
+
+        A single description larger than the budget gets a chunk of its own.
+        """
+        overhead = estimate_tokens(self.text_service.build_prompt('', prompt))
+        available = max(1, self.token_budget - overhead)
+        chunks, current, used = [], [], 0
+        for description in descriptions:
+            tokens = estimate_tokens(description)
+            if current and used + tokens > available:
+                chunks.append(current)
+                current, used = [], 0
+            current.append(description)
+            used += tokens
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def reduce_prompt(self, prompt: Optional[str] = None) -> str:
+        """Prompt used to merge partial summaries."""
+        return f"{prompt or self.text_service.default_prompt}\n\n{REDUCE_INSTRUCTIONS}"
+
+    def estimate(self, descriptions: List[str], prompt: Optional[str] = None) -> dict:
+        """
+        Estimate the cost of summarize() without calling the API.
+
+        Returns:
+            dict with description counts, chunk and call counts and the
+            estimated number of input tokens sent
+        """
+        unique = self.deduplicate(descriptions)
+        chunks = self.chunk(unique, prompt)
+        overhead = estimate_tokens(self.text_service.build_prompt('', prompt))
+        calls = len(chunks)
+        tokens = sum(estimate_tokens('\n'.join(c)) for c in chunks) + overhead * len(chunks)
+
+        # Reduce rounds over partial summaries of roughly summary_tokens each
+        reduce_overhead = estimate_tokens(self.text_service.build_prompt('', self.reduce_prompt(prompt)))
+        per_request = max(1, (self.token_budget - reduce_overhead) // self.summary_tokens)
+        pending = len(chunks)
+        while pending > 1:
+            requests = math.ceil(pending / per_request)
+            calls += requests
+            tokens += pending * self.summary_tokens + requests * reduce_overhead
+            pending = requests
+
+        return {
+            'descriptions': len(descriptions),
+            'unique': len(unique),
+            'chunks': len(chunks),
+            'calls': calls if unique else 0,
+            'tokens': tokens if unique else 0,
+        }
+
+    def _summarize_chunks(self, chunks: List[List[str]], prompt: str) -> List[Optional[str]]:
+        # In the calling worker, so a run makes at most --workers calls at once
+        return [self.call('\n'.join(chunk), prompt) for chunk in chunks]
+
+    def summarize(self, descriptions: List[str], prompt: Optional[str] = None) -> Optional[str]:
+        """
+        Summarize descriptions, splitting into map and reduce rounds as needed.
+
+        Returns:
+            Final summary, or None if any request failed
+        """
+        texts = self.deduplicate(descriptions)
+        if not texts:
+            return None
+
+        current_prompt, reducing = prompt, False
+        while True:
+            chunks = self.chunk(texts, current_prompt)
+            if reducing and len(texts) > 1 and len(chunks) == len(texts):
+                # Partial summaries too large to pack: merge pairwise to keep converging
+                chunks = [texts[i:i + 2] for i in range(0, len(texts), 2)]
+            summaries = self._summarize_chunks(chunks, current_prompt)
+            if any(summary is None for summary in summaries):
+                return None
+            if len(summaries) == 1:
+                return summaries[0]
+            # Merge partial summaries, possibly over several rounds
+            texts = summaries
+            current_prompt, reducing = self.reduce_prompt(prompt), True
@@ -7,6 +7,28 @@ import os
 from mistralai import Mistral
 from typing import Optional
 
+from inventory import metrics
+
+class RateLimitExceeded(Exception):
+    """Raised when the Mistral API answers with HTTP 429."""
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__(f"Rate limited (retry after {retry_after}s)")
+        self.retry_after = retry_after
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for French/English prose (about 4 characters per token)."""
+    return len(text or '') // 4 + 1
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """Extract the Retry-After delay from a Mistral SDK error, if any."""
+    response = getattr(error, 'raw_response', None)
+    value = getattr(response, 'headers', {}).get('Retry-After') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
 class TextService:
     """Service class for handling text operations using Mistral's API."""
     
@@ -27,20 +49,38 @@ class TextService:
         except KeyError:
             raise EnvironmentError("MISTRAL_API_KEY not found in environment variables")
 
-    def query_text(self, descriptions: str, custom_prompt: str = None) -> Optional[str]:
-        """General text analysis method"""
-        prompt = f"{custom_prompt or self.default_prompt}\n\nDescriptions:\n{descriptions}"
+    def build_prompt(self, descriptions: str, custom_prompt: str = None) -> str:
+        """Full prompt sent by query_text, also used for token estimates"""
+        return f"{custom_prompt or self.default_prompt}\n\nDescriptions:\n{descriptions}"
+
+    def query_text(self, descriptions: str, custom_prompt: str = None,
+                   raise_on_rate_limit: bool = False) -> Optional[str]:
+        """
+        General text analysis method.
+
+        Args:
+            descriptions: Text to analyse
+            custom_prompt: Override for the default analysis prompt
+            raise_on_rate_limit: Raise RateLimitExceeded on HTTP 429 instead of
+                                 returning None, so callers can back off and retry
+        """
+        prompt = self.build_prompt(descriptions, custom_prompt)
         try:
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}]
-            )
+            with metrics.ai_call('text'):
+                response = self.client.chat.complete(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}]
+                )
+            metrics.record_usage('text', response)
             return response.choices[0].message.content
         except Exception as e:
+            if raise_on_rate_limit and getattr(e, 'status_code', None) == 429:
+                raise RateLimitExceeded(parse_retry_after(e))
             print(f"Error calling Mistral API: {e}")
             return None
 
-    def generate_listing(self, item_descriptions: str) -> Optional[dict]:
+    def generate_listing(self, item_descriptions: str,
+                         raise_on_rate_limit: bool = False) -> Optional[dict]:
         """Specific method for generating marketplace listings"""
         # This prompt is specifically for marketplace listing generation
         listing_prompt = """En vous basant sur ces descriptions d'objet, générez une annonce pour le site Leboncoin au format JSON avec les champs suivants:
@@ -63,14 +103,18 @@ class TextService:
         Répondez uniquement avec le JSON formaté."""
 
         try:
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=[
-                    {"role": "user", "content": f"{listing_prompt}\n\nDescriptions de l'objet:\n{item_descriptions}"}
-                ]
-            )
+            with metrics.ai_call('text'):
+                response = self.client.chat.complete(
+                    model=self.model,
+                    messages=[
+                        {"role": "user", "content": f"{listing_prompt}\n\nDescriptions de l'objet:\n{item_descriptions}"}
+                    ]
+                )
+            metrics.record_usage('text', response)
             return response.choices[0].message.content
         except Exception as e:
+            if raise_on_rate_limit and getattr(e, 'status_code', None) == 429:
+                raise RateLimitExceeded(parse_retry_after(e))
             print(f"Error generating listing: {e}")
             return None
 
@@ -0,0 +1,142 @@
+"""
+Thumbnail derivatives of image attachments.
+Each image gets resized copies in several sizes, in WebP and JPEG, stored next
+to the media files so grids never download full-resolution originals.
+"""
+
+import logging
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each thumbnail size
+THUMBNAIL_SIZES: Dict[str, int] = {
+    'sm': 320,
+    'md': 800,
+    'lg': 1600,
+}
+DEFAULT_SIZE = 'sm'
+
+# Pillow format name and save options for each served format
+THUMBNAIL_FORMATS: Dict[str, Tuple[str, Dict]] = {
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+if features.check('webp'):
+    THUMBNAIL_FORMATS['webp'] = ('WEBP', {'quality': 80, 'method': 4})
+
+# WebP when Pillow was built with it, JPEG otherwise
+DEFAULT_FORMAT = 'webp' if 'webp' in THUMBNAIL_FORMATS else 'jpeg'
+
+THUMBNAIL_DIR = 'thumbnails'
+
+def thumbnail_name(attachment_id: int, size: str, fmt: str) -> str:
+    """Storage path of an attachment thumbnail."""
+    return f"{THUMBNAIL_DIR}/{attachment_id}/{size}.{fmt}"
+
+def thumbnail_format(fmt: Optional[str]) -> str:
+    """Requested format if it is generated, the default one otherwise."""
+    return fmt if fmt in THUMBNAIL_FORMATS else DEFAULT_FORMAT
+
+def thumbnail_url(attachment_id: int, size: str = DEFAULT_SIZE, fmt: str = DEFAULT_FORMAT) -> str:
+    return default_storage.url(thumbnail_name(attachment_id, size, fmt))
+
+def _prepare(image: Image.Image) -> Image.Image:
+    """Apply EXIF rotation and convert to a mode both formats can save."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+def _save(name: str, content: bytes, force: bool) -> None:
+    if default_storage.exists(name):
+        if not force:
+            return
+        default_storage.delete(name)
+    saved = default_storage.save(name, ContentFile(content))
+    if saved != name:
+        # Another process wrote the same thumbnail meanwhile
+        default_storage.delete(saved)
+
+def generate_thumbnails(attachment_id: int, file_name: str, force: bool = False) -> List[str]:
+    """
+    Create every size and format of an attachment's thumbnails.
+
+    The original is decoded once and downscaled progressively from the
+    largest size; sizes larger than the original are not upscaled.
+
+    Args:
+        attachment_id: Attachment primary key
+        file_name: Storage name of the original image
+        force: Overwrite existing thumbnails
+
+    Returns:
+        list: Storage names of the thumbnails
+
+    Raises:
+        OSError: If the original cannot be read or decoded
+    """
+    with default_storage.open(file_name, 'rb') as original:
+        image = Image.open(original)
+        image.draft('RGB', (max(THUMBNAIL_SIZES.values()),) * 2)
+        image = _prepare(image)
+
+    names = []
+    for size, side in sorted(THUMBNAIL_SIZES.items(), key=lambda entry: -entry[1]):
+        image.thumbnail((side, side), Image.LANCZOS)
+        for fmt, (pil_format, options) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, pil_format, **options)
+            name = thumbnail_name(attachment_id, size, fmt)
+            _save(name, buffer.getvalue(), force)
+            names.append(name)
+    return names
+
+def delete_thumbnails(attachment_id: int) -> None:
+    for size in THUMBNAIL_SIZES:
+        for fmt in THUMBNAIL_FORMATS:
+            name = thumbnail_name(attachment_id, size, fmt)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+
+def generate_batch(jobs: Iterable[Tuple[int, str]], force: bool = False) -> Tuple[List[int], List[Tuple[int, str]]]:
+    """
+    Process pool entry point: thumbnail several attachments, without database access.
+
+    Args:
+        jobs: (attachment id, original file name) pairs
+
+    Returns:
+        tuple: ids done and (id, error) pairs for failures
+    """
+    done, failed = [], []
+    for attachment_id, file_name in jobs:
+        try:
+            generate_thumbnails(attachment_id, file_name, force=force)
+            done.append(attachment_id)
+        except Exception as e:
+            failed.append((attachment_id, str(e)))
+    return done, failed
+
+def ensure_thumbnails(attachment) -> Optional[str]:
+    """
+    Generate an attachment's thumbnails on first request and flag it.
+
+    Returns:
+        str: None on success, the error message otherwise
+    """
+    try:
+        generate_thumbnails(attachment.id, attachment.file.name)
+    except Exception as e:
+        logger.warning(f"Thumbnail generation failed for attachment {attachment.id}: {e}")
+        return str(e)
+    type(attachment).objects.filter(pk=attachment.pk).update(has_thumbnails=True)
+    attachment.has_thumbnails = True
+    return None
@@ -0,0 +1,232 @@
+"""
+Chunked, resumable attachment uploads.
+A client declares a file (POST /api/uploads/), sends it in chunks at
+increasing offsets (PUT /api/uploads/<id>/chunk/ with a Content-Range
+header), resuming from `received` after a failure, then completes it.
+Each chunk is read from the client, then appended to a part file on disk.
+Completion hashes the part file in one pass, whichever process received the
+chunks, stores it under its SHA-256 digest or reuses the file of an
+attachment with the same content, and queues the thumbnails and vision
+analysis of images.
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import BinaryIO, Tuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inventory import metrics
+from inventory.models import Attachment, Item, Upload
+from inventory.services.thumbnails import ensure_thumbnails
+from inventory.services.vision import IMAGE_DESCRIPTION_MODEL, IMAGE_DESCRIPTION_PROMPT
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = 'uploads'
+ATTACHMENT_DIR = 'attachments'
+
+# Bytes copied from the request to disk at a time
+COPY_BUFFER = 64 * 1024
+
+# Thumbnails and vision analysis of completed uploads, off the request
+_processing = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-processing')
+_queued = metrics.QUEUE_DEPTH.labels('upload_processing')
+
+class UploadConflict(Exception):
+    """A chunk does not start where the upload stands."""
+
+    def __init__(self, received: int):
+        super().__init__(f"Upload continues at offset {received}")
+        self.received = received
+
+def guess_content_type(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+def part_path(upload: Upload) -> str:
+    """Filesystem path of the file an upload is written to."""
+    return default_storage.path(f"{UPLOAD_DIR}/{upload.pk}.part")
+
+def _digest(path: str, size: int) -> str:
+    """SHA-256 of the first `size` bytes of a part file."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as part:
+        remaining = size
+        while remaining:
+            block = part.read(min(COPY_BUFFER, remaining))
+            if not block:
+                raise ValueError("Part file is shorter than the bytes received")
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher.hexdigest()
+
+def _receive(stream: BinaryIO, length: int):
+    """Read a chunk from the client into a temporary file, spilled to disk when large."""
+    chunk = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+                                          dir=settings.FILE_UPLOAD_TEMP_DIR)
+    remaining = length
+    while remaining:
+        block = stream.read(min(COPY_BUFFER, remaining))
+        if not block:
+            chunk.close()
+            raise ValueError(f"Chunk truncated, {remaining} bytes missing")
+        chunk.write(block)
+        remaining -= len(block)
+    chunk.seek(0)
+    return chunk
+
+def _check_chunk(upload: Upload, offset: int, length: int) -> None:
+    if upload.attachment_id:
+        raise ValueError("Upload already completed")
+    if offset != upload.received:
+        raise UploadConflict(upload.received)
+    if length <= 0 or offset + length > upload.size:
+        raise ValueError(f"Chunk must hold 1 to {upload.size - offset} bytes")
+
+def append_chunk(upload_id, offset: int, stream: BinaryIO, length: int) -> Upload:
+    """
+    Write `length` bytes of `stream` at `offset` of an upload.
+
+    The chunk is read from the client before the upload row is locked, so a
+    slow client does not hold the lock for the whole transfer; the lock is
+    only taken to check the offset again and append the buffered bytes.
+
+    Raises:
+        UploadConflict: If offset is not the number of bytes received so far
+        ValueError: If the chunk overflows the declared size or is truncated
+    """
+    # Fail early, before reading a chunk that could not be used
+    _check_chunk(Upload.objects.get(pk=upload_id), offset, length)
+    with _receive(stream, length) as chunk, transaction.atomic():
+        upload = Upload.objects.select_for_update().get(pk=upload_id)
+        _check_chunk(upload, offset, length)
+
+        path = part_path(upload)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as part:
+            # Drop whatever a failed chunk left past the received bytes
+            part.seek(offset)
+            part.truncate()
+            for block in iter(lambda: chunk.read(COPY_BUFFER), b''):
+                part.write(block)
+
+        upload.received += length
+        upload.save(update_fields=['received', 'updated_at'])
+        return upload
+
+def complete(upload_id) -> Tuple[Attachment, bool]:
+    """
+    Turn a fully received upload into an attachment.
+
+    The file is stored as attachments/<sha256><extension>. An attachment of
+    the same item with the same content is returned instead of a new one,
+    and attachments of other items with that content share their file.
+
+    Returns:
+        tuple: (attachment, whether it was created)
+
+    Raises:
+        ValueError: If bytes are missing or the content hash differs from the declared one
+    """
+    with transaction.atomic():
+        upload = Upload.objects.select_for_update().get(pk=upload_id)
+        if upload.attachment_id:
+            return upload.attachment, False
+        if upload.received != upload.size:
+            raise ValueError(f"{upload.size - upload.received} bytes missing")
+
+        path = part_path(upload)
+        digest = _digest(path, upload.size)
+        if upload.sha256 and upload.sha256 != digest:
+            raise ValueError("Content does not match the declared SHA-256")
+
+        duplicates = Attachment.objects.filter(sha256=digest).exclude(file='').order_by('id')
+        attachment = duplicates.filter(item_id=upload.item_id).first() if upload.item_id else None
+        created = attachment is None
+        if created:
+            existing = duplicates.first()
+            name = existing.file.name if existing else _store(path, digest, upload.filename)
+            metrics.ATTACHMENTS_SAVED.labels('API', 'saved').inc()
+            if not existing:
+                metrics.BYTES_WRITTEN.labels('API').inc(upload.size)
+            attachment = Attachment.objects.create(
+                item_id=upload.item_id,
+                file=name,
+                filename=upload.filename,
+                content_type=upload.content_type or guess_content_type(upload.filename),
+                size=upload.size,
+                sha256=digest,
+                source='API',
+            )
+        if os.path.exists(path):
+            os.remove(path)
+
+        upload.attachment = attachment
+        upload.save(update_fields=['attachment', 'updated_at'])
+        if created and attachment.is_image:
+            transaction.on_commit(lambda: enqueue_processing(attachment.pk))
+        return attachment, created
+
+def _store(path: str, digest: str, filename: str) -> str:
+    """Move a part file to its content-addressed name, unless that file already exists."""
+    extension = os.path.splitext(filename)[1].lower()
+    name = f"{ATTACHMENT_DIR}/{digest}{extension}"
+    if not default_storage.exists(name):
+        target = default_storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    return name
+
+def abort(upload: Upload) -> None:
+    """Delete an upload and its part file."""
+    path = part_path(upload)
+    if os.path.exists(path):
+        os.remove(path)
+    with _hashers_lock:
+        _hashers.pop(str(upload.pk), None)
+    upload.delete()
+
+def purge_stale(older_than: timedelta) -> int:
+    """
+    Abort incomplete uploads untouched for `older_than`.
+
+    Returns:
+        int: Number of uploads aborted
+    """
+    stale = Upload.objects.filter(attachment__isnull=True, updated_at__lt=timezone.now() - older_than)
+    count = 0
+    for upload in stale.iterator():
+        abort(upload)
+        count += 1
+    return count
+
+def enqueue_processing(attachment_id: int) -> None:
+    _queued.inc()
+    _processing.submit(_process_queued, attachment_id)
+
+def _process_queued(attachment_id: int) -> None:
+    _queued.dec()
+    process_attachment(attachment_id)
+
+def process_attachment(attachment_id: int) -> None:
+    """Thumbnails then vision analysis of an uploaded image, run in the background."""
+    try:
+        attachment = Attachment.objects.get(pk=attachment_id)
+        if not attachment.has_thumbnails and ensure_thumbnails(attachment) is None:
+            # Cached cards can now link the thumbnails
+            Item.objects.filter(pk=attachment.item_id).bump_cache_version()
+        if getattr(settings, 'UPLOAD_ANALYZE_IMAGES', True) and not attachment.latest_ai_description_id:
+            attachment.query_vision_ai(IMAGE_DESCRIPTION_MODEL, IMAGE_DESCRIPTION_PROMPT)
+    except Exception as e:
+        logger.warning(f"Processing of uploaded attachment {attachment_id} failed: {e}")
+    finally:
+        # The worker thread's own connection
+        connection.close()
@@ -9,6 +9,15 @@ from mistralai import Mistral
 from typing import List, Tuple, Optional
 from django.core.files import File
 
+from inventory import metrics
+
+# Model and prompt of the per-image description shown under attachments
+IMAGE_DESCRIPTION_MODEL = "pixtral-12b-2409"
+IMAGE_DESCRIPTION_PROMPT = ("Décris uniquement l'objet principal de cette image de manière factuelle "
+                            "(dimensions, couleurs, forme, matériau). Liste ensuite tous les textes et "
+                            "codes-barres visibles mot pour mot, sans interprétation. Ignore l'arrière-plan "
+                            "et toute personne présente dans l'image.")
+
 class VisionService:
     """
     Service class for handling vision AI operations using Mistral's API.
@@ -79,10 +88,12 @@ class VisionService:
             }]
 
             # Call Mistral API
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=messages
-            )
+            with metrics.ai_call('vision'):
+                response = self.client.chat.complete(
+                    model=self.model,
+                    messages=messages
+                )
+            metrics.record_usage('vision', response)
 
             return response.choices[0].message.content, image_paths
 
@@ -0,0 +1,183 @@
+"""
+Signal handlers keeping derived data in sync with the models it is built from:
+search vectors, latest AI description pointers, the version stamps of cached
+item cards and HTTP validators, and the list counters.
+Registered in InventoryConfig.ready.
+"""
+
+import threading
+
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import AIdescription, AIImgdescription, Attachment, Email, Item, Label, QRCode
+from .services.counters import (EMAILS, EMAILS_WITH_ATTACHMENTS, EMAILS_WITH_ITEMS, attachment_deltas,
+                                increment, merge_deltas)
+from .services.latest_descriptions import update_latest_image_descriptions, update_latest_item_descriptions
+from .services.search import update_email_search_vectors, update_item_search_vectors
+from .services.thumbnails import delete_thumbnails
+
+def refresh_items(**lookups):
+    """Rebuild the search vector and invalidate the cached card of the items matching `lookups`."""
+    items = Item.objects.filter(**lookups)
+    update_item_search_vectors(items)
+    items.bump_cache_version()
+
+@receiver(post_save, sender=Item)
+def item_saved(sender, instance, **kwargs):
+    refresh_items(pk=instance.pk)
+
+@receiver(post_save, sender=QRCode)
+@receiver(post_delete, sender=QRCode)
+def qr_code_changed(sender, instance, **kwargs):
+    refresh_items(pk=instance.item_id)
+
+@receiver(post_save, sender=Email)
+def email_saved(sender, instance, **kwargs):
+    update_email_search_vectors(Email.objects.filter(pk=instance.pk))
+    # The previous item no longer lists the email, see email_saving
+    item_ids = {instance.item_id, getattr(instance, '_counted_item_id', None)} - {None}
+    if item_ids:
+        refresh_items(pk__in=item_ids)
+
+@receiver(post_delete, sender=Email)
+def email_deleted(sender, instance, **kwargs):
+    if instance.item_id:
+        refresh_items(pk=instance.item_id)
+
+@receiver(post_save, sender=AIdescription)
+def item_description_saved(sender, instance, created, **kwargs):
+    item = Item.objects.filter(pk=instance.item_id)
+    if created:
+        # Newest by creation date, hence the latest
+        item.update(latest_ai_description=instance)
+    item.bump_cache_version()
+
+@receiver(post_delete, sender=AIdescription)
+def item_description_deleted(sender, instance, **kwargs):
+    item = Item.objects.filter(pk=instance.item_id)
+    update_latest_item_descriptions(item)
+    item.bump_cache_version()
+
+@receiver(post_save, sender=AIImgdescription)
+def image_description_saved(sender, instance, created, **kwargs):
+    if created:
+        Attachment.objects.filter(pk=instance.attachment_id).update(latest_ai_description=instance)
+    refresh_items(attachments=instance.attachment_id)
+
+@receiver(post_delete, sender=AIImgdescription)
+def image_description_deleted(sender, instance, **kwargs):
+    update_latest_image_descriptions(Attachment.objects.filter(pk=instance.attachment_id))
+    refresh_items(attachments=instance.attachment_id)
+
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Attachment)
+def attachment_changed(sender, instance, **kwargs):
+    # Previous item and email of a moved attachment, see attachment_saving
+    previous_item_id, previous_email_id = getattr(instance, '_previous_links', (None, None))
+    item_ids = {instance.item_id, previous_item_id} - {None}
+    if item_ids:
+        refresh_items(pk__in=item_ids)
+    email_ids = {instance.email_id, previous_email_id} - {None}
+    if email_ids:
+        Email.objects.filter(pk__in=email_ids).update(updated_at=Now())
+
+@receiver(post_delete, sender=Attachment)
+def attachment_deleted(sender, instance, **kwargs):
+    if instance.has_thumbnails:
+        delete_thumbnails(instance.pk)
+
+@receiver(post_save, sender=Label)
+def label_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_items(labels=instance)
+
+@receiver(pre_delete, sender=Label)
+def label_deleting(sender, instance, **kwargs):
+    # The through rows are gone once the label is deleted
+    instance._labelled_item_ids = list(instance.items.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Label)
+def label_deleted(sender, instance, **kwargs):
+    refresh_items(pk__in=getattr(instance, '_labelled_item_ids', []))
+
+@receiver(m2m_changed, sender=Item.labels.through)
+def item_labels_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._labelled_item_ids = list(instance.items.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            refresh_items(pk=instance.pk)
+        elif action == 'post_clear':
+            refresh_items(pk__in=getattr(instance, '_labelled_item_ids', []))
+        else:
+            refresh_items(pk__in=pk_set)
+
+@receiver(pre_save, sender=Email)
+def email_saving(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._counted_item_id = Email.objects.filter(pk=instance.pk).values_list('item_id', flat=True).first()
+
+@receiver(post_save, sender=Email)
+def email_counted(sender, instance, created, **kwargs):
+    if created:
+        increment({EMAILS: 1, EMAILS_WITH_ITEMS: 1 if instance.item_id else 0})
+    else:
+        had_item = getattr(instance, '_counted_item_id', None) is not None
+        increment({EMAILS_WITH_ITEMS: bool(instance.item_id) - had_item})
+
+# Emails being deleted by the current thread, whose attachments no longer count
+_deleting = threading.local()
+
+def deleting_email_ids():
+    if not hasattr(_deleting, 'email_ids'):
+        _deleting.email_ids = set()
+    return _deleting.email_ids
+
+@receiver(pre_delete, sender=Email)
+def email_deleting(sender, instance, **kwargs):
+    # Attachments are detached without signals (Attachment.email is SET_NULL)
+    # or deleted in the same cascade, either way the email accounts for them
+    instance._had_attachments = instance.attachments.exists()
+    deleting_email_ids().add(instance.pk)
+
+@receiver(post_delete, sender=Email)
+def email_uncounted(sender, instance, **kwargs):
+    deleting_email_ids().discard(instance.pk)
+    increment({
+        EMAILS: -1,
+        EMAILS_WITH_ITEMS: -1 if instance.item_id else 0,
+        EMAILS_WITH_ATTACHMENTS: -1 if getattr(instance, '_had_attachments', False) else 0,
+    })
+
+@receiver(pre_save, sender=Attachment)
+def attachment_saving(sender, instance, **kwargs):
+    if not instance._state.adding:
+        row = (Attachment.objects
+               .filter(pk=instance.pk)
+               .values_list('content_type', 'email_id', 'item_id')
+               .first())
+        if row:
+            content_type, email_id, item_id = row
+            instance._counted_state = (content_type, email_id)
+            instance._previous_links = (item_id, email_id)
+
+@receiver(post_save, sender=Attachment)
+def attachment_counted(sender, instance, created, **kwargs):
+    state = (instance.content_type, instance.email_id)
+    if created:
+        increment(attachment_deltas(*state, instance.pk, 1))
+        return
+    previous = getattr(instance, '_counted_state', None)
+    if previous and previous != state:
+        increment(merge_deltas(attachment_deltas(*previous, instance.pk, -1),
+                               attachment_deltas(*state, instance.pk, 1)))
+
+@receiver(post_delete, sender=Attachment)
+def attachment_uncounted(sender, instance, **kwargs):
+    email_id = instance.email_id
+    if email_id and (email_id in deleting_email_ids() or not Email.objects.filter(pk=email_id).exists()):
+        # Deleted along with its email, whichever went first
+        email_id = None
+    increment(attachment_deltas(instance.content_type, email_id, instance.pk, -1))
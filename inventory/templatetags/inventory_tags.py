@@ -1,7 +1,32 @@
 from django import template
+from django.utils.html import format_html
+
+from inventory.services.thumbnails import THUMBNAIL_FORMATS
 
 register = template.Library()
 
 @register.filter
 def get(dictionary, key):
     return dictionary.get(key)
+
+@register.simple_tag(takes_context=True)
+def url_replace(context, **kwargs):
+    """Current query string with `kwargs` replaced, e.g. for pagination links."""
+    query = context['request'].GET.copy()
+    for key, value in kwargs.items():
+        query[key] = value
+    return query.urlencode()
+
+@register.filter
+def thumbnail(attachment, spec='sm'):
+    """Thumbnail URL of an image attachment, `spec` being a size optionally suffixed by `.jpeg`."""
+    size, _, fmt = spec.partition('.')
+    return attachment.get_thumbnail_url(size, fmt or None)
+
+@register.simple_tag
+def webp_source(attachment, size='sm'):
+    """<source> of the WebP thumbnail for a <picture>, nothing when WebP thumbnails are not generated."""
+    url = attachment.get_thumbnail_url(size, 'webp') if 'webp' in THUMBNAIL_FORMATS else None
+    if not url:
+        return ''
+    return format_html('<source srcset="{}" type="image/webp">', url)
@@ -1,3 +1,1257 @@
-from django.test import TestCase
+import base64
+import csv
+import hashlib
+import json
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from prometheus_client import REGISTRY
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics, profiling
+from .pagination import KeysetPaginator
+from .renderers import ORJSONParser, ORJSONRenderer
+
+from .models import AIdescription, AIImgdescription, Attachment, Email, Item, Label, ListingLBC, QRCode, Upload
+from .services import counters, uploads
+from .services.aggregation import stale_items
+from .services.listings import items_needing_listing, match_category, parse_listing
+from .services.query_plans import LARGE_TABLE_ROWS, explain, query_catalogue, table_rows
+from .services.scheduler import RateLimitedScheduler, TokenBucket
+from .services.search import search
+from .services.summarizer import MapReduceSummarizer
+from .services.text import RateLimitExceeded, TextService, estimate_tokens
+from .services.thumbnails import DEFAULT_FORMAT, THUMBNAIL_FORMATS
+
+
+class StaleItemsTests(TestCase):
+    """Only items whose AI descriptions changed since their last aggregation are reprocessed."""
+
+    def setUp(self):
+        self.item = Item.objects.create(description="Lampe")
+        self.attachment = Attachment.objects.create(item=self.item, filename="a.jpg", content_type="image/jpeg")
+        self.description = AIImgdescription.objects.create(attachment=self.attachment, response="Lampe rouge")
+        # Without descriptions, never stale
+        Item.objects.create(description="Chaise")
+
+    def stale(self, **options):
+        return list(stale_items(Item.objects.all(), salt='concat', **options).values_list('pk', flat=True))
+
+    def aggregate(self):
+        call_command('aggregate_item_descriptions', stdout=StringIO())
+
+    def test_fingerprint_follows_sources(self):
+        self.assertEqual(self.stale(), [self.item.pk])
+        self.aggregate()
+        self.assertEqual(self.stale(), [])
+
+        self.description.response = "Lampe rouge en métal"
+        self.description.save()
+        self.assertEqual(self.stale(), [self.item.pk])
+        self.aggregate()
+
+        other = AIImgdescription.objects.create(attachment=self.attachment, response="Abat-jour")
+        self.assertEqual(self.stale(), [self.item.pk])
+        self.aggregate()
+        self.item.refresh_from_db()
+        self.assertIn("Abat-jour", self.item.ai_aggregated_description)
+
+        other.delete()
+        self.assertEqual(self.stale(), [self.item.pk])
+
+    def test_salt_and_force(self):
+        self.aggregate()
+        self.assertEqual(self.stale(), [])
+        self.assertEqual(list(stale_items(Item.objects.all(), salt='other')), [self.item])
+        self.assertEqual(self.stale(force=True), [self.item.pk])
+
+
+class FakeClock:
+    """Monotonic clock whose sleep() advances time instantly."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("Too many requests")
+        self.raw_response = SimpleNamespace(headers={'Retry-After': str(retry_after)})
+
+
+class FakeMistral:
+    """Chat client answering 429 to the first `throttled` calls."""
+
+    def __init__(self, throttled=0, retry_after=3):
+        self.throttled = throttled
+        self.retry_after = retry_after
+        self.calls = 0
+        self.chat = self
+
+    def complete(self, model, messages):
+        self.calls += 1
+        if self.calls <= self.throttled:
+            raise RateLimitError(self.retry_after)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Résumé"))])
+
+
+class SchedulerTests(TestCase):
+    """API calls stay under the request and token rates, backing off on 429."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def scheduler(self, requests_per_second=2.0, tokens_per_minute=None, **options):
+        scheduler = RateLimitedScheduler(requests_per_second, tokens_per_minute, max_workers=1, **options)
+        scheduler.bucket = TokenBucket(requests_per_second, tokens_per_minute,
+                                       clock=self.clock, sleep=self.clock.sleep)
+        return scheduler
+
+    def test_request_rate(self):
+        scheduler = self.scheduler()
+        results = list(scheduler.map(lambda n: scheduler.call(lambda: n * 2), range(10)))
+        self.assertEqual(sorted(result for _, result, _ in results), [n * 2 for n in range(10)])
+        # A one second burst of 2 calls, then one call every half second
+        self.assertAlmostEqual(self.clock.now, 4.0)
+        self.assertEqual(scheduler.stats['calls'], 10)
+
+    def test_token_rate(self):
+        scheduler = self.scheduler(requests_per_second=10, tokens_per_minute=600)
+        for _ in range(3):
+            scheduler.call(lambda: None, tokens=400)
+        # 600 tokens of burst, then 10 tokens per second
+        self.assertAlmostEqual(self.clock.now, 60.0)
+        self.assertEqual(scheduler.stats['tokens'], 1200)
+
+    def test_pause_empties_buckets_until_it_ends(self):
+        bucket = TokenBucket(2, tokens_per_minute=600, clock=self.clock, sleep=self.clock.sleep)
+        bucket.pause(5)
+        self.assertEqual((bucket.request_level, bucket.token_level), (0.0, 0.0))
+        bucket.acquire(60)
+        # Nothing refills during the pause: 60 tokens take 6s once it is over
+        self.assertAlmostEqual(self.clock.now, 11.0)
+
+    def test_retry_after_429(self):
+        service = TextService()
+        service.client = FakeMistral(throttled=1, retry_after=3)
+        scheduler = self.scheduler()
+        result = scheduler.call(service.query_text, "Lampe", raise_on_rate_limit=True)
+        self.assertEqual(result, "Résumé")
+        self.assertEqual(service.client.calls, 2)
+        self.assertEqual((scheduler.stats['throttled'], scheduler.stats['calls']), (1, 1))
+        # Retry-After, then half a second to refill the emptied bucket
+        self.assertAlmostEqual(self.clock.now, 3.5)
+
+    def test_gives_up_after_max_retries(self):
+        service = TextService()
+        service.client = FakeMistral(throttled=10)
+        scheduler = self.scheduler(max_retries=2)
+        with self.assertRaises(RateLimitExceeded):
+            scheduler.call(service.query_text, "Lampe", raise_on_rate_limit=True)
+        self.assertEqual(service.client.calls, 3)
+        self.assertEqual(scheduler.stats['failed'], 1)
+
+    def test_invalid_rates(self):
+        for requests_per_second, tokens_per_minute in ((0, None), (-1, None), (1, -60)):
+            with self.assertRaises(ValueError):
+                TokenBucket(requests_per_second, tokens_per_minute)
+        for option in ({'rps': 0}, {'workers': 0}, {'tpm': -1}):
+            with self.assertRaises(CommandError):
+                call_command('update_item_descriptions', **option)
+
+
+class SummarizerTests(TestCase):
+    """Descriptions are deduplicated and packed under the token budget."""
+
+    def setUp(self):
+        self.service = TextService()
+
+    def test_deduplicate(self):
+        summarizer = MapReduceSummarizer(self.service)
+        descriptions = [
+            "Une lampe de bureau rouge avec abat-jour.",
+            "une lampe de bureau rouge, avec abat-jour",
+            "",
+            None,
+            "Une lampe de bureau rouge avec un abat-jour",
+            "Étiquette LX-200 visible sous le pied",
+            "Étiquette LX-300 visible sous le pied",
+            "Chaise en bois",
+        ]
+        self.assertEqual(summarizer.deduplicate(descriptions), [
+            "Une lampe de bureau rouge avec abat-jour.",
+            # Near duplicates are kept when they mention other codes
+            "Étiquette LX-200 visible sous le pied",
+            "Étiquette LX-300 visible sous le pied",
+            "Chaise en bois",
+        ])
+
+    def test_chunk(self):
+        overhead = estimate_tokens(self.service.build_prompt(''))
+        summarizer = MapReduceSummarizer(self.service, token_budget=overhead + 10)
+        short = ["a" * 16, "b" * 16, "c" * 16, "d" * 16]
+        oversized = "x" * 200
+        self.assertEqual(summarizer.chunk(short[:3] + [oversized] + short[3:]),
+                         [short[:2], short[2:3], [oversized], short[3:]])
+        # A longer prompt leaves less room for descriptions
+        self.assertEqual(len(summarizer.chunk(short, prompt=self.service.default_prompt + "Précisez.")),
+                         len(short))
+
+    def test_chunks_summarized_in_calling_thread(self):
+        threads = []
+
+        def call(text, prompt):
+            threads.append(threading.get_ident())
+            return f"Résumé {len(threads)}"
+
+        overhead = estimate_tokens(self.service.build_prompt(''))
+        summarizer = MapReduceSummarizer(self.service, call=call, token_budget=overhead + 10)
+        summary = summarizer.summarize(["a" * 16, "b" * 16, "c" * 16])
+        self.assertTrue(summary.startswith("Résumé"))
+        # Map and reduce calls stay within the scheduler's worker
+        self.assertEqual(set(threads), {threading.get_ident()})
+
+
+class BulkAggregationTests(TestCase):
+    """--bulk writes the same descriptions and fingerprints as the per-item mode."""
+
+    def setUp(self):
+        for n in range(5):
+            item = Item.objects.create(description=f"Item {n}")
+            attachment = Attachment.objects.create(item=item, filename=f"{n}.jpg", content_type="image/jpeg")
+            for response in [f"Photo {n}", "", f"Détail {n}\nÉtiquette"][:n % 3 + 1]:
+                AIImgdescription.objects.create(attachment=attachment, response=response)
+        Item.objects.create(description="Sans photo")
+
+    def aggregated(self):
+        return list(Item.objects.order_by('pk').values_list('ai_aggregated_description', 'ai_description_fingerprint'))
+
+    def test_same_result_as_per_item(self):
+        call_command('aggregate_item_descriptions', stdout=StringIO())
+        per_item = self.aggregated()
+        Item.objects.update(ai_aggregated_description=None, ai_description_fingerprint='')
+
+        call_command('aggregate_item_descriptions', bulk=True, batch_size=2, stdout=StringIO())
+        self.assertEqual(self.aggregated(), per_item)
+
+        # Unchanged sources are not rewritten
+        out = StringIO()
+        call_command('aggregate_item_descriptions', bulk=True, stdout=out)
+        self.assertIn("Updated 0 items", out.getvalue())
+
+    def test_only_rewritten_items_are_refreshed(self):
+        call_command('aggregate_item_descriptions', bulk=True, stdout=StringIO())
+        versions = dict(Item.objects.values_list('pk', 'cache_version'))
+        description = AIImgdescription.objects.order_by('pk').first()
+        Item.objects.update(search_vector=None)
+        AIImgdescription.objects.filter(pk=description.pk).update(response="Photo retouchée")
+
+        out = StringIO()
+        call_command('aggregate_item_descriptions', bulk=True, stdout=out)
+        self.assertIn("Updated 1 items", out.getvalue())
+        changed = description.attachment.item_id
+        bumped = [pk for pk, version in Item.objects.values_list('pk', 'cache_version') if version != versions[pk]]
+        self.assertEqual(bumped, [changed])
+        self.assertEqual(list(Item.objects.filter(search_vector__isnull=False).values_list('pk', flat=True)),
+                         [changed])
+
+
+class ListingTests(TestCase):
+    """Listings are generated for changed items from validated model output."""
+
+    def test_parse_listing(self):
+        raw = ('Voici l\'annonce :\n```json\n{"subject": " Lampe de bureau ", "description": "Belle lampe", '
+               '"price": "12,6 €", "category": "Tablettes"}\n```')
+        self.assertEqual(parse_listing(raw), {
+            'title': "Lampe de bureau",
+            'price': 13,
+            'description': "Belle lampe",
+            'category': 'tablettes_liseuses',
+        })
+        for raw in ('', 'Pas de JSON', '{"subject": "Lampe",}',
+                    '{"subject": "", "description": "Lampe", "price": 10}',
+                    '{"subject": "Lampe", "description": "", "price": 10}',
+                    '{"subject": "Lampe", "description": "Lampe", "price": "gratuit"}',
+                    '{"subject": "Lampe", "description": "Lampe", "price": -5}'):
+            with self.subTest(raw=raw), self.assertRaises(ValueError):
+                parse_listing(raw)
+
+    def test_match_category(self):
+        self.assertEqual(match_category("Photo, Audio & Vidéo"), 'photo_audio_video')
+        self.assertEqual(match_category("TELEPHONES & objets connectes"), 'telephones_objets_connectes')
+        # The subcategory is tried first, then containment
+        self.assertEqual(match_category("Accessoires téléphone", "Téléphones"), 'accessoires_telephone')
+        self.assertEqual(match_category(None, "Tablettes"), 'tablettes_liseuses')
+        self.assertEqual(match_category("Meubles", None), 'ordinateurs')
+
+    def test_items_needing_listing(self):
+        item = Item.objects.create(description="Lampe")
+        analysis = AIdescription.objects.create(item=item, response="Lampe rouge")
+        Item.objects.create(description="Sans analyse")
+        self.assertEqual(list(items_needing_listing(Item.objects.all())), [item])
+
+        fingerprint = items_needing_listing(Item.objects.all()).get().source_fingerprint
+        ListingLBC.objects.create(item=item, title="Lampe", price=10, description="Lampe",
+                                  source_fingerprint=fingerprint)
+        self.assertEqual(list(items_needing_listing(Item.objects.all())), [])
+        self.assertEqual(list(items_needing_listing(Item.objects.all(), force=True)), [item])
+
+        analysis.response = "Lampe rouge, abat-jour blanc"
+        analysis.save()
+        self.assertEqual(list(items_needing_listing(Item.objects.all())), [item])
+
+    def test_generate_batch(self):
+        item = Item.objects.create(description="Lampe")
+        AIdescription.objects.create(item=item, response="Lampe rouge")
+        url = '/api/listings/generate_batch/'
+        for data in ({'limit': -1}, {'limit': 50}, {'item_ids': ['abc']}, {'force': 'peut-être'}):
+            with self.subTest(data=data):
+                self.assertEqual(self.client.post(url, data, content_type='application/json').status_code, 400)
+
+        listing = '{"subject": "Lampe", "description": "Lampe rouge", "price": 15}'
+        with mock.patch('inventory.services.listings.TextService') as text_service:
+            text_service.return_value.generate_listing.return_value = listing
+            response = self.client.post(url, {'item_ids': [item.pk], 'force': 'false'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['title'] for row in response.json()['created']], ["Lampe"])
+        self.assertEqual(ListingLBC.objects.get().source_fingerprint,
+                         items_needing_listing(Item.objects.all(), force=True).get().source_fingerprint)
+
+
+class ItemListQueryCountTests(TestCase):
+    """The item list must not issue per-item queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.label = Label.objects.create(name='test')
+
+    def create_items(self, count, offset=0):
+        for n in range(offset, offset + count):
+            item = Item.objects.create(description=f"Item {n}")
+            item.labels.add(self.label)
+            QRCode.objects.create(item=item, code=f"{n:05d}")
+            email = Email.objects.create(
+                item=item, subject=f"{n:05d}", sender='sender@example.com',
+                recipients=[], body='', sent_at='2024-01-01T00:00:00Z'
+            )
+            for kind in ('image/jpeg', 'application/pdf'):
+                Attachment.objects.create(
+                    item=item, email=email, filename=f"{n}.bin",
+                    content_type=kind, file=f"attachments/{n}.bin"
+                )
+            AIdescription.objects.create(item=item, response=f"Analysis {n}")
+
+    def count_queries(self, **headers):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('inventory:item_list'), **headers)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_independent_of_page_size(self):
+        self.create_items(2)
+        small_page = self.count_queries()
+        small_partial = self.count_queries(HTTP_HX_REQUEST='true')
+
+        self.create_items(20, offset=2)
+        self.assertEqual(self.count_queries(), small_page)
+        self.assertEqual(self.count_queries(HTTP_HX_REQUEST='true'), small_partial)
+
+    def test_card_data_annotations(self):
+        self.create_items(1)
+        item = Item.objects.with_card_data().get()
+        self.assertEqual(item.latest_ai_response, 'Analysis 0')
+        self.assertEqual(item.attachment_count, 2)
+        self.assertEqual(item.qr_code_count, 1)
+        self.assertEqual(item.email_count, 1)
+        self.assertEqual([a.content_type for a in item.image_attachments], ['image/jpeg'])
+
+
+class SearchTests(TestCase):
+    """Search vectors follow changes to the data they are built from."""
+
+    def setUp(self):
+        self.item = Item.objects.create(description="Ordinateur portable")
+        QRCode.objects.create(item=self.item, code="A12345")
+        self.other = Item.objects.create(description="Clavier")
+
+    def search_items(self, text):
+        return list(search(Item.objects.all(), text))
+
+    def test_matches_stems_and_prefixes(self):
+        self.assertEqual(self.search_items("ordinateurs"), [self.item])
+        self.assertEqual(self.search_items("portab"), [self.item])
+        self.assertEqual(self.search_items("a123"), [self.item])
+        self.assertEqual(self.search_items("!!"), [])
+
+    def test_related_changes_refresh_vector(self):
+        label = Label.objects.create(name="Reconditionné")
+        label.items.add(self.other)
+        self.assertEqual(self.search_items("reconditionne"), [self.other])
+
+        attachment = Attachment.objects.create(item=self.item, filename="a.jpg", content_type="image/jpeg")
+        AIImgdescription.objects.create(attachment=attachment, response="Écran fissuré")
+        self.assertEqual(self.search_items("fissure"), [self.item])
+
+        label.delete()
+        self.assertEqual(self.search_items("reconditionne"), [])
+
+    def test_ranks_description_above_email_subject(self):
+        Email.objects.create(
+            item=self.other, subject="Ordinateur en panne", sender="a@example.com",
+            recipients=[], body="", sent_at="2024-01-01T00:00:00Z"
+        )
+        self.assertEqual(self.search_items("ordinateur"), [self.item, self.other])
+        emails = search(Email.objects.all(), "panne")
+        self.assertEqual([e.item_id for e in emails], [self.other.id])
+
+    def test_substring_matches_codes_and_senders(self):
+        Email.objects.create(
+            item=self.other, subject="Commande", sender="vendeur@boutique.fr",
+            recipients=[], body="", sent_at="2024-01-01T00:00:00Z"
+        )
+        self.assertEqual(self.search_items("2345"), [self.item])
+        self.assertEqual(self.search_items("outique"), [self.other])
+        self.assertEqual(self.search_items("45"), [])
+        self.assertEqual(len(search(Email.objects.all(), "outique")), 1)
+
+
+class SearchItemsPaginationTests(TestCase):
+    """Item search is served one keyset page at a time."""
+
+    def setUp(self):
+        for n in range(30):
+            Item.objects.create(description=f"Lampe {n}")
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('inventory:search_items'), params, HTTP_HX_REQUEST='true')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_pages_cover_results_once(self):
+        first = self.get_page(q="lampe")
+        self.assertEqual(first.context['result_count'], 30)
+        self.assertFalse(first.context['count_is_estimate'])
+        self.assertTrue(first.context['page'].has_next)
+
+        second = self.get_page(q="lampe", cursor=first.context['page'].next_cursor)
+        self.assertNotIn('result_count', second.context)
+        self.assertFalse(second.context['page'].has_next)
+
+        ids = [i.id for i in first.context['items']] + [i.id for i in second.context['items']]
+        self.assertEqual(sorted(ids), sorted(Item.objects.values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('inventory:search_items'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tampered_cursor_values(self):
+        cursor = self.get_page(q="lampe").context['page'].next_cursor
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        # Relevance is an annotation, the other values are model fields
+        for index, value in ((0, "abc"), (0, None), (0, [1]), (1, "hier"), (2, {"id": 1})):
+            values = list(payload['v'])
+            values[index] = value
+            tampered = base64.urlsafe_b64encode(json.dumps({'v': values, 'r': False}).encode()).decode()
+            with self.subTest(values=values):
+                response = self.client.get(reverse('inventory:search_items'), {'q': "lampe", 'cursor': tampered})
+                self.assertEqual(response.status_code, 400)
+
+    def test_keyset_ties_on_created_at(self):
+        Item.objects.update(created_at='2024-01-01T00:00:00Z')
+        paginator = KeysetPaginator(Item.objects.all(), per_page=7)
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen.extend(item.id for item in page.object_list)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), 30)
+
+
+class KeysetPaginationTests(TestCase):
+    """Lists and API endpoints page on (timestamp, id) keysets."""
+
+    def setUp(self):
+        for n in range(32):
+            Email.objects.create(
+                subject=f"Message {n}", sender="a@example.com", recipients=[],
+                body="", sent_at="2024-01-01T00:00:00Z"
+            )
+
+    def walk_api(self, url):
+        ids, previous = [], None
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(email['id'] for email in data['results'])
+            previous = data['previous'] or previous
+            url = data['next']
+        return ids, previous
+
+    def test_api_pages_through_ties(self):
+        ids, previous = self.walk_api('/api/emails/?page_size=6')
+        self.assertEqual(ids, sorted(Email.objects.values_list('id', flat=True), reverse=True))
+
+        data = self.client.get(previous).json()
+        self.assertEqual([email['id'] for email in data['results']], ids[24:30])
+
+    def test_api_follows_requested_ordering(self):
+        ids, _ = self.walk_api('/api/emails/?page_size=6&ordering=sent_at')
+        self.assertEqual(ids, sorted(Email.objects.values_list('id', flat=True)))
+
+    def test_list_view_cursor(self):
+        first = self.client.get(reverse('inventory:email_list'))
+        page = first.context['page_obj']
+        self.assertTrue(page.has_next)
+        self.assertFalse(page.has_previous)
+
+        second = self.client.get(reverse('inventory:email_list'), {'cursor': page.next_cursor})
+        self.assertTrue(second.context['page_obj'].has_previous)
+        self.assertEqual(len(first.context['emails']) + len(second.context['emails']), 32)
+
+        self.assertEqual(self.client.get(reverse('inventory:email_list'), {'cursor': 'x'}).status_code, 404)
+
+
+class ThumbnailTests(TestCase):
+    """Image attachments are shown through generated thumbnails."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, 'JPEG')
+        self.attachment = Attachment.objects.create(filename="photo.jpg", content_type="image/jpeg")
+        self.attachment.file.save("photo.jpg", ContentFile(buffer.getvalue()))
+
+    def test_generated_on_first_request(self):
+        url = self.attachment.get_thumbnail_url('md', 'jpeg')
+        self.assertEqual(url, reverse('inventory:attachment_thumbnail', args=[self.attachment.id, 'md', 'jpeg']))
+
+        response = self.client.get(url)
+        self.attachment.refresh_from_db()
+        self.assertTrue(self.attachment.has_thumbnails)
+        self.assertRedirects(response, self.attachment.get_thumbnail_url('md', 'jpeg'), fetch_redirect_response=False)
+
+        with self.attachment.file.storage.open(f"thumbnails/{self.attachment.id}/md.jpeg") as thumbnail:
+            self.assertEqual(Image.open(thumbnail).size, (800, 400))
+
+    def test_backfill_command(self):
+        call_command('generate_thumbnails', workers=2, stdout=StringIO())
+        self.attachment.refresh_from_db()
+        self.assertTrue(self.attachment.has_thumbnails)
+        self.assertTrue(self.attachment.file.storage.exists(f"thumbnails/{self.attachment.id}/sm.{DEFAULT_FORMAT}"))
+
+    def test_webp_source_only_when_generated(self):
+        template = Template("{% load inventory_tags %}{% webp_source attachment 'sm' %}")
+        context = Context({'attachment': self.attachment})
+        with mock.patch.dict(THUMBNAIL_FORMATS, {'jpeg': THUMBNAIL_FORMATS['jpeg']}, clear=True):
+            self.assertEqual(template.render(context), '')
+        with mock.patch.dict(THUMBNAIL_FORMATS, {'webp': ('WEBP', {})}):
+            url = reverse('inventory:attachment_thumbnail', args=[self.attachment.id, 'sm', 'webp'])
+            self.assertEqual(template.render(context), f'<source srcset="{url}" type="image/webp">')
+
+
+class ItemCardCacheTests(TestCase):
+    """Item cards are served from the fragment cache until something they show changes."""
+
+    def setUp(self):
+        self.item = Item.objects.create(description="Lampe")
+
+    def get_list(self):
+        response = self.client.get(reverse('inventory:item_list'), HTTP_HX_REQUEST='true')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_cached_until_related_change(self):
+        self.assertIn("Lampe", self.get_list())
+
+        # Bypasses the signals, the cached card is still served
+        Item.objects.filter(pk=self.item.pk).update(description="Lampadaire")
+        self.assertIn("Lampe", self.get_list())
+
+        QRCode.objects.create(item=self.item, code="L0001")
+        content = self.get_list()
+        self.assertIn("Lampadaire", content)
+        self.assertIn("QR Codes: 1", content)
+
+    def test_bulk_aggregation_rerenders_cards(self):
+        attachment = Attachment.objects.create(item=self.item, filename="a.jpg", content_type="image/jpeg")
+        AIImgdescription.objects.create(attachment=attachment, response="Abat-jour en laiton")
+        self.assertNotIn("Abat-jour en laiton", self.get_list())
+
+        call_command('aggregate_item_descriptions', bulk=True, stdout=StringIO())
+        self.assertIn("Abat-jour en laiton", self.get_list())
+
+    def test_new_label_rerenders_cards(self):
+        self.get_list()
+        Label.objects.create(name="Salon")
+        self.assertIn("Salon", self.get_list())
+
+    def test_cached_cards_skip_prefetches(self):
+        self.get_list()
+        with CaptureQueriesContext(connection) as cached:
+            self.get_list()
+
+        Item.objects.filter(pk=self.item.pk).bump_cache_version()
+        with CaptureQueriesContext(connection) as rendered:
+            self.get_list()
+        self.assertLess(len(cached), len(rendered))
+
+
+class CounterTests(TestCase):
+    """List statistics follow inserts, updates and deletes without counting."""
+
+    def create_email(self, **fields):
+        return Email.objects.create(subject="Commande", sender="a@example.com", recipients=[],
+                                    body="", sent_at="2024-01-01T00:00:00Z", **fields)
+
+    def assertCountersExact(self):
+        stored = counters.get_counters(*counters.COUNTERS)
+        self.assertEqual(stored, {name: count() for name, count in counters.COUNTERS.items()})
+
+    def test_follow_changes(self):
+        counters.refresh_counters()
+        with self.captureOnCommitCallbacks(execute=True):
+            item = Item.objects.create(description="Lampe")
+            email = self.create_email(item=item)
+            self.create_email()
+            photo = Attachment.objects.create(email=email, item=item, filename="a.jpg", content_type="image/jpeg")
+            Attachment.objects.create(email=email, filename="b.pdf", content_type="application/pdf")
+        self.assertCountersExact()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.content_type = "application/msword"
+            photo.email = None
+            photo.save()
+        self.assertCountersExact()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            email.delete()
+        self.assertCountersExact()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Attachment.objects.create(email=self.create_email(item=item), item=item, filename="c.jpg",
+                                      content_type="image/jpeg")
+            # Items keep at least one QR code, see Item.delete
+            QRCode.objects.create(item=item, code="L0001")
+            QRCode.objects.create(item=item, code="L0002")
+            item.delete()
+        self.assertCountersExact()
+
+    def test_applied_on_commit_only(self):
+        counters.refresh_counters()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.create_email()
+                transaction.set_rollback(True)
+        self.assertCountersExact()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create_email()
+        self.assertEqual(counters.get_counters(counters.EMAILS)[counters.EMAILS], 0)
+        callbacks[0]()
+        self.assertCountersExact()
+
+    def test_list_views_read_counters(self):
+        self.create_email()
+        counters.refresh_counters()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('inventory:email_list'))
+        self.assertEqual(response.context['total_count'], 1)
+        self.assertFalse([q for q in context.captured_queries if 'COUNT(' in q['sql']])
+
+
+class LatestDescriptionTests(TestCase):
+    """Attachments and items point at their latest AI description."""
+
+    def setUp(self):
+        self.item = Item.objects.create(description="Lampe")
+        self.attachment = Attachment.objects.create(item=self.item, filename="a.jpg", content_type="image/jpeg")
+
+    def test_pointers_follow_inserts_and_deletes(self):
+        first = AIImgdescription.objects.create(attachment=self.attachment, response="Lampe rouge")
+        second = AIImgdescription.objects.create(attachment=self.attachment, response="Lampe de bureau")
+        self.attachment.refresh_from_db()
+        self.assertEqual(self.attachment.latest_ai_description, second)
+
+        second.delete()
+        self.attachment.refresh_from_db()
+        self.assertEqual(self.attachment.latest_ai_description, first)
+
+        analysis = AIdescription.objects.create(item=self.item, response="Analyse")
+        self.assertEqual(Item.objects.with_card_data().get().latest_ai_response, "Analyse")
+        analysis.delete()
+        self.item.refresh_from_db()
+        self.assertIsNone(self.item.latest_ai_description)
+
+    def test_backfill_command(self):
+        description = AIImgdescription.objects.create(attachment=self.attachment, response="Lampe")
+        analysis = AIdescription.objects.create(item=self.item, response="Analyse")
+        Attachment.objects.update(latest_ai_description=None)
+        Item.objects.update(latest_ai_description=None)
+
+        call_command('backfill_latest_descriptions', stdout=StringIO())
+        self.attachment.refresh_from_db()
+        self.item.refresh_from_db()
+        self.assertEqual(self.attachment.latest_ai_description, description)
+        self.assertEqual(self.item.latest_ai_description, analysis)
+
+
+class QueryPlanTests(TestCase):
+    """The query catalogue can be explained on the current schema."""
+
+    def test_explain_catalogue(self):
+        Item.objects.create(description="Lampe")
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        for name in ('item_list', 'emails_unlinked', 'image_preview_item'):
+            self.assertIn(f"{name}: ", out.getvalue())
+        self.assertIn("No sequential scan of large tables", out.getvalue())
+
+    def test_search_uses_indexes(self):
+        Item.objects.create(description="Ordinateur portable")
+        # Count every table as large and have the planner avoid sequential
+        # scans wherever an index can serve the query
+        rows = dict.fromkeys(table_rows(), LARGE_TABLE_ROWS)
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        report = explain('item_search', query_catalogue()['item_search'](), rows)
+        self.assertNotIn('inventory_item', report.seq_scans)
+
+
+class ImagePreviewTests(TestCase):
+    """The image modal finds its neighbours without loading the whole set."""
+
+    def setUp(self):
+        self.item = Item.objects.create(description="Lampe")
+        self.images = [
+            Attachment.objects.create(item=self.item, filename=f"{n}.jpg", content_type="image/jpeg",
+                                      file=f"attachments/{n}.jpg")
+            for n in range(5)
+        ]
+        Attachment.objects.create(item=self.item, filename="notice.pdf", content_type="application/pdf")
+
+    def preview(self, attachment, **params):
+        response = self.client.get(reverse('inventory:image_preview', args=[attachment.id]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_neighbours_and_position(self):
+        context = self.preview(self.images[2], source_type='item', source_id=self.item.id)
+        self.assertEqual(context['prev_image'], self.images[1])
+        self.assertEqual(context['next_image'], self.images[3])
+        self.assertEqual((context['current_index'], context['total_images']), (3, 5))
+
+        context = self.preview(self.images[0], source_type='item', source_id=self.item.id)
+        self.assertIsNone(context['prev_image'])
+        self.assertEqual(context['current_index'], 1)
+
+    def test_without_source(self):
+        context = self.preview(self.images[4])
+        self.assertIsNone(context['next_image'])
+        self.assertEqual((context['current_index'], context['total_images']), (1, 1))
+
+
+class ApiListRepresentationTests(TestCase):
+    """API lists are compact, with sparse fieldsets and a constant query count."""
+
+    def create_items(self, count):
+        for n in range(count):
+            item = Item.objects.create(description=f"Item {n}")
+            QRCode.objects.create(item=item, code=f"API-{item.id}")
+            email = Email.objects.create(
+                item=item, subject=f"Message {n}", sender='sender@example.com',
+                recipients=[], body='x' * 1000, sent_at='2024-01-01T00:00:00Z'
+            )
+            Attachment.objects.create(item=item, email=email, filename=f"{n}.jpg",
+                                      content_type='image/jpeg', file=f"attachments/{n}.jpg")
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_compact_lists(self):
+        self.create_items(2)
+        data, _ = self.get('/api/items/')
+        item = data['results'][0]
+        self.assertEqual((item['email_count'], item['attachment_count']), (1, 1))
+        self.assertNotIn('emails', item)
+
+        data, _ = self.get('/api/emails/')
+        self.assertNotIn('body', data['results'][0])
+        self.assertEqual(data['results'][0]['attachment_count'], 1)
+
+        data, _ = self.get(f"/api/emails/{data['results'][0]['id']}/")
+        self.assertIn('body', data)
+
+    def test_fields_and_expand(self):
+        self.create_items(1)
+        data, _ = self.get('/api/items/?fields=id,emails&expand=emails')
+        item = data['results'][0]
+        self.assertEqual(set(item), {'id', 'emails'})
+        self.assertEqual(item['emails'][0]['attachment_count'], 1)
+        self.assertNotIn('body', item['emails'][0])
+
+    def test_query_count_independent_of_page_size(self):
+        self.create_items(3)
+        url = '/api/items/?expand=emails,attachments,labels,qr_codes&page_size='
+        _, small = self.get(url + '1')
+        _, large = self.get(url + '3')
+        self.assertEqual(small, large)
+
+        _, small = self.get('/api/emails/?expand=attachments&page_size=1')
+        _, large = self.get('/api/emails/?expand=attachments&page_size=3')
+        self.assertEqual(small, large)
+
+
+class ORJSONTests(TestCase):
+    """The orjson renderer and parser behave like DRF's json ones."""
+
+    def test_renders_like_json_renderer(self):
+        data = {
+            'sent_at': datetime(2024, 1, 1, 12, 30, tzinfo=timezone.utc),
+            'price': Decimal('12.50'),
+            'text': "Lampe à poser\u2028",
+            'nested': [{'id': 1, 'labels': []}],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parser(self):
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(BytesIO('{"description": "Lampe à poser"}'.encode())),
+                         {'description': "Lampe à poser"})
+        with self.assertRaises(ParseError):
+            parser.parse(BytesIO(b'{"description": '))
+
+    def test_benchmark_command(self):
+        Item.objects.create(description="Lampe")
+        out = StringIO()
+        call_command('benchmark_json', items=3, repeat=1, stdout=out)
+        self.assertIn("orjson: render", out.getvalue())
+
+
+class ExportTests(TestCase):
+    """The catalogue export streams items with their codes, labels and analysis."""
+
+    def setUp(self):
+        self.item = Item.objects.create(description="Lampe, laiton")
+        self.item.labels.add(Label.objects.create(name='salon'), Label.objects.create(name='deco'))
+        QRCode.objects.create(item=self.item, code='QR-2')
+        QRCode.objects.create(item=self.item, code='QR-1')
+        AIdescription.objects.create(item=self.item, response="Lampe de bureau")
+        Item.objects.create(description="Chaise")
+
+    def test_ndjson_endpoint(self):
+        response = self.client.get('/api/items/export/ndjson/?ordering=created_at')
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(rows[0]['qr_codes'], ['QR-1', 'QR-2'])
+        self.assertEqual(rows[0]['labels'], ['deco', 'salon'])
+        self.assertEqual(rows[0]['ai_description'], "Lampe de bureau")
+        self.assertEqual((rows[1]['qr_codes'], rows[1]['ai_description']), ([], None))
+
+    def test_csv_command(self):
+        out = StringIO()
+        call_command('export_items', format='csv', chunk_size=1, stdout=out)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual([row['description'] for row in rows], ["Lampe, laiton", "Chaise"])
+        self.assertEqual(rows[0]['qr_codes'], 'QR-1|QR-2')
+
+
+class ConditionalGetTests(TestCase):
+    """Unchanged details and downloads are answered with 304."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.item = Item.objects.create(description="Lampe")
+        self.email = Email.objects.create(item=self.item, subject="Lampe", sender="a@example.com",
+                                          recipients=[], body="", sent_at="2024-01-01T00:00:00Z")
+
+    def revalidate(self, url, **headers):
+        first = self.client.get(url, **headers)
+        self.assertEqual(first.status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'], **headers)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        return first
+
+    def test_item_api_and_page(self):
+        url = f'/api/items/{self.item.id}/'
+        first = self.revalidate(url)
+        self.assertIn('Last-Modified', first)
+        self.item.labels.add(Label.objects.create(name='salon'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+        self.revalidate(reverse('inventory:item_detail', args=[self.item.id]), HTTP_HX_REQUEST='true')
+
+    def test_thumbnails_keep_updated_at(self):
+        buffer = BytesIO()
+        Image.new('RGB', (100, 100), 'red').save(buffer, 'JPEG')
+        url = f'/api/items/{self.item.id}/'
+        with override_settings(MEDIA_ROOT=self.media):
+            attachment = Attachment.objects.create(item=self.item, filename="a.jpg", content_type="image/jpeg")
+            attachment.file.save("a.jpg", ContentFile(buffer.getvalue()))
+            first = self.revalidate(url)
+            updated_at = Item.objects.get(pk=self.item.pk).updated_at
+
+            self.client.get(reverse('inventory:attachment_thumbnail', args=[attachment.id, 'sm', 'jpeg']))
+        # Pages now link the thumbnails, but the item itself did not change
+        self.assertEqual(Item.objects.get(pk=self.item.pk).updated_at, updated_at)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_invalid_ids_are_not_found(self):
+        for url in ('/api/items/abc/', '/api/emails/abc/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_email_api(self):
+        url = f'/api/emails/{self.email.id}/'
+        first = self.revalidate(url)
+        Attachment.objects.create(email=self.email, filename="notice.pdf", content_type="application/pdf")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_attachment_download(self):
+        with override_settings(MEDIA_ROOT=self.media):
+            attachment = Attachment.objects.create(item=self.item, filename="notice.pdf",
+                                                   content_type="application/pdf")
+            attachment.file.save("notice.pdf", ContentFile(b"%PDF-1.4"))
+            url = reverse('inventory:attachment_download', args=[attachment.id])
+            first = self.revalidate(url)
+            self.assertEqual(b''.join(first.streaming_content), b"%PDF-1.4")
+            self.assertIn('attachment; filename="notice.pdf"', first['Content-Disposition'])
+
+
+class MediaServingTests(TestCase):
+    """Media files are only served for attachments, with ranges or offloaded."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.attachment = Attachment.objects.create(filename="notice.pdf", content_type="application/pdf")
+        self.attachment.file.save("notice.pdf", ContentFile(b"0123456789"))
+        self.url = self.attachment.file.url
+
+    def test_ranges(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), b"0123456789")
+        self.assertEqual((response['Accept-Ranges'], response['Cache-Control']), ('bytes', 'private, no-cache'))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b"234")
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(self.client.get(self.url, HTTP_RANGE='bytes=-3').streaming_content), b"789")
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=10-').status_code, 416)
+
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_access_control(self):
+        self.attachment.file.storage.save("attachments/orphan.pdf", ContentFile(b"orphan"))
+        self.assertEqual(self.client.get('/media/attachments/orphan.pdf').status_code, 404)
+        self.assertEqual(self.client.get(f'/media/thumbnails/{self.attachment.id}/sm.jpeg').status_code, 404)
+        with override_settings(MEDIA_LOGIN_REQUIRED=True):
+            self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    @override_settings(MEDIA_SERVING='x-accel-redirect', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_offloaded(self):
+        digest = '0' * 64
+        self.attachment.file.save(f"{digest}.pdf", ContentFile(b"0123456789"))
+        response = self.client.get(self.attachment.file.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/attachments/{digest}.pdf')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        self.client.force_login(User.objects.create_user('lea'))
+        with override_settings(MEDIA_LOGIN_REQUIRED=True):
+            response = self.client.get(self.attachment.file.url)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+
+    def test_download_name_is_quoted(self):
+        self.attachment.filename = 'devis "final" 2\\3.pdf'
+        self.attachment.save()
+        response = self.client.get(reverse('inventory:attachment_download', args=[self.attachment.id]))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="devis \\"final\\" 2\\\\3.pdf"')
+
+
+class ChunkedUploadTests(TestCase):
+    """Uploads are written chunk by chunk, hashed and deduplicated."""
+
+    data = b"%PDF-1.4 scanned invoice"
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.item = Item.objects.create(description="Scanner")
+
+    def start(self, item=None, **fields):
+        response = self.client.post('/api/uploads/', {
+            'filename': 'facture.pdf', 'size': len(self.data), 'item': (item or self.item).id, **fields
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, upload_id, first, last, total=None):
+        return self.client.put(f'/api/uploads/{upload_id}/chunk/', self.data[first:last + 1],
+                               content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {first}-{last}/{total or len(self.data)}')
+
+    def upload(self, item=None):
+        upload_id = self.start(item)
+        self.put(upload_id, 0, 9)
+        self.put(upload_id, 10, len(self.data) - 1)
+        return self.client.post(f'/api/uploads/{upload_id}/complete/')
+
+    def test_resumable_chunks(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, 9).json()['received'], 10)
+        conflict = self.put(upload_id, 15, len(self.data) - 1)
+        self.assertEqual((conflict.status_code, conflict.json()['received']), (409, 10))
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').json()['received'], 10)
+
+        self.put(upload_id, 10, len(self.data) - 1)
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+
+        attachment = Attachment.objects.get(pk=response.json()['id'])
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual((attachment.sha256, attachment.file.name), (digest, f'attachments/{digest}.pdf'))
+        with attachment.file.open('rb') as file:
+            self.assertEqual(file.read(), self.data)
+
+    def test_deduplication(self):
+        first = self.upload().json()['id']
+        again = self.upload()
+        self.assertEqual((again.status_code, again.json()['id']), (200, first))
+
+        other = self.upload(Item.objects.create(description="Imprimante"))
+        self.assertEqual(other.status_code, 201)
+        shared = Attachment.objects.filter(pk__in=[first, other.json()['id']]).values_list('file', flat=True)
+        self.assertEqual(len(set(shared)), 1)
+
+    def test_content_range_total(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, 9, total=len(self.data) + 1).status_code, 400)
+        self.assertEqual(self.put(upload_id, 0, 9, total='*').json()['received'], 10)
+
+    def test_truncated_chunk_is_not_written(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, 9)
+        with self.assertRaises(ValueError):
+            uploads.append_chunk(upload_id, 10, BytesIO(self.data[10:12]), len(self.data) - 10)
+        self.assertEqual(Upload.objects.get(pk=upload_id).received, 10)
+        self.put(upload_id, 10, len(self.data) - 1)
+        self.assertEqual(self.client.post(f'/api/uploads/{upload_id}/complete/').status_code, 201)
+
+    def test_declared_hash_is_checked(self):
+        upload_id = self.start(sha256='0' * 64)
+        self.put(upload_id, 0, len(self.data) - 1)
+        self.assertEqual(self.client.post(f'/api/uploads/{upload_id}/complete/').status_code, 400)
+
+
+class LabelBulkTests(TestCase):
+    """Bulk label operations take a fixed number of queries whatever the number of items."""
+
+    def post(self, url, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, content_type='application/json')
+        return response, len(queries)
+
+    def test_bulk_create_skips_existing_names(self):
+        Label.objects.create(name='red')
+        response, _ = self.post('/api/labels/bulk_create/', {'names': ['blue', ' red', 'blue', '', 'x' * 60]})
+        data = response.json()
+        self.assertEqual([label['name'] for label in data['created']], ['blue'])
+        self.assertEqual([label['name'] for label in data['existing']], ['red'])
+        self.assertEqual(len(data['errors']), 2)
+        self.assertEqual(Label.objects.count(), 2)
+
+    def test_add_and_remove_by_filter(self):
+        label = Label.objects.create(name='fragile')
+        lamps = [Item.objects.create(description=f"Glass lamp {n}") for n in range(3)]
+        Item.objects.create(description="Wooden chair")
+        version = Item.objects.get(pk=lamps[0].pk).cache_version
+
+        url = f'/api/labels/{label.pk}/add_to_items/'
+        response, _ = self.post(url, {'filter': {'search': 'lamp'}})
+        self.assertEqual(response.json()['affected_count'], 3)
+        self.assertEqual(response.json()['affected_items'], [item.pk for item in lamps])
+        self.assertEqual(set(label.items.values_list('pk', flat=True)), {item.pk for item in lamps})
+        # Search vectors and cached cards follow, as with item.labels.add
+        self.assertEqual(search(Item.objects.all(), 'fragile').count(), 3)
+        self.assertGreater(Item.objects.get(pk=lamps[0].pk).cache_version, version)
+
+        response, _ = self.post(url, {'item_ids': [item.pk for item in lamps]})
+        self.assertEqual(response.json()['affected_count'], 0)
+        self.assertEqual(response.json()['affected_items'], [])
+
+        response, _ = self.post(f'/api/labels/{label.pk}/remove_from_items/',
+                                {'filter': {'labels': [label.pk], 'search': 'lamp 1'}})
+        self.assertEqual(response.json()['affected_items'], [lamps[1].pk])
+        self.assertEqual(label.items.count(), 2)
+
+    def test_criteria_required(self):
+        label = Label.objects.create(name='fragile')
+        Item.objects.create(description="Lamp")
+        response, _ = self.post(f'/api/labels/{label.pk}/add_to_items/', {})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(label.items.exists())
+
+    def test_query_count_independent_of_item_count(self):
+        label = Label.objects.create(name='fragile')
+        url = f'/api/labels/{label.pk}/add_to_items/'
+        small = [Item.objects.create(description="Lamp").pk]
+        _, few = self.post(url, {'item_ids': small})
+        large = [Item.objects.create(description="Lamp").pk for _ in range(20)]
+        _, many = self.post(url, {'item_ids': large})
+        self.assertEqual(few, many)
+        self.assertEqual(label.items.count(), 21)
+
+    def test_label_section_query_count(self):
+        item = Item.objects.create(description="Lamp")
+        url = reverse('inventory:get_label_section', args=[item.pk])
+        for n in range(2):
+            item.labels.add(Label.objects.create(name=f"label {n}"))
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for n in range(2, 12):
+            item.labels.add(Label.objects.create(name=f"label {n}"))
+        Label.objects.create(name='unused')
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(few), len(many))
+        self.assertContains(response, 'unused')
+
+    def test_label_list_previews_items(self):
+        label = Label.objects.create(name='fragile')
+        items = [Item.objects.create(description=f"Lamp {n}") for n in range(7)]
+        label.items.add(*items)
+        Label.objects.create(name='empty')
+        response = self.client.get(reverse('inventory:label_list'))
+        self.assertContains(response, 'and 2 more')
+        self.assertContains(response, 'Lamp 4')
+        self.assertNotContains(response, 'Lamp 5')
+
+
+@override_settings(REQUEST_PROFILING=True)
+class RequestProfilingTests(TestCase):
+    """Requests report their SQL, template and AI timings when profiling is enabled."""
+
+    def setUp(self):
+        profiling.reset_endpoints()
+
+    def test_server_timing_and_log_line(self):
+        label = Label.objects.create(name='fragile')
+        label.items.add(Item.objects.create(description="Lamp"))
+        with self.assertLogs('inventory.profiling', 'INFO') as logs:
+            response = self.client.get(reverse('inventory:label_list'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries, 0 repeated"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['endpoint'], 'GET /labels/')
+        self.assertGreater(record['queries'], 0)
+        self.assertEqual(record['duplicate_queries'], {})
+
+    def test_fingerprint_groups_repeated_queries(self):
+        self.assertEqual(profiling.fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'a'"),
+                         profiling.fingerprint("SELECT * FROM t WHERE id = 22 AND name = 'b'"))
+        self.assertEqual(profiling.fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+                         profiling.fingerprint('SELECT * FROM t WHERE id IN (%s)'))
+
+    def test_summary_for_staff_only(self):
+        for _ in range(3):
+            self.client.get(reverse('inventory:label_list'))
+        url = reverse('inventory:profiling_summary') + '?format=json'
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        endpoints = self.client.get(url).json()['endpoints']
+        labels = next(row for row in endpoints if row['endpoint'] == 'GET /labels/')
+        self.assertEqual(labels['count'], 3)
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('inventory:label_list'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsTests(TestCase):
+    """Pipeline metrics are rendered in the Prometheus text format."""
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_ai_call_outcomes(self):
+        before = self.sample('inventory_ai_calls_total', service='text', outcome='error')
+        with self.assertRaises(ValueError):
+            with metrics.ai_call('text'):
+                raise ValueError("API down")
+        self.assertEqual(self.sample('inventory_ai_calls_total', service='text', outcome='error'), before + 1)
+        self.assertGreater(self.sample('inventory_ai_call_seconds_count', service='text'), 0)
+
+    def test_endpoint(self):
+        Email.objects.create(subject="Lamp", sender='a@example.com', recipients=[], body='',
+                             sent_at='2024-01-01T00:00:00Z')
+        Item.objects.create(description="Lamp")
+        self.client.get(reverse('inventory:item_list'))
+        before = self.sample('inventory_cache_requests_total', cache='item_card', result='hit')
+        self.client.get(reverse('inventory:item_list'))
+        self.assertEqual(self.sample('inventory_cache_requests_total', cache='item_card', result='hit'), before + 1)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertContains(response, 'inventory_records{counter="emails"} 1.0\n')
+        self.assertContains(response, 'inventory_cache_requests_total{cache="item_card",result="hit"}')
+
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_command_textfile(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with self.settings(METRICS_TEXTFILE_DIR=directory):
+            call_command('process_items', stdout=StringIO())
+        with open(f'{directory}/process_items.prom', encoding='utf-8') as textfile:
+            self.assertIn('# TYPE inventory_items_created_total counter\n', textfile.read())
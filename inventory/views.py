@@ -4,23 +4,53 @@ Includes both list and detail views with HTMX enhancements.
 """
 
 from logging import warning
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView, DetailView
 from django.views.decorators.http import require_http_methods
-from django.http import HttpResponse
-from django.db.models import Prefetch, Count, Subquery, OuterRef
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.db.models import Prefetch, Count, F, Window, prefetch_related_objects
+from django.db.models.functions import Lag, Lead, RowNumber
 from django.core.paginator import Paginator
-from django.db import transaction
-from django.db.models import Q
+from django.db import connections, transaction
 from django.core.management import call_command
 from django.http import JsonResponse
-
-from .models import AIImgdescription, AIdescription, Item, Email, Attachment, Label
+from django.utils.crypto import constant_time_compare
+
+from .conditional import attachment_validators, item_validators, not_modified, set_validators
+from .models import Item, Email, Attachment, Label
+from .pagination import InvalidCursor, KeysetPaginator, estimated_count
+from .services import counters, media
+from .services.fragments import ITEM_CARD_TEMPLATE, ITEM_PAGE_CARD_TEMPLATE, render_item_cards
+from .services.labels import attach_preview_items
+from .services.search import search
+from .services.thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_SIZES, ensure_thumbnails, thumbnail_url
+from .services.vision import IMAGE_DESCRIPTION_MODEL, IMAGE_DESCRIPTION_PROMPT
+from . import metrics, profiling
+
+# Items per infinite-scroll page of the item search
+SEARCH_PAGE_SIZE = 24
 
 # Base Views
 class BaseListView(ListView):
     """Base list view with common functionality."""
     paginate_by = 25
+    keyset_ordering = ('-created_at', '-id')
+
+    def get_keyset_ordering(self):
+        """Unique ordering pages are cut on, see inventory.pagination."""
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        """Paginate with ?cursor= on a keyset instead of ?page= offsets."""
+        paginator = KeysetPaginator(queryset, self.get_keyset_ordering(), per_page=page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Invalid cursor")
+        return paginator, page, page.object_list, page.has_next or page.has_previous
     
     def get_template_names(self):
         """Return appropriate template based on request type."""
@@ -43,6 +73,13 @@ class EmailListView(BaseListView):
     template_name = 'inventory/email_list.html'
     partial_template_name = 'inventory/partials/email_list.html'
     context_object_name = 'emails'
+    keyset_ordering = ('-sent_at', '-id')
+
+    def get_keyset_ordering(self):
+        """Search results are ordered by relevance first."""
+        if self.request.GET.get('search', '').strip():
+            return ('-relevance',) + self.keyset_ordering
+        return self.keyset_ordering
 
     def get_queryset(self):
         """Get emails with related data prefetched."""
@@ -53,27 +90,21 @@ class EmailListView(BaseListView):
                    )
                    .order_by('-sent_at'))
         
-        # Handle search if implemented
-        search = self.request.GET.get('search', '').strip()
-        if search:
-            queryset = queryset.filter(
-                Q(subject__icontains=search) |
-                Q(from_address__icontains=search) |
-                Q(body__icontains=search) |
-                Q(item__qr_codes__code__icontains=search) |
-                Q(item__labels__name__icontains=search) |
-                Q(attachments__name__icontains=search)
-            ).distinct()
+        # Full-text search on subject, sender and body
+        search_query = self.request.GET.get('search', '').strip()
+        if search_query:
+            queryset = search(queryset, search_query)
             
         return queryset
     
     def get_context_data(self, **kwargs):
         """Add additional context for email list."""
         context = super().get_context_data(**kwargs)
+        stats = counters.get_counters(counters.EMAILS, counters.EMAILS_WITH_ATTACHMENTS, counters.EMAILS_WITH_ITEMS)
         context.update({
-            'total_count': Email.objects.count(),
-            'with_attachments_count': Email.objects.filter(attachments__isnull=False).distinct().count(),
-            'with_items_count': Email.objects.filter(item__isnull=False).count(),
+            'total_count': stats[counters.EMAILS],
+            'with_attachments_count': stats[counters.EMAILS_WITH_ATTACHMENTS],
+            'with_items_count': stats[counters.EMAILS_WITH_ITEMS],
         })
         return context
 
@@ -84,43 +115,37 @@ class ItemListView(BaseListView):
     partial_template_name = 'inventory/partials/item_list.html'
     context_object_name = 'items'
 
+    def get_keyset_ordering(self):
+        """Search results are ordered by relevance first."""
+        if self.request.GET.get('q'):
+            return ('-relevance',) + self.keyset_ordering
+        return self.keyset_ordering
+
     def get_queryset(self):
         # Get base queryset of all items with prefetched related data
-        queryset = Item.objects.prefetch_related(
-            Prefetch('attachments'),
-            'labels',
-            'qr_codes',
-            'emails'
-        ).order_by('-created_at')  # Add default ordering by creation date, newest first
+        queryset = Item.objects.with_card_data(prefetch=False).order_by('-created_at')  # Add default ordering by creation date, newest first
         
         search_query = self.request.GET.get('q')
         
         if search_query:
-            # Filter items by multiple fields across related models
-            queryset = (queryset.filter(
-                Q(description__icontains=search_query) |
-                Q(attachments__ai_description__icontains=search_query) |
-                Q(qr_codes__code__icontains=search_query) |
-                Q(labels__name__icontains=search_query) |
-                Q(emails__subject__icontains=search_query) |
-                Q(emails__sender__icontains=search_query)
-            )
-            .select_related('attachments')
-            .distinct())
+            # Ranked full-text search over the item search document
+            queryset = search(queryset, search_query)
         
         return queryset
     
     def get_context_data(self, **kwargs):
         """Add labels to context for the dropdown and handle AI descriptions."""
         context = super().get_context_data(**kwargs)
-        context['all_labels'] = Label.objects.all().order_by('name')
+        context['all_labels'] = list(Label.objects.all().order_by('name'))
 
-        # Add AI description display handling
+        # Add AI description display handling, from the with_card_data annotation
         for item in context.get('object_list', []):
-            latest_ai_desc = item.item_ai_descriptions.order_by('-created_at').first()
-            item.truncated_description = latest_ai_desc.response[:150] if latest_ai_desc else ''
-            item.needs_generation = not bool(latest_ai_desc)
-    
+            item.truncated_description = (item.latest_ai_response or '')[:150]
+            item.needs_generation = item.latest_ai_response is None
+
+        # Cards are assembled from the fragment cache, rendered only when outdated
+        card_template = ITEM_CARD_TEMPLATE if self.request.headers.get('HX-Request') else ITEM_PAGE_CARD_TEMPLATE
+        render_item_cards(context.get('object_list', []), context['all_labels'], card_template)
         return context
     
 class LabelListView(BaseListView):
@@ -129,13 +154,17 @@ class LabelListView(BaseListView):
     template_name = 'inventory/label_list.html'
     partial_template_name = 'inventory/partials/label_list.html'
     context_object_name = 'labels'
+    keyset_ordering = ('name',)
 
     def get_queryset(self):
-        """Get labels with related items prefetched."""
-        return (Label.objects
-                .prefetch_related('items')
-                .annotate(item_count=Count('items'))
-                .order_by('name'))
+        """Get labels with their item count."""
+        return Label.objects.annotate(item_count=Count('items')).order_by('name')
+
+    def get_context_data(self, **kwargs):
+        """Name a few items of each label, without loading all of them."""
+        context = super().get_context_data(**kwargs)
+        attach_preview_items(context['labels'])
+        return context
 
 class AttachmentListView(BaseListView):
     """Display a filterable grid of attachments."""
@@ -148,7 +177,7 @@ class AttachmentListView(BaseListView):
     def get_queryset(self):
         """Get filtered attachments."""
         queryset = (Attachment.objects
-                   .select_related('item', 'email')
+                   .select_related('item', 'email', 'latest_ai_description')
                    .order_by('-created_at'))
         
         # Handle filtering
@@ -161,24 +190,23 @@ class AttachmentListView(BaseListView):
                                 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']
             )
         
-        # Handle search
-        search = self.request.GET.get('search', '').strip()
-        if search:
-            queryset = queryset.filter(filename__icontains=search)
+        # Handle search, substring match served by the filename trigram index
+        search_query = self.request.GET.get('search', '').strip()
+        if search_query:
+            queryset = queryset.filter(filename__icontains=search_query)
             
         return queryset
 
     def get_context_data(self, **kwargs):
         """Add filtering context."""
         context = super().get_context_data(**kwargs)
+        stats = counters.get_counters(counters.ATTACHMENTS, counters.IMAGE_ATTACHMENTS, counters.DOCUMENT_ATTACHMENTS)
         context.update({
             'current_type': self.request.GET.get('type', 'all'),
             'search_query': self.request.GET.get('search', ''),
-            'total_count': Attachment.objects.count(),
-            'image_count': Attachment.objects.filter(content_type__startswith='image/').count(),
-            'document_count': Attachment.objects.filter(
-                content_type__in=['application/pdf', 'application/msword']
-            ).count()
+            'total_count': stats[counters.ATTACHMENTS],
+            'image_count': stats[counters.IMAGE_ATTACHMENTS],
+            'document_count': stats[counters.DOCUMENT_ATTACHMENTS],
         })
         return context
 
@@ -221,39 +249,36 @@ class ItemDetailView(BaseDetailView):
     partial_template_name = 'inventory/partials/item_detail_modal.html'
     context_object_name = 'item'
 
+    def get(self, request, *args, **kwargs):
+        """Answer 304 without rendering while the item is unchanged."""
+        # Full pages embed a CSRF token tied to the cookie
+        validators = item_validators(self.kwargs['pk'], self.get_template_names()[0],
+                                     request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+        response = not_modified(request, validators) or super().get(request, *args, **kwargs)
+        return set_validators(response, validators, vary=('HX-Request',))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Get latest image descriptions
-        latest_descriptions = AIImgdescription.objects.filter(
-            attachment__item=self.object,
-            created_at=Subquery(
-                AIImgdescription.objects.filter(
-                    attachment=OuterRef('attachment')
-                ).order_by('-created_at').values('created_at')[:1]
-            )
-        )
+        # Latest descriptions, joined through the denormalized pointers
         context['latest_descriptions'] = {
-            desc.attachment_id: desc for desc in latest_descriptions
+            attachment.id: attachment.latest_ai_description
+            for attachment in self.object.attachments.all()
+            if attachment.latest_ai_description
         }
-        # Get latest text descriptions
-        latest_text_descriptions = AIdescription.objects.filter(
-            item=self.object,
-            created_at=Subquery(
-                AIdescription.objects.filter(
-                    item=OuterRef('item')
-                ).order_by('-created_at').values('created_at')[:1]
-            )
+        context['latest_text_descriptions'] = (
+            {self.object.id: self.object.latest_ai_description}
+            if self.object.latest_ai_description else {}
         )
-        context['latest_text_descriptions'] = {
-            desc.item_id: desc for desc in latest_text_descriptions
-        }
         return context
 
     def get_object(self):
         """Get item with related data prefetched."""
         return (Item.objects
-                .prefetch_related('labels', 'qr_codes', 
-                                'attachments', 'emails')
+                .select_related('latest_ai_description')
+                .prefetch_related('labels', 'qr_codes',
+                                  Prefetch('attachments',
+                                           queryset=Attachment.objects.select_related('latest_ai_description')),
+                                  'emails')
                 .get(pk=self.kwargs['pk']))
     
 @require_http_methods(["POST"])
@@ -277,48 +302,118 @@ def generate_listing(request, item_id):
         status=400
         )
 
+def image_position(images, attachment_id):
+    """
+    Neighbours and position of an image among `images`, ordered by id, in one query.
+
+    Returns:
+        tuple: (previous id, next id, 1-based position, total), None if the
+        image is not in the set
+    """
+    by_id = {'order_by': F('id').asc()}
+    windowed = (images
+                .order_by()
+                .annotate(prev_id=Window(Lag('id'), **by_id),
+                          next_id=Window(Lead('id'), **by_id),
+                          position=Window(RowNumber(), **by_id),
+                          total=Window(Count('id')))
+                .values('id', 'prev_id', 'next_id', 'position', 'total'))
+    # Window functions must see the whole set, the image is picked around them
+    sql, params = windowed.query.sql_with_params()
+    with connections[windowed.db].cursor() as cursor:
+        cursor.execute(
+            f"SELECT prev_id, next_id, position, total FROM ({sql}) AS images WHERE id = %s",
+            (*params, attachment_id)
+        )
+        return cursor.fetchone()
+
 # HTMX Handlers
 @require_http_methods(["GET"])
 def image_preview(request, attachment_id):
     """Show image preview in modal with navigation."""
-    attachment = get_object_or_404(Attachment, pk=attachment_id)
     source_type = request.GET.get('source_type')
     source_id = request.GET.get('source_id')
-    latest_ai_desc = attachment.attachment_ai_descriptions.order_by('-created_at').first()
-
-    if source_type == 'email' and source_id:
-        all_images = list(Attachment.objects.filter(
-            email_id=source_id,
-            content_type__startswith='image/'
-        ).order_by('id'))
-    elif source_type == 'item' and source_id:
-        all_images = list(Attachment.objects.filter(
-            item_id=source_id,
-            content_type__startswith='image/'
-        ).order_by('id'))
-    else:
-        all_images = [attachment]
-    
-    try:
-        current_index = all_images.index(attachment)
-        prev_image = all_images[current_index - 1] if current_index > 0 else None
-        next_image = all_images[current_index + 1] if current_index < len(all_images) - 1 else None
-    except ValueError:
-        prev_image = next_image = None
-    
+
+    position = None
+    if source_type in ('email', 'item') and source_id and source_id.isdigit():
+        images = Attachment.objects.filter(**{f"{source_type}_id": source_id}, content_type__startswith='image/')
+        position = image_position(images, attachment_id)
+    prev_id, next_id, current_index, total_images = position or (None, None, 1, 1)
+
+    # The image and its neighbours, whose thumbnails the modal prefetches
+    attachments = (Attachment.objects
+                   .select_related('latest_ai_description', 'item')
+                   .in_bulk([pk for pk in (attachment_id, prev_id, next_id) if pk]))
+    if attachment_id not in attachments:
+        raise Http404("No Attachment matches the given query.")
+    attachment = attachments[attachment_id]
+
     context = {
         'attachment': attachment,
-        'latest_description': latest_ai_desc,
-        'prev_image': prev_image,
-        'next_image': next_image,
+        'latest_description': attachment.latest_ai_description,
+        'prev_image': attachments.get(prev_id),
+        'next_image': attachments.get(next_id),
         'source_type': source_type,
         'source_id': source_id,
-        'current_index': current_index + 1,
-        'total_images': len(all_images)
+        'current_index': current_index,
+        'total_images': total_images
     }
     
     return render(request, 'inventory/partials/image_preview_modal.html', context)
 
+@require_http_methods(["GET"])
+def attachment_thumbnail(request, attachment_id, size, fmt):
+    """Generate an image's thumbnails on first request and redirect to the one asked for."""
+    if size not in THUMBNAIL_SIZES or fmt not in THUMBNAIL_FORMATS:
+        raise Http404("Unknown thumbnail")
+    attachment = get_object_or_404(Attachment, pk=attachment_id, content_type__startswith='image/')
+    if not attachment.has_valid_file:
+        raise Http404("No file")
+
+    if not attachment.has_thumbnails:
+        if ensure_thumbnails(attachment):
+            # Unreadable image, let the browser try the original
+            return redirect(attachment.file.url)
+        # Cached cards can now link the thumbnails directly
+        Item.objects.filter(pk=attachment.item_id).bump_cache_version()
+    return redirect(thumbnail_url(attachment.pk, size, fmt))
+
+@require_http_methods(["GET", "HEAD"])
+def attachment_download(request, attachment_id):
+    """Download an attachment's file, answering 304 while the client's copy is current."""
+    if not media.may_access(request):
+        raise PermissionDenied
+    validators = attachment_validators(attachment_id)
+    response = not_modified(request, validators)
+    if response is None:
+        attachment = get_object_or_404(Attachment, pk=attachment_id)
+        if not attachment.has_valid_file:
+            raise Http404("No file")
+        try:
+            response = media.file_response(request, attachment.file.name, attachment.content_type,
+                                           filename=attachment.filename, as_attachment=True,
+                                           etag=validators.etag)
+        except FileNotFoundError:
+            raise Http404("File missing from storage")
+    return set_validators(response, validators)
+
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    """
+    Files under MEDIA_URL: attachments and their thumbnails only, sent by
+    Django or the front web server depending on MEDIA_SERVING.
+    """
+    if not media.may_access(request):
+        raise PermissionDenied
+    if not media.is_known_file(path):
+        raise Http404("Unknown file")
+    try:
+        validators = media.stat_validators(path)
+        response = not_modified(request, validators) or media.file_response(request, path, etag=validators.etag)
+    except FileNotFoundError:
+        raise Http404("File missing from storage")
+    return set_validators(response, validators)
+
 @require_http_methods(["POST"])
 def create_label(request):
     """Create a new label and return updated labels list."""
@@ -329,16 +424,26 @@ def create_label(request):
     try:
         Label.objects.create(name=name)
         # Get updated labels with count
-        labels = (Label.objects
-                 .prefetch_related('items')
-                 .annotate(item_count=Count('items'))
-                 .order_by('name'))
+        labels = list(Label.objects.annotate(item_count=Count('items')).order_by('name'))
+        attach_preview_items(labels)
         
         return render(request, 'inventory/partials/label_list.html',
                      {'labels': labels})
     except Exception as e:
         return HttpResponse(str(e), status=400)
 
+def render_label_section(request, item):
+    """
+    Label section of an item in two queries: the item's labels are
+    prefetched once instead of re-read for every option of the dropdown.
+    """
+    prefetch_related_objects([item], 'labels')
+    context = {
+        'item': item,
+        'all_labels': Label.objects.only('id', 'name').order_by('name')
+    }
+    return render(request, 'inventory/partials/item_label_section.html', context)
+
 @require_http_methods(["POST"])
 def quick_create_label(request, item_id):
     """Create a new label and add it to an item."""
@@ -352,13 +457,7 @@ def quick_create_label(request, item_id):
             item = get_object_or_404(Item, pk=item_id)
             item.labels.add(label)
         
-        # Simplified context - no need for the HX-Trigger check
-        context = {
-            'item': item,
-            'all_labels': Label.objects.all().order_by('name')
-        }
-        
-        response = render(request, 'inventory/partials/item_label_section.html', context)
+        response = render_label_section(request, item)
         response['HX-Trigger'] = 'refreshLabels'  # Add this line
         return response
         
@@ -375,11 +474,7 @@ def add_label_to_item(request, item_id):
             label = get_object_or_404(Label, pk=label_id)
             item.labels.add(label)
             
-        context = {
-            'item': item,
-            'all_labels': Label.objects.all().order_by('name')
-        }
-        return render(request, 'inventory/partials/item_label_section.html', context)
+        return render_label_section(request, item)
     except Exception as e:
         return HttpResponse(str(e), status=400)
 
@@ -392,11 +487,7 @@ def remove_label_from_item(request, item_id, label_id):
             label = get_object_or_404(Label, pk=label_id)
             item.labels.remove(label)
         
-        context = {
-            'item': item,
-            'all_labels': Label.objects.all().order_by('name')
-        }
-        return render(request, 'inventory/partials/item_label_section.html', context)
+        return render_label_section(request, item)
     except Exception as e:
         return HttpResponse(str(e), status=400)
 
@@ -414,55 +505,52 @@ def delete_label(request, label_id):
 def get_label_section(request, item_id):
     """Get updated label section for an item."""
     item = get_object_or_404(Item, pk=item_id)
-    context = {
-        'item': item,
-        'all_labels': Label.objects.all().order_by('name')
-    }
-    return render(request, 'inventory/partials/item_label_section.html', context)
+    return render_label_section(request, item)
 
 @require_http_methods(["GET"])
 def search_items(request):
-    """Search items and return results."""
-    query = request.GET.get('q', '')
-    print(f"Search query: {query}")
-    
-    items = (Item.objects
-             .prefetch_related(
-                 'attachments__attachment_ai_descriptions',  # Follows Item -> Attachment -> AIdescription
-                 'labels',                      # Gets all labels for each item
-                 'qr_codes',                    # Gets all QR codes for each item
-                 'emails'                       # Gets all emails for each item
-             )
-             .filter(
-                 Q(description__icontains=query) |
-                 Q(ai_aggregated_description__icontains=query) | 
-                 Q(attachments__attachment_ai_descriptions__response__icontains=query) |
-                 Q(qr_codes__code__icontains=query) |
-                 Q(labels__name__icontains=query) |
-                 Q(emails__subject__icontains=query) |
-                 Q(emails__sender__icontains=query)
-             )
-             .distinct().order_by('-created_at'))
-    
-    print(f"SQL Query: {items.query}")
-    print(f"Results count: {items.count()}")
-    
-    return render(request, 'inventory/partials/item_list.html', 
-                 {'items': items, 'htmx': True})
+    """
+    Search items, one keyset page per request for infinite scrolling.
+    The first page also carries the result count, estimated for large sets.
+    """
+    query = request.GET.get('q', '').strip()
+    cursor = request.GET.get('cursor')
+
+    items = Item.objects.all()
+    ordering = ('-created_at', '-id')
+    if query:
+        items = search(items, query)
+        ordering = ('-relevance',) + ordering
+
+    paginator = KeysetPaginator(items.with_card_data(prefetch=False), ordering=ordering, per_page=SEARCH_PAGE_SIZE)
+    try:
+        page = paginator.page(cursor)
+    except InvalidCursor:
+        return HttpResponse("Invalid cursor", status=400)
+
+    all_labels = list(Label.objects.all().order_by('name'))
+    render_item_cards(page.object_list, all_labels)
+    context = {
+        'items': page.object_list,
+        'page': page,
+        'query': query,
+        'all_labels': all_labels,
+    }
+    if not cursor:
+        context['result_count'], context['count_is_estimate'] = estimated_count(items)
+    return render(request, 'inventory/partials/item_search_page.html', context)
 
 @require_http_methods(["GET"])
 def search_emails(request):
     """Search emails and return results in HTML format."""
     query = request.GET.get('q', '').strip()
     emails = (Email.objects
-             .filter(
-                 Q(subject__icontains=query) |
-                 Q(sender__icontains=query) |
-                 Q(body__icontains=query)
-             )
              .prefetch_related('attachments')
              .select_related('item')
-             .order_by('-sent_at')[:10])
+             .order_by('-sent_at'))
+    if query:
+        emails = search(emails, query)
+    emails = emails[:10]
     
     return render(request, 'inventory/partials/email_list.html', 
                  {'emails': emails})
@@ -517,8 +605,8 @@ def email_detail_modal(request, email_id):
 def refresh_ai_analysis(request, item_id):
     try:
         call_command('update_item_descriptions', str(item_id), force=True)
-        item = get_object_or_404(Item, pk=item_id)
-        latest_desc = item.item_ai_descriptions.order_by('-created_at').first()
+        item = get_object_or_404(Item.objects.select_related('latest_ai_description'), pk=item_id)
+        latest_desc = item.latest_ai_description
 
         return render(request, 'inventory/partials/ai_description.html', {
             'description': latest_desc.response if latest_desc else '',
@@ -544,7 +632,7 @@ def refresh_attachment_ai(request, attachment_id):
 def generate_image_description(request, attachment_id):
     attachment = get_object_or_404(Attachment, id=attachment_id)
     try:
-        response = attachment.query_vision_ai("pixtral-12b-2409", "Décris uniquement l'objet principal de cette image de manière factuelle (dimensions, couleurs, forme, matériau). Liste ensuite tous les textes et codes-barres visibles mot pour mot, sans interprétation. Ignore l'arrière-plan et toute personne présente dans l'image.")
+        response = attachment.query_vision_ai(IMAGE_DESCRIPTION_MODEL, IMAGE_DESCRIPTION_PROMPT)
         
         return render(request, 'inventory/partials/attachment_ai_description.html', {
             'description': response,
@@ -554,3 +642,26 @@ def generate_image_description(request, attachment_id):
         warning('error:' + str(e))
         return JsonResponse({'error': str(e)}, status=500)
 
+@staff_member_required
+@require_http_methods(["GET"])
+def profiling_summary(request):
+    """Slowest endpoints of this process, recorded by inventory.profiling; ?format=json for scripts."""
+    context = {
+        'enabled': settings.REQUEST_PROFILING,
+        'window': profiling.WINDOW,
+        'endpoints': profiling.slowest_endpoints(),
+    }
+    if request.GET.get('format') == 'json':
+        return JsonResponse(context)
+    return render(request, 'inventory/profiling_summary.html', context)
+
+@require_http_methods(["GET"])
+def metrics_endpoint(request):
+    """
+    Prometheus metrics of the web processes, with the table counters shared
+    by all processes. Requires `Authorization: Bearer <METRICS_TOKEN>` if set.
+    """
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse("Unauthorized", status=401)
+    return HttpResponse(metrics.scrape(), content_type=metrics.CONTENT_TYPE)